@@ -76,35 +76,122 @@ ORDER BY (date,env,namespace,deployment)
 TTL toDateTime(date) + toIntervalDay(365)
 SETTINGS index_granularity = 8192;
 
-CREATE TABLE IF NOT EXISTS kubedoor.k8s_pod_alert_days
+CREATE TABLE IF NOT EXISTS kubedoor.k8s_pod_alert_events
 (
+    ts DateTime64(6, 'Asia/Shanghai') DEFAULT now64(6, 'Asia/Shanghai'), -- 写入时间，用于取最新状态
     fingerprint String,
-    alert_status String,
+    alert_status String DEFAULT '',        -- 为空表示本行不改变告警状态
     send_resolved Bool DEFAULT true,
-    count_firing UInt32,
-    count_resolved Int32,
+    count_firing Int32 DEFAULT 0,          -- firing次数增量
+    count_resolved Int32 DEFAULT 0,        -- resolved次数增量（send_resolved为false的新告警为-1）
     start_time DateTime('Asia/Shanghai'),
     end_time Nullable(DateTime('Asia/Shanghai')) DEFAULT NULL,
-    severity String,
-    alert_group String,
-    alert_name String,
-    env String,
-    namespace String,
-    container String,
-    pod String,
-    description String,
-    operate String
+    severity String DEFAULT '',
+    alert_group String DEFAULT '',
+    alert_name String DEFAULT '',
+    env String DEFAULT '',
+    namespace String DEFAULT '',
+    container String DEFAULT '',
+    pod String DEFAULT '',
+    description String DEFAULT '',         -- 为空表示本行不改变描述
+    operate String DEFAULT ''              -- 为空表示本行不改变处理状态
 )
 ENGINE = MergeTree
 PARTITION BY toYYYYMMDD(start_time)
-PRIMARY KEY (start_time,
-  fingerprint,
-  severity,
-  env,
-  alert_group,
-  alert_name)
-TTL toDateTime(start_time) + toIntervalDay(365)
+ORDER BY (start_time, fingerprint)
+TTL toDateTime(start_time) + toIntervalDay(31)
+SETTINGS index_granularity = 8192;
+
+CREATE TABLE IF NOT EXISTS kubedoor.k8s_pod_alert_state
+(
+    day Date,
+    fingerprint String,
+    start_time SimpleAggregateFunction(min, DateTime('Asia/Shanghai')),
+    end_time SimpleAggregateFunction(max, Nullable(DateTime('Asia/Shanghai'))),
+    send_resolved SimpleAggregateFunction(min, Bool),
+    count_firing SimpleAggregateFunction(sum, Int64),
+    count_resolved SimpleAggregateFunction(sum, Int64),
+    alert_status AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    description AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    operate AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    severity SimpleAggregateFunction(max, String),
+    alert_group SimpleAggregateFunction(max, String),
+    alert_name SimpleAggregateFunction(max, String),
+    env SimpleAggregateFunction(max, String),
+    namespace SimpleAggregateFunction(max, String),
+    container SimpleAggregateFunction(max, String),
+    pod SimpleAggregateFunction(max, String)
+)
+ENGINE = AggregatingMergeTree
+PARTITION BY toYYYYMM(day)
+ORDER BY (day, fingerprint)
+TTL day + toIntervalDay(365)
 SETTINGS index_granularity = 8192;
+
+-- 空值的状态/描述/处理状态以最小时间参与argMax，不会覆盖已有值
+CREATE MATERIALIZED VIEW IF NOT EXISTS kubedoor.k8s_pod_alert_state_mv TO kubedoor.k8s_pod_alert_state AS
+SELECT
+    toDate(start_time) AS day,
+    fingerprint,
+    start_time,
+    end_time,
+    send_resolved,
+    toInt64(count_firing) AS count_firing,
+    toInt64(count_resolved) AS count_resolved,
+    argMaxState(alert_status, if(alert_status = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS alert_status,
+    argMaxState(description, if(description = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS description,
+    argMaxState(operate, if(operate = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS operate,
+    severity,
+    alert_group,
+    alert_name,
+    env,
+    namespace,
+    container,
+    pod
+FROM kubedoor.k8s_pod_alert_events
+GROUP BY day, fingerprint, start_time, end_time, send_resolved, count_firing, count_resolved,
+    severity, alert_group, alert_name, env, namespace, container, pod;
+
+CREATE VIEW IF NOT EXISTS kubedoor.k8s_pod_alert_days AS
+SELECT
+    fingerprint,
+    alert_status,
+    send_resolved,
+    count_firing,
+    count_resolved,
+    start_time,
+    end_time,
+    severity,
+    alert_group,
+    alert_name,
+    env,
+    namespace,
+    container,
+    pod,
+    description,
+    operate
+FROM
+(
+    SELECT
+        fingerprint,
+        argMaxMerge(alert_status) AS alert_status,
+        toBool(min(send_resolved)) AS send_resolved,
+        toUInt32(sum(count_firing)) AS count_firing,
+        toInt32(sum(count_resolved)) AS count_resolved,
+        min(start_time) AS start_time,
+        max(end_time) AS end_time,
+        max(severity) AS severity,
+        max(alert_group) AS alert_group,
+        max(alert_name) AS alert_name,
+        max(env) AS env,
+        max(namespace) AS namespace,
+        max(container) AS container,
+        max(pod) AS pod,
+        argMaxMerge(description) AS description,
+        argMaxMerge(operate) AS operate
+    FROM kubedoor.k8s_pod_alert_state
+    GROUP BY day, fingerprint
+);
 EOF
 
 cat <<-EOF > docker-compose.yaml
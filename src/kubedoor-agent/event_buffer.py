@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件离线缓冲
+与kubedoor-master断开期间将事件保存在有界内存环形缓冲中，可选溢出到本地磁盘，
+重新连接后按批次压缩、限速回放
+"""
+
+import os
+import json
+import time
+import zlib
+import asyncio
+from collections import deque
+from loguru import logger
+
+
+class EventBuffer:
+    """有界事件缓冲
+
+    特性:
+    - 内存缓冲满后最早的事件溢出到磁盘文件（未配置溢出目录或超过大小上限时丢弃并计数）
+    - 磁盘中的事件总是早于内存中的事件，回放时先读磁盘再读内存，保持发送顺序
+    - 发送失败的批次单独保留，下次回放最先发送，不放回内存缓冲，避免超出容量或排到已溢出的更新事件之后
+    - 回放的每个批次以zlib压缩后作为二进制WebSocket帧发送
+    """
+
+    OVERFLOW_FILE = 'events.jsonl'
+
+    def __init__(self, max_events, overflow_dir=None, overflow_max_bytes=0):
+        """初始化事件缓冲
+
+        Args:
+            max_events: 内存缓冲的最大事件数
+            overflow_dir: 溢出目录，为空则不溢出到磁盘
+            overflow_max_bytes: 溢出文件大小上限（字节）
+        """
+        self._ring = deque()
+        # 回放失败的批次，早于磁盘和内存缓冲中的所有事件
+        self._retry = []
+        self.max_events = max(1, max_events)
+        self.overflow_path = os.path.join(overflow_dir, self.OVERFLOW_FILE) if overflow_dir else None
+        self.overflow_max_bytes = overflow_max_bytes
+        self._overflow_offset = 0
+        self._overflow_bytes = 0
+        self.stats = {'buffered': 0, 'overflowed': 0, 'replayed': 0, 'dropped': 0, 'batches': 0}
+
+        if self.overflow_path:
+            os.makedirs(overflow_dir, exist_ok=True)
+            if os.path.exists(self.overflow_path):
+                self._overflow_bytes = os.path.getsize(self.overflow_path)
+                logger.warning(f"发现未回放的K8S事件溢出文件: {self.overflow_path} {self._overflow_bytes} 字节")
+
+    def __len__(self):
+        return len(self._ring)
+
+    def has_pending(self):
+        """是否有待回放的事件"""
+        return bool(self._retry) or bool(self._ring) or self._overflow_offset < self._overflow_bytes
+
+    def append(self, events):
+        """缓存一批事件，内存缓冲已满时将最早的事件溢出到磁盘"""
+        for event_data in events:
+            if len(self._ring) >= self.max_events:
+                self._spill(self._ring.popleft())
+            self._ring.append(event_data)
+            self.stats['buffered'] += 1
+
+    def _spill(self, event_data):
+        """将一条事件写入溢出文件，失败时丢弃"""
+        if self.overflow_path:
+            line = (json.dumps(event_data, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+            if self._overflow_bytes + len(line) <= self.overflow_max_bytes:
+                try:
+                    with open(self.overflow_path, 'ab') as f:
+                        f.write(line)
+                    self._overflow_bytes += len(line)
+                    self.stats['overflowed'] += 1
+                    return
+                except OSError as e:
+                    logger.error(f"写入K8S事件溢出文件失败: {e}")
+        self.stats['dropped'] += 1
+        if self.stats['dropped'] % 1000 == 1:
+            logger.error(f"K8S事件离线缓冲已满，已丢弃 {self.stats['dropped']} 条事件")
+
+    def _take(self, batch_size):
+        """取出最早的一批事件（先上次发送失败的批次，再磁盘，最后内存）"""
+        if self._retry:
+            batch, self._retry = self._retry, []
+            return batch
+        batch = []
+        if self.overflow_path and self._overflow_offset < self._overflow_bytes:
+            with open(self.overflow_path, 'rb') as f:
+                f.seek(self._overflow_offset)
+                while len(batch) < batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    self._overflow_offset += len(line)
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"跳过损坏的K8S事件溢出记录: {line[:100]}")
+            if self._overflow_offset >= self._overflow_bytes:
+                os.remove(self.overflow_path)
+                self._overflow_offset = self._overflow_bytes = 0
+        while self._ring and len(batch) < batch_size:
+            batch.append(self._ring.popleft())
+        return batch
+
+    async def replay(self, ws_conn, batch_size, max_rate):
+        """将缓冲的事件按批次压缩后限速发送
+
+        Args:
+            ws_conn: 已建立的WebSocket连接
+            batch_size: 每批事件数
+            max_rate: 回放速率上限（条/秒），<=0表示不限速
+
+        Returns:
+            int: 本次回放的事件数
+        """
+        started = time.monotonic()
+        replayed = 0
+        while self.has_pending() and not ws_conn.closed:
+            batch = self._take(batch_size)
+            if not batch:
+                continue
+            message = {"type": "k8s_event_batch", "data": batch, "replay": True, "dropped": self.stats['dropped']}
+            payload = zlib.compress(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+            sent = False
+            try:
+                await ws_conn.send_bytes(payload)
+                sent = True
+            except Exception as e:
+                logger.error(f"回放K8S事件失败，剩余事件等待下次回放: {e}")
+                break
+            finally:
+                # 发送失败或回放被取消时，保留已取出的批次，下次回放最先发送
+                if not sent:
+                    self._retry = batch
+            replayed += len(batch)
+            self.stats['replayed'] += len(batch)
+            self.stats['batches'] += 1
+            if max_rate > 0:
+                ahead = replayed / max_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        if replayed:
+            logger.info(f"K8S事件离线缓冲回放完成: {replayed} 条, 累计丢弃 {self.stats['dropped']} 条")
+        return replayed
+
+    def get_stats(self):
+        """获取缓冲统计信息，随心跳上报给master"""
+        return dict(
+            self.stats,
+            pending_memory=len(self._ring) + len(self._retry),
+            pending_overflow_bytes=self._overflow_bytes - self._overflow_offset,
+        )
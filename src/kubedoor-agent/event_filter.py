@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件源头预过滤
+执行kubedoor-master下发的编译后忽略规则和Normal事件采样策略，命中的事件不再发送到master
+"""
+
+import zlib
+from loguru import logger
+
+
+class EventFilter:
+    """K8S事件预过滤器，未收到master下发的配置时放行所有事件"""
+
+    def __init__(self):
+        self.version = None
+        self.ignore_rules = []
+        self.store_normal_events = True
+        self.normal_sample_rate = 1.0
+        self.stats = {'passed': 0, 'dropped_ignored': 0, 'dropped_normal': 0, 'rules': {}}
+
+    def update(self, filter_config):
+        """应用master下发的过滤配置"""
+        self.ignore_rules = filter_config.get('ignore_rules', [])
+        self.store_normal_events = filter_config.get('store_normal_events', True)
+        self.normal_sample_rate = filter_config.get('normal_sample_rate', 1.0)
+        self.version = filter_config.get('version')
+        logger.info(
+            f"K8S事件预过滤配置已更新: version={self.version} 忽略规则 {len(self.ignore_rules)} 条 "
+            f"存储Normal事件={self.store_normal_events} 采样率={self.normal_sample_rate}"
+        )
+
+    def check(self, event_data):
+        """判断事件是否需要发送到master
+
+        Returns:
+            bool: True表示发送，False表示丢弃
+        """
+        for rule in self.ignore_rules:
+            if all(self._match_condition(event_data, condition) for condition in rule['conditions']):
+                self.stats['dropped_ignored'] += 1
+                self.stats['rules'][rule['name']] = self.stats['rules'].get(rule['name'], 0) + 1
+                return False
+
+        if event_data.get('level') == 'Normal' and not self._keep_normal(event_data):
+            self.stats['dropped_normal'] += 1
+            return False
+
+        self.stats['passed'] += 1
+        return True
+
+    def _keep_normal(self, event_data):
+        """Normal事件按eventUid哈希采样，同一事件的后续更新结果一致"""
+        if not self.store_normal_events:
+            return False
+        if self.normal_sample_rate >= 1:
+            return True
+        bucket = zlib.crc32(str(event_data.get('eventUid', '')).encode('utf-8')) % 10000
+        return bucket < self.normal_sample_rate * 10000
+
+    @staticmethod
+    def _match_condition(event_data, condition):
+        """检查单个编译后的字段条件，语义与master的AlertRuleMatcher一致"""
+        op = condition['op']
+        values = condition['values']
+        field_value = event_data.get(condition['field'])
+        if field_value is None:
+            return op in ('not_contains', 'not_starts_with', 'not_ends_with')
+
+        if op in ('greater_than', 'less_than', 'greater_equal', 'less_equal'):
+            try:
+                field_num = int(field_value)
+            except (ValueError, TypeError):
+                return False
+            return {
+                'greater_than': field_num > values[0],
+                'less_than': field_num < values[0],
+                'greater_equal': field_num >= values[0],
+                'less_equal': field_num <= values[0],
+            }[op]
+
+        field_str = str(field_value).lower()
+        if op == 'contains':
+            return any(value in field_str for value in values)
+        if op == 'not_contains':
+            return not any(value in field_str for value in values)
+        if op == 'starts_with':
+            return field_str.startswith(tuple(values))
+        if op == 'not_starts_with':
+            return not field_str.startswith(tuple(values))
+        if op == 'ends_with':
+            return field_str.endswith(tuple(values))
+        if op == 'not_ends_with':
+            return not field_str.endswith(tuple(values))
+        if op == 'equals':
+            return field_str == values[0]
+        if op == 'not_equals':
+            return field_str != values[0]
+        return True
+
+    def get_stats(self):
+        """获取过滤统计信息，随心跳上报给master"""
+        return dict(self.stats, version=self.version)
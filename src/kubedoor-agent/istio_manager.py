@@ -7,6 +7,15 @@ from kubernetes_asyncio.client.exceptions import ApiException
 logger = logging.getLogger(__name__)
 
 
+def normalize_spec(value):
+    """去掉值为None的字段，便于比较期望配置和集群中的实际配置"""
+    if isinstance(value, dict):
+        return {k: normalize_spec(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [normalize_spec(v) for v in value]
+    return value
+
+
 async def get_virtualservice(custom_objects_api, request):
     """
     GET接口：获取所有VirtualService列表
@@ -51,8 +60,9 @@ async def apply_virtualservice(custom_objects_api, request):
     POST接口：创建或更新VirtualService
     参数：
     - custom_objects_api: Kubernetes CustomObjectsApi客户端
-    - request: HTTP请求对象，body中包含VirtualService的JSON配置
-    返回：操作结果
+    - request: HTTP请求对象，body中包含VirtualService的JSON配置；
+      先与集群中的实际spec比较，一致时跳过更新，查询参数force=true时总是应用
+    返回：操作结果，operation为 unchanged/applied/created/updated
     """
     try:
         # VirtualService的API信息
@@ -74,6 +84,31 @@ async def apply_virtualservice(custom_objects_api, request):
         if not name:
             return web.json_response({"error": "缺少 metadata.name 字段"}, status=400)
 
+        # 先获取集群中的实际配置，spec一致时不再提交patch
+        live_vs = None
+        if request.query.get('force') != 'true':
+            try:
+                live_vs = await custom_objects_api.get_namespaced_custom_object(
+                    group=group, version=version, namespace=namespace, plural=plural, name=name
+                )
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+        if live_vs and normalize_spec(live_vs.get('spec', {})) == normalize_spec(body['spec']):
+            logger.info(f"VirtualService未变化，跳过更新: {namespace}/{name}")
+            return web.json_response(
+                {
+                    "success": True,
+                    "message": f"VirtualService {name} unchanged",
+                    "operation": "unchanged",
+                    "data": {
+                        "name": name,
+                        "namespace": namespace,
+                        "resourceVersion": live_vs.get('metadata', {}).get('resourceVersion'),
+                    },
+                }
+            )
+
         # 尝试使用Server-Side Apply (类似kubectl apply)
         try:
             # 确保metadata中有必要的字段用于Server-Side Apply
@@ -154,6 +189,7 @@ async def apply_virtualservice(custom_objects_api, request):
             {
                 "success": True,
                 "message": f"VirtualService {name} {operation} successfully",
+                "operation": operation,
                 "data": result_data,
             }
         )
@@ -6,12 +6,27 @@ K8S事件实时监控模块
 """
 
 import asyncio
+import functools
 import json
 from datetime import datetime
 from kubernetes_asyncio import client, watch
 from kubernetes_asyncio.client.rest import ApiException
 from loguru import logger
-from utils import PROM_K8S_TAG_VALUE, MSG_TOKEN
+from event_filter import EventFilter
+from event_buffer import EventBuffer
+from utils import (
+    PROM_K8S_TAG_VALUE,
+    MSG_TOKEN,
+    EVENT_BATCH_WINDOW,
+    EVENT_BATCH_MAX_SIZE,
+    EVENT_WATCH_TIMEOUT,
+    EVENT_LIST_PAGE_SIZE,
+    EVENT_BUFFER_SIZE,
+    EVENT_BUFFER_OVERFLOW_DIR,
+    EVENT_BUFFER_OVERFLOW_MB,
+    EVENT_REPLAY_BATCH_SIZE,
+    EVENT_REPLAY_RATE,
+)
 
 
 class K8sEventMonitor:
@@ -21,13 +36,50 @@ class K8sEventMonitor:
         self.core_v1 = core_v1_api
         self.ws_conn = None
         self.monitor_task = None
+        self.flush_task = None
         self.is_running = False
+        # 合并窗口内待发送的事件 {eventUid: event_data}，同一eventUid只保留最后一次状态
+        self._pending = {}
+        self._coalesced = 0
+        self.stats = {'received': 0, 'sent': 0, 'coalesced': 0, 'batches': 0}
+        self.event_filter = EventFilter()
+        self.event_buffer = EventBuffer(
+            EVENT_BUFFER_SIZE, EVENT_BUFFER_OVERFLOW_DIR, EVENT_BUFFER_OVERFLOW_MB * 1024 * 1024
+        )
+        self.replay_task = None
+        # 续传watch使用的resourceVersion，None表示需要重新list
+        self.resource_version = None
+        # 已发送过的事件 {eventUid: resourceVersion}，重新list时用于差异比对
+        self._known_events = {}
 
     def set_websocket_connection(self, ws_conn):
-        """设置WebSocket连接"""
+        """设置WebSocket连接，连接建立后回放断开期间缓冲的事件"""
         self.ws_conn = ws_conn
+        if self.replay_task and not self.replay_task.done():
+            self.replay_task.cancel()
+        self.replay_task = None
+        self._ensure_replay()
+
+    def _ensure_replay(self):
+        """连接可用且有缓冲事件时启动回放；连接正常但发送失败写入缓冲的事件也由这里回放"""
+        if self.ws_conn is None or self.ws_conn.closed or not self.event_buffer.has_pending():
+            return
+        if self.replay_task is None or self.replay_task.done():
+            self.replay_task = asyncio.create_task(self.replay_buffer())
 
+    def _can_send(self):
+        """连接可用且没有待回放的缓冲事件时直接发送，否则进入缓冲保证发送顺序"""
+        return self.ws_conn is not None and not self.ws_conn.closed and not self.event_buffer.has_pending()
 
+    async def replay_buffer(self):
+        """按批次压缩、限速回放离线缓冲中的事件"""
+        logger.info(f"开始回放K8S事件离线缓冲: {self.event_buffer.get_stats()}")
+        try:
+            await self.event_buffer.replay(self.ws_conn, EVENT_REPLAY_BATCH_SIZE, EVENT_REPLAY_RATE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"回放K8S事件离线缓冲失败: {e}")
 
     def format_event_data(self, event):
         """格式化事件数据为指定的JSON格式"""
@@ -88,8 +140,10 @@ class K8sEventMonitor:
 
     async def send_event_to_master(self, event_data):
         """通过WebSocket发送事件数据到kubedoor-master"""
-        if not self.ws_conn:
-            logger.warning("WebSocket连接未建立，无法发送事件")
+        if not self._can_send():
+            logger.debug("WebSocket连接未建立或正在回放，事件写入离线缓冲")
+            self.event_buffer.append([event_data])
+            self._ensure_replay()
             return
 
         try:
@@ -100,53 +154,197 @@ class K8sEventMonitor:
             logger.debug(f"事件已发送: {event_data['kind']}/{event_data['name']} - {event_data['reason']}")
 
         except Exception as e:
-            logger.error(f"发送事件到master失败: {e}")
+            logger.error(f"发送事件到master失败，写入离线缓冲: {e}")
+            self.event_buffer.append([event_data])
+            self._ensure_replay()
+
+    async def enqueue_event(self, event_data):
+        """将事件放入合并窗口，同一eventUid的MODIFIED事件只保留最新一条，未开启合并时直接发送"""
+        self.stats['received'] += 1
+        if EVENT_BATCH_WINDOW <= 0:
+            await self.send_event_to_master(event_data)
+            self.stats['sent'] += 1
+            return
 
-    async def monitor_events(self, namespace=None):
-        """监控K8S事件"""
-        try:
-            logger.info("🚀 开始监控K8S事件...")
-            logger.info(f"📍 监控范围: {'所有命名空间' if not namespace else f'命名空间 {namespace}'}")
+        event_uid = event_data['eventUid']
+        if event_uid in self._pending:
+            self._coalesced += 1
+        self._pending[event_uid] = event_data
+        if len(self._pending) >= EVENT_BATCH_MAX_SIZE:
+            await self.flush_events()
 
-            # 创建事件监听器
-            w = watch.Watch()
+    async def flush_events(self):
+        """将合并窗口内的事件作为一条k8s_event_batch消息发送到kubedoor-master"""
+        if not self._pending:
+            return
+        events = list(self._pending.values())
+        coalesced = self._coalesced
+        self._pending = {}
+        self._coalesced = 0
+
+        if not self._can_send():
+            logger.debug(f"WebSocket连接未建立或正在回放，{len(events)} 条事件写入离线缓冲")
+            self.event_buffer.append(events)
+            self._ensure_replay()
+            return
 
-            # 开始监听事件
-            if namespace:
-                stream = w.stream(self.core_v1.list_namespaced_event, namespace=namespace)
-            else:
-                stream = w.stream(self.core_v1.list_event_for_all_namespaces)
+        try:
+            ws_message = {
+                "type": "k8s_event_batch",
+                "data": events,
+                "coalesced": coalesced,
+                "timestamp": datetime.now().isoformat(),
+            }
+            await self.ws_conn.send_json(ws_message)
+            self.stats['sent'] += len(events)
+            self.stats['coalesced'] += coalesced
+            self.stats['batches'] += 1
+            logger.debug(f"批量事件已发送: {len(events)} 条，合并 {coalesced} 条")
+        except Exception as e:
+            logger.error(f"批量发送事件到master失败，写入离线缓冲: {e}")
+            self.event_buffer.append(events)
+            self._ensure_replay()
 
+    async def flush_loop(self):
+        """按合并窗口定期发送事件"""
+        try:
+            while self.is_running:
+                await asyncio.sleep(EVENT_BATCH_WINDOW)
+                await self.flush_events()
+                # 回放失败后停止的缓冲，在连接仍可用时定期重新回放
+                self._ensure_replay()
+        except asyncio.CancelledError:
+            pass
+
+    def _list_func(self, namespace=None):
+        """获取事件list/watch使用的API函数"""
+        if namespace:
+            return functools.partial(self.core_v1.list_namespaced_event, namespace)
+        return self.core_v1.list_event_for_all_namespaces
+
+    async def handle_event(self, event_type, raw_object):
+        """处理单个事件：更新已知事件版本，过滤后放入合并窗口"""
+        metadata = raw_object.get('metadata', {})
+        event_uid = metadata.get('uid', '')
+        if event_type == 'DELETED':
+            self._known_events.pop(event_uid, None)
+        else:
+            self._known_events[event_uid] = metadata.get('resourceVersion')
+
+        try:
+            # 格式化事件数据
+            event_data = self.format_event_data({'type': event_type, 'raw_object': raw_object})
+            if not event_data:
+                return
+
+            # 丢弃命中master下发的忽略规则或Normal采样策略的事件
+            if not self.event_filter.check(event_data):
+                logger.debug(f"事件已在源头过滤: {event_data['kind']}/{event_data['name']} - {event_data['reason']}")
+                return
+
+            # 放入合并窗口，由flush_loop批量发送到master
+            await self.enqueue_event(event_data)
+
+            # 记录事件日志
+            logger.info(
+                f"📨 [{event_data['eventStatus']}] {event_data['level']} - "
+                f"{event_data['kind']}/{event_data['name']} - {event_data['reason']} - "
+                f"首次: {event_data['firstTimestamp']} 最后: {event_data['lastTimestamp']}"
+            )
+        except Exception as e:
+            logger.error(f"处理事件时出错: {e}")
+
+    async def relist_events(self, namespace=None):
+        """分页list当前所有事件，与已知事件比对后只发送新增和变化的事件，并记录续传用的resourceVersion
+
+        已知事件中不存在于list结果的（watch中断期间被删除），只从本地记录移除，不补发DELETED
+        """
+        list_func = self._list_func(namespace)
+        items = {}
+        continue_token = None
+        while True:
+            kwargs = {'limit': EVENT_LIST_PAGE_SIZE, '_preload_content': False}
+            if continue_token:
+                kwargs['_continue'] = continue_token
+            resp = await list_func(**kwargs)
+            data = json.loads(await resp.read())
+            for item in data.get('items', []):
+                items[item.get('metadata', {}).get('uid', '')] = item
+            continue_token = data.get('metadata', {}).get('continue')
+            if not continue_token:
+                break
+        list_resource_version = data.get('metadata', {}).get('resourceVersion')
+
+        added = modified = 0
+        for event_uid, item in items.items():
+            known_version = self._known_events.get(event_uid)
+            if known_version is None:
+                added += 1
+                await self.handle_event('ADDED', item)
+            elif known_version != item.get('metadata', {}).get('resourceVersion'):
+                modified += 1
+                await self.handle_event('MODIFIED', item)
+        removed = [event_uid for event_uid in self._known_events if event_uid not in items]
+        for event_uid in removed:
+            del self._known_events[event_uid]
+
+        self.resource_version = list_resource_version
+        logger.info(
+            f"📋 事件list完成: 共 {len(items)} 条，新增 {added} 条，变化 {modified} 条，已删除 {len(removed)} 条，"
+            f"resourceVersion={self.resource_version}"
+        )
+
+    async def watch_events(self, namespace=None):
+        """从已记录的resourceVersion开始watch，服务端超时后正常返回，由调用方继续续传"""
+        async with watch.Watch() as w:
+            stream = w.stream(
+                self._list_func(namespace),
+                resource_version=self.resource_version,
+                allow_watch_bookmarks=True,
+                timeout_seconds=EVENT_WATCH_TIMEOUT,
+            )
             async for event in stream:
                 if not self.is_running:
                     logger.info("事件监控已停止")
                     break
+                # BOOKMARK只用于推进resourceVersion，不是实际事件
+                self.resource_version = w.resource_version or self.resource_version
+                if event['type'] == 'BOOKMARK':
+                    continue
+                await self.handle_event(event['type'], event['raw_object'])
 
+    async def monitor_events(self, namespace=None):
+        """监控K8S事件
+
+        首次启动时分页list全部事件，之后从最后的resourceVersion续传watch（开启bookmark），
+        watch超时或异常断开后续传不会重放已发送的事件；resourceVersion过期(410 Gone)时重新list并做差异比对
+        """
+        logger.info("🚀 开始监控K8S事件...")
+        logger.info(f"📍 监控范围: {'所有命名空间' if not namespace else f'命名空间 {namespace}'}")
+        retry_delay = 1
+        try:
+            while self.is_running:
                 try:
-                    # 格式化事件数据
-                    event_data = self.format_event_data(event)
-
-                    if event_data:
-                        # 发送事件到master
-                        await self.send_event_to_master(event_data)
-
-                        # 记录事件日志
-                        logger.info(
-                            f"📨 [{event_data['eventStatus']}] {event_data['level']} - "
-                            f"{event_data['kind']}/{event_data['name']} - {event_data['reason']} - "
-                            f"首次: {event_data['firstTimestamp']} 最后: {event_data['lastTimestamp']}"
-                        )
-
-                except Exception as e:
-                    logger.error(f"处理事件时出错: {e}")
+                    if self.resource_version is None:
+                        await self.relist_events(namespace)
+                    await self.watch_events(namespace)
+                    retry_delay = 1
                     continue
-
+                except ApiException as e:
+                    if e.status == 410:
+                        logger.warning(f"⚠️ resourceVersion {self.resource_version} 已过期，重新list事件")
+                        self.resource_version = None
+                        continue
+                    logger.error(f"❌ K8S API错误: {e}")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ 监控过程中出错: {e}")
+                logger.info(f"{retry_delay}秒后从resourceVersion={self.resource_version}继续监听事件")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
         except asyncio.CancelledError:
             logger.info("⏹️ 事件监控被取消")
-        except ApiException as e:
-            logger.error(f"❌ K8S API错误: {e}")
-        except Exception as e:
-            logger.error(f"❌ 监控过程中出错: {e}")
         finally:
             self.is_running = False
 
@@ -158,6 +356,8 @@ class K8sEventMonitor:
 
         self.is_running = True
         self.monitor_task = asyncio.create_task(self.monitor_events(namespace))
+        if EVENT_BATCH_WINDOW > 0:
+            self.flush_task = asyncio.create_task(self.flush_loop())
         logger.info("K8S事件监控已启动")
 
     async def stop_monitoring(self):
@@ -175,4 +375,9 @@ class K8sEventMonitor:
             except asyncio.CancelledError:
                 pass
 
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush_events()
+
         logger.info("K8S事件监控已停止")
@@ -169,6 +169,9 @@ async def process_request(ws: ClientWebSocketResponse):
                 logger.info(f"开始Pod日志流: {connection_id}")
                 task = asyncio.create_task(stream_pod_logs(ws, connection_id, namespace, pod_name, container))
                 pod_logs_tasks[connection_id] = task
+            elif data.get("type") == "event_filter":
+                # master下发的K8S事件预过滤配置
+                event_monitor.event_filter.update(data.get("filter", {}))
             elif data.get("type") == "stop_pod_logs":
                 # 停止Pod日志流
                 connection_id = data.get("connection_id")
@@ -184,7 +187,13 @@ async def heartbeat(ws: ClientWebSocketResponse):
     """定期发送心跳"""
     while True:
         try:
-            await ws.send_json({"type": "heartbeat"})
+            await ws.send_json(
+                {
+                    "type": "heartbeat",
+                    "event_filter_stats": event_monitor.event_filter.get_stats(),
+                    "event_buffer_stats": event_monitor.event_buffer.get_stats(),
+                }
+            )
             logger.debug("成功发送心跳")
             await asyncio.sleep(4)
         except Exception as e:
@@ -1,8 +1,7 @@
 import os
 import sys
-import json
-import requests
 from loguru import logger
+import notifier
 
 
 NODE_LABLE_VALUE = "kubedoor-scheduler"
@@ -19,9 +18,29 @@ logger.add(
 
 MSG_TOKEN = os.environ.get('MSG_TOKEN')
 MSG_TYPE = os.environ.get('MSG_TYPE')
+# IM通知队列容量（条）、合并窗口（秒）及失败重试次数
+NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', 1000))
+NOTIFY_COALESCE_WINDOW = float(os.environ.get('NOTIFY_COALESCE_WINDOW', 2))
+NOTIFY_RETRY = int(os.environ.get('NOTIFY_RETRY', 3))
 KUBEDOOR_MASTER = os.environ.get('KUBEDOOR_MASTER')
 PROM_K8S_TAG_VALUE = os.environ.get('PROM_K8S_TAG_VALUE')
 OSS_URL = os.environ.get('OSS_URL')
+# K8S事件合并发送窗口（秒），窗口内同一eventUid只发送最后一次状态，<=0表示逐条发送
+EVENT_BATCH_WINDOW = float(os.environ.get('EVENT_BATCH_WINDOW', 1))
+# 单个批量消息的最大事件数，达到后立即发送
+EVENT_BATCH_MAX_SIZE = int(os.environ.get('EVENT_BATCH_MAX_SIZE', 500))
+# 单次事件watch的服务端超时（秒），超时后从最后的resourceVersion续传
+EVENT_WATCH_TIMEOUT = int(os.environ.get('EVENT_WATCH_TIMEOUT', 300))
+# 重新list事件时的分页大小
+EVENT_LIST_PAGE_SIZE = int(os.environ.get('EVENT_LIST_PAGE_SIZE', 500))
+# 与master断开期间内存中缓冲的最大事件数
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', 20000))
+# 内存缓冲满后的磁盘溢出目录，为空则直接丢弃
+EVENT_BUFFER_OVERFLOW_DIR = os.environ.get('EVENT_BUFFER_OVERFLOW_DIR', '')
+EVENT_BUFFER_OVERFLOW_MB = int(os.environ.get('EVENT_BUFFER_OVERFLOW_MB', 200))
+# 重新连接后回放的批大小和速率上限（条/秒）
+EVENT_REPLAY_BATCH_SIZE = int(os.environ.get('EVENT_REPLAY_BATCH_SIZE', 500))
+EVENT_REPLAY_RATE = int(os.environ.get('EVENT_REPLAY_RATE', 2000))
 BASE64CA = 'LS0tLS1CRUdJTiBDRVJUSUZJQ0FURS0tLS0tCk1JSURJVENDQWdtZ0F3SUJBZ0lKQUk1T3cvQnRxSEJpTUEwR0NTcUdTSWIzRFFFQkN3VUFNQ1l4SkRBaUJnTlYKQkFNTUcydDFZbVZrYjI5eUxXRm5aVzUwTG10MVltVmtiMjl5TG5OMll6QWdGdzB5TlRBek1UQXdNekkwTXpsYQpHQTh5TVRJMU1ESXhOREF6TWpRek9Wb3dKakVrTUNJR0ExVUVBd3diYTNWaVpXUnZiM0l0WVdkbGJuUXVhM1ZpClpXUnZiM0l1YzNaak1JSUJJakFOQmdrcWhraUc5dzBCQVFFRkFBT0NBUThBTUlJQkNnS0NBUUVBdmNzcWdCb3YKZFpqcGxXN1RTOHFpSnFoTFZuNXZ4VTdrWjdiQkUrVmdDNDYyUHJKblRGTjlDOC90bXIrSE43UUppYnBsVkEwQQp6MUZNalFjdk8zR2NieWJvMXo2b0thSm11MUlnZGxrMWNzYThJMlF3Ny9PZHQzZS9McG9oeGJpa0lkS3M3Nmd4CnI1WkRpRlYxVTllUzEzZmlWZE0zLzhjdjBqKzh6aEZyRndRaUp5ZTRZbWFOZFBTRlAxbVJuNWJ6MG8zTmUvU1oKcDB4dm1NY0xVMUFjOHNqUW1PRExoMTVYRjQ1dWU5LzQ2NzZCWjRQSTFZMWZnWHZHdzRDTFBaZzlEOCtjcndXVwo1bWhZV2U3TVVkeDF1cW5uMEtjRjc3dEI3WXIvOEczT2k3SlNaZitoYitQWVJYeDBVakU3OEUwOXNXc0VlY0tFCjVUNVU4K2MyOUZlSlR3SURBUUFCbzFBd1RqQWRCZ05WSFE0RUZnUVUvb09GYTFoYWFMQ3Q2dHNHT0FwK1E1M1QKRm5rd0h3WURWUjBqQkJnd0ZvQVUvb09GYTFoYWFMQ3Q2dHNHT0FwK1E1M1RGbmt3REFZRFZSMFRCQVV3QXdFQgovekFOQmdrcWhraUc5dzBCQVFzRkFBT0NBUUVBSUxrTG94MGo5M1I5U25ncVlSbmxFUW43NHVHTFNiQno1NC93Ckk3SVVaeHV0S1lzYkNXdFRTcGsvSXFadVlvQWY0WTY0MTFZRUxKMmNyZTN0VTlvWmxEbXFMWlJYK0laUXVLakkKZWJ0Qy9vUUMvYmpmZ1BRRTlxN2hHMGtJY2g0eEUveFdXMk0vekYwd2hOQ3hrbjVUVmNPVE44U205d2ZPM1hZcgpZam9YT0ZPMnRVZjBRYStJdjB1cWJScGZ5U1BTc0RYMVR6QWZQM3d4R2JyQnArcTRQMFk4L0hDaTljVlFYRmJLCmZPR2lRRi9kYnh0Z2VtbWROL3J3ZGxsVmhKUEszZEZEeWJnTlhZSzdTV0ZrVklEdXI5Wm0xamFJc1liNEJ2bjAKVk5mNFp5UzZRRThJUk8xTlEza2ZYZDZOazNTOHc2ejJpUUw3emJzN1ZxTkpxclQxeVE9PQotLS0tLUVORCBDRVJUSUZJQ0FURS0tLS0tCg=='
 
 
@@ -35,79 +54,23 @@ def get_version():
 
 
 def send_msg(content):
-    response = ""
-    if MSG_TYPE == "wecom":
-        response = wecom(MSG_TOKEN, content)
-    elif MSG_TYPE == "dingding":
-        response = dingding(MSG_TOKEN, content)
-    elif MSG_TYPE == "feishu":
-        response = feishu(MSG_TOKEN, content)
-    elif MSG_TYPE == "slack":
-        response = slack(MSG_TOKEN, content)
-    else:
+    """将消息加入异步通知队列，由后台线程合并后发送，调用方不再等待IM接口"""
+    if MSG_TYPE not in notifier.SENDERS:
         logger.warning(f"不支持的消息类型：{MSG_TYPE}")
         return f"不支持的消息类型：{MSG_TYPE}"
-
-    logger.info(f'【{MSG_TYPE}】{response}')
-    return f'【{MSG_TYPE}】{response}'
-
-
-def wecom(webhook, content, at=""):
-    webhook = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {'msgtype': 'markdown', 'markdown': {'content': f"{content}<@{at}>"}}
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    return response.json()
-
-
-def dingding(webhook, content, at=""):
-    webhook = 'https://oapi.dingtalk.com/robot/send?access_token=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {"msgtype": "markdown", "markdown": {"title": "告警", "text": content}, "at": {"atMobiles": [at]}}
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    return response.json()
-
-
-def feishu(webhook, content, at=""):
-    title = "告警通知"
-    webhook = f'https://open.feishu.cn/open-apis/bot/v2/hook/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "msg_type": "interactive",
-        "card": {
-            "header": {"title": {"tag": "plain_text", "content": title}, "template": "red"},
-            "elements": [
-                {
-                    "tag": "markdown",
-                    "content": f"{content}\n<at id={at}></at>",
-                }
-            ],
-        },
-    }
-    data = json.dumps(params)
-    response = requests.post(webhook, headers=headers, data=data)
-    return response.json()
-
-
-def slack(webhook, content, at=""):
-    """发送Slack告警通知"""
-    # 构建完整的Slack Webhook URL
-    webhook_url = f'https://hooks.slack.com/services/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-
-    # 构建消息内容，如果有@用户则添加
-    message_text = content
-    if at:
-        message_text += f" <@{at}>"
-
-    params = {"text": message_text}
-
-    data = json.dumps(params)
-    response = requests.post(webhook_url, headers=headers, data=data)
-    logger.info(f'【slack】{response.json()}')
-    return response.json()
+    if not get_notifier().enqueue(MSG_TOKEN, content):
+        return f'【{MSG_TYPE}】通知服务已停止'
+    return f'【{MSG_TYPE}】已加入发送队列'
+
+
+def get_notifier():
+    """获取当前进程的通知发送器"""
+    return notifier.get_notifier(
+        MSG_TYPE,
+        queue_size=NOTIFY_QUEUE_SIZE,
+        coalesce_window=NOTIFY_COALESCE_WINDOW,
+        retry=NOTIFY_RETRY,
+    )
 
 
 def parse_cpu(value: str) -> float:
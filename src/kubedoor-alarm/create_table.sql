@@ -0,0 +1,125 @@
+-- 告警状态采用只追加模型
+-- k8s_pod_alert_events: 每次firing/resolved/处理状态变更追加一行增量
+-- k8s_pod_alert_state: 物化视图按 (日期, 指纹) 聚合增量
+-- k8s_pod_alert_days: 包含原表全部字段的视图，供看板和前端查询
+--   额外的day字段是状态表的分区和排序键，查询时带上day条件才能只聚合需要的日期，
+--   start_time是聚合结果，条件无法下推到状态表
+
+CREATE TABLE IF NOT EXISTS kubedoor.k8s_pod_alert_events
+(
+    `ts` DateTime64(6, 'Asia/Shanghai') DEFAULT now64(6, 'Asia/Shanghai'), -- 写入时间，用于取最新状态
+    `fingerprint` String,
+    `alert_status` String DEFAULT '',        -- 为空表示本行不改变告警状态
+    `send_resolved` Bool DEFAULT true,
+    `count_firing` Int32 DEFAULT 0,          -- firing次数增量
+    `count_resolved` Int32 DEFAULT 0,        -- resolved次数增量（send_resolved为false的新告警为-1）
+    `start_time` DateTime('Asia/Shanghai'),
+    `end_time` Nullable(DateTime('Asia/Shanghai')) DEFAULT NULL,
+    `severity` String DEFAULT '',
+    `alert_group` String DEFAULT '',
+    `alert_name` String DEFAULT '',
+    `env` String DEFAULT '',
+    `namespace` String DEFAULT '',
+    `container` String DEFAULT '',
+    `pod` String DEFAULT '',
+    `description` String DEFAULT '',         -- 为空表示本行不改变描述
+    `operate` String DEFAULT ''              -- 为空表示本行不改变处理状态
+)
+ENGINE = MergeTree
+PARTITION BY toYYYYMMDD(start_time)
+ORDER BY (start_time, fingerprint)
+TTL toDateTime(start_time) + toIntervalDay(31)
+SETTINGS index_granularity = 8192;
+
+CREATE TABLE IF NOT EXISTS kubedoor.k8s_pod_alert_state
+(
+    `day` Date,
+    `fingerprint` String,
+    `start_time` SimpleAggregateFunction(min, DateTime('Asia/Shanghai')),
+    `end_time` SimpleAggregateFunction(max, Nullable(DateTime('Asia/Shanghai'))),
+    `send_resolved` SimpleAggregateFunction(min, Bool),
+    `count_firing` SimpleAggregateFunction(sum, Int64),
+    `count_resolved` SimpleAggregateFunction(sum, Int64),
+    `alert_status` AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    `description` AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    `operate` AggregateFunction(argMax, String, DateTime64(6, 'Asia/Shanghai')),
+    `severity` SimpleAggregateFunction(max, String),
+    `alert_group` SimpleAggregateFunction(max, String),
+    `alert_name` SimpleAggregateFunction(max, String),
+    `env` SimpleAggregateFunction(max, String),
+    `namespace` SimpleAggregateFunction(max, String),
+    `container` SimpleAggregateFunction(max, String),
+    `pod` SimpleAggregateFunction(max, String)
+)
+ENGINE = AggregatingMergeTree
+PARTITION BY toYYYYMM(day)
+ORDER BY (day, fingerprint)
+TTL day + toIntervalDay(365)
+SETTINGS index_granularity = 8192;
+
+-- 空值的状态/描述/处理状态以最小时间参与argMax，不会覆盖已有值
+CREATE MATERIALIZED VIEW IF NOT EXISTS kubedoor.k8s_pod_alert_state_mv TO kubedoor.k8s_pod_alert_state AS
+SELECT
+    toDate(start_time) AS day,
+    fingerprint,
+    start_time,
+    end_time,
+    send_resolved,
+    toInt64(count_firing) AS count_firing,
+    toInt64(count_resolved) AS count_resolved,
+    argMaxState(alert_status, if(alert_status = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS alert_status,
+    argMaxState(description, if(description = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS description,
+    argMaxState(operate, if(operate = '', toDateTime64(0, 6, 'Asia/Shanghai'), ts)) AS operate,
+    severity,
+    alert_group,
+    alert_name,
+    env,
+    namespace,
+    container,
+    pod
+FROM kubedoor.k8s_pod_alert_events
+GROUP BY day, fingerprint, start_time, end_time, send_resolved, count_firing, count_resolved,
+    severity, alert_group, alert_name, env, namespace, container, pod;
+
+CREATE OR REPLACE VIEW kubedoor.k8s_pod_alert_days AS
+SELECT
+    fingerprint,
+    alert_status,
+    send_resolved,
+    count_firing,
+    count_resolved,
+    start_time,
+    end_time,
+    severity,
+    alert_group,
+    alert_name,
+    env,
+    namespace,
+    container,
+    pod,
+    description,
+    operate,
+    day
+FROM
+(
+    SELECT
+        day,
+        fingerprint,
+        argMaxMerge(alert_status) AS alert_status,
+        toBool(min(send_resolved)) AS send_resolved,
+        toUInt32(sum(count_firing)) AS count_firing,
+        toInt32(sum(count_resolved)) AS count_resolved,
+        min(start_time) AS start_time,
+        max(end_time) AS end_time,
+        max(severity) AS severity,
+        max(alert_group) AS alert_group,
+        max(alert_name) AS alert_name,
+        max(env) AS env,
+        max(namespace) AS namespace,
+        max(container) AS container,
+        max(pod) AS pod,
+        argMaxMerge(description) AS description,
+        argMaxMerge(operate) AS operate
+    FROM kubedoor.k8s_pod_alert_state
+    GROUP BY day, fingerprint
+)
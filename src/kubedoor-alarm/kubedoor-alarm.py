@@ -1,11 +1,17 @@
 #!/usr/bin/python3
-import json, requests, utils
+import os
+import json, utils
+import time
+import queue
+import atexit
+import threading
 from flask import Flask, Response, request, jsonify
 from clickhouse_pool import ChPool
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 import pytz
 import logging
 import hashlib
+import notify_dispatcher
 
 logging.basicConfig(level=getattr(logging, utils.LOG_LEVEL), format='%(asctime)s - %(levelname)s - %(message)s')
 pool = ChPool(
@@ -25,67 +31,6 @@ ALERTMANAGER_EXTURL = utils.ALERTMANAGER_EXTURL
 PROM_K8S_TAG_KEY = utils.PROM_K8S_TAG_KEY
 
 
-def wecom(webhook, content, at):
-    webhook = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {'msgtype': 'markdown', 'markdown': {'content': f"{content}<@{at}>"}}
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    logging.info(f'【wecom】{response.json()}')
-
-
-def dingding(webhook, content, at):
-    webhook = 'https://oapi.dingtalk.com/robot/send?access_token=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "msgtype": "markdown",
-        "markdown": {"title": "告警", "text": content},
-        "at": {"atMobiles": [at]},
-    }
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    logging.info(f'【dingding】{response.json()}')
-
-
-def feishu(webhook, content, at):
-    title = "告警通知"
-    webhook = f'https://open.feishu.cn/open-apis/bot/v2/hook/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "msg_type": "interactive",
-        "card": {
-            "header": {"title": {"tag": "plain_text", "content": title}, "template": "red"},
-            "elements": [
-                {
-                    "tag": "markdown",
-                    "content": f"{content}\n<at id={at}></at>",
-                }
-            ],
-        },
-    }
-    data = json.dumps(params)
-    response = requests.post(webhook, headers=headers, data=data)
-    logging.info(f'【feishu】{response.json()}')
-
-
-def slack(webhook, content, at=""):
-    """发送Slack告警通知"""
-    # 构建完整的Slack Webhook URL
-    webhook_url = f'https://hooks.slack.com/services/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-
-    # 构建消息内容，如果有@用户则添加
-    message_text = content
-    if at:
-        message_text += f" <@{at}>"
-
-    params = {"text": message_text}
-
-    data = json.dumps(params)
-    response = requests.post(webhook_url, headers=headers, data=data)
-    logging.info(f'【slack】{response.json()}')
-
-
 def parse_alert_time(time_str):
     """将Alertmanager的时间字符串转换为上海时区的DateTime对象"""
     time_str = time_str[:19] + 'Z'
@@ -136,7 +81,12 @@ def extract_container_from_pod(pod_name):
         return ''
 
 
-def process_single_alert(alert):
+def parse_alert(alert):
+    """将Alertmanager告警解析为入库数据
+
+    Returns:
+        tuple: (alert_data, alert_status, send_resolved)，解析失败返回None
+    """
     try:
         # 解析时间
         starts_at = parse_alert_time(alert['startsAt'])
@@ -178,96 +128,288 @@ def process_single_alert(alert):
             'description': description,
         }
         send_resolved = False if labels.get('send_resolved', True) == 'false' else True
-
-        if alert['status'] == 'firing':
-            handle_firing_alert(alert_data, send_resolved)
-        else:
-            handle_resolved_alert(alert_data, send_resolved)
+        return alert_data, alert['status'], send_resolved
 
     except Exception as e:
-        logging.error(f"处理告警失败: {str(e)}", exc_info=True)
-
-
-def handle_firing_alert(alert_data, send_resolved):
-    check_query = f"""
-        SELECT 1 FROM kubedoor.k8s_pod_alert_days
-        WHERE toDate(start_time) = '{alert_data['start_time'].split()[0]}' and 
-        fingerprint = '{alert_data['fingerprint']}'
-        LIMIT 1
+        logging.error(f"解析告警失败: {str(e)}", exc_info=True)
+        return None
+
+
+EVENT_COLUMNS = [
+    'ts',
+    'fingerprint',
+    'alert_status',
+    'send_resolved',
+    'operate',
+    'start_time',
+    'end_time',
+    'count_firing',
+    'count_resolved',
+    'severity',
+    'alert_group',
+    'alert_name',
+    'env',
+    'namespace',
+    'container',
+    'pod',
+    'description',
+]
+
+
+def init_alert_tables():
+    """初始化告警表结构，原k8s_pod_alert_days为普通表时迁移为只追加模型
+
+    迁移分两步：先把原表重命名为k8s_pod_alert_days_legacy，建表后回填历史告警，回填成功后再重命名为
+    k8s_pod_alert_days_migrated。是否需要回填只看_legacy表是否存在，任何一步失败后下次启动都会继续迁移
     """
+    sql_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create_table.sql')
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        statements = [stmt.strip() for stmt in f.read().split(';') if stmt.strip()]
 
     with pool.get_client() as client:
-        existing = client.execute(check_query)
-
-    if existing:
-        # 获取当前时间并格式化为字符串
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        update_query = f"""
-            ALTER TABLE kubedoor.k8s_pod_alert_days
-            UPDATE count_firing = count_firing + 1, end_time = '{current_time}', 
-            alert_status = 'firing', operate = '未处理', description = '{alert_data['description']}'
-            WHERE toDate(start_time) = '{alert_data['start_time'].split()[0]}' and 
-            fingerprint = '{alert_data['fingerprint']}'
-        """
+        engine = client.execute(
+            "SELECT engine FROM system.tables WHERE database = 'kubedoor' AND name = 'k8s_pod_alert_days'"
+        )
+        if engine and engine[0][0] != 'View':
+            client.execute("RENAME TABLE kubedoor.k8s_pod_alert_days TO kubedoor.k8s_pod_alert_days_legacy")
+            logging.warning("k8s_pod_alert_days 已重命名为 k8s_pod_alert_days_legacy，开始迁移历史告警")
+
+        for stmt in statements:
+            client.execute(stmt)
+
+        legacy = client.execute(
+            "SELECT count() FROM system.tables WHERE database = 'kubedoor' AND name = 'k8s_pod_alert_days_legacy'"
+        )[0][0]
+        if legacy:
+            # 每条历史记录作为一行增量写入，由物化视图聚合；事件表按天分区，逐天回填，避免单次写入超过
+            # max_partitions_per_insert_block。以状态表中已有的(day, fingerprint)判断该天是否已回填，
+            # 事件表只保留31天，不能用它判断；重复执行不会重复写入
+            days = client.execute(
+                "SELECT DISTINCT toDate(start_time) AS day FROM kubedoor.k8s_pod_alert_days_legacy ORDER BY day"
+            )
+            for (day,) in days:
+                client.execute(
+                    f"""
+                    INSERT INTO kubedoor.k8s_pod_alert_events ({', '.join(EVENT_COLUMNS)})
+                    SELECT toDateTime64(ifNull(end_time, start_time), 6, 'Asia/Shanghai') AS ts, fingerprint,
+                        alert_status, send_resolved, operate, start_time, end_time, count_firing, count_resolved,
+                        severity, alert_group, alert_name, env, namespace, container, pod, description
+                    FROM kubedoor.k8s_pod_alert_days_legacy
+                    WHERE toDate(start_time) = %(day)s
+                        AND fingerprint NOT IN
+                        (
+                            SELECT fingerprint FROM kubedoor.k8s_pod_alert_state WHERE day = %(day)s
+                        )
+                    """,
+                    {'day': day},
+                )
+            logging.info(f"历史告警回填完成: {len(days)} 天")
+            client.execute("RENAME TABLE kubedoor.k8s_pod_alert_days_legacy TO kubedoor.k8s_pod_alert_days_migrated")
+            logging.warning("历史告警迁移完成，原表已重命名为 k8s_pod_alert_days_migrated，确认无误后可删除")
+    logging.info("告警表结构初始化完成")
+
+
+class FingerprintIndex:
+    """当天告警指纹的内存索引，替代每条告警写入前的存在性查询
+
+    启动时用一次查询预热，每次写入后更新，上海时区零点后自动切换到新的一天
+    """
 
+    def __init__(self):
+        self._day = None
+        self._fingerprints = set()
+        self._lock = threading.Lock()
+        # 预热成功后索引才是完整的；跨天后新的一天从空集合开始，之后的写入都会进入索引，仍然完整
+        self.warmed = False
+
+    @staticmethod
+    def _current_day():
+        return datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d")
+
+    def _rollover(self):
+        """跨天时清空索引，调用方需持有锁"""
+        day = self._current_day()
+        if day != self._day:
+            if self._day is not None:
+                logging.info(f"告警指纹索引切换到 {day}，清空 {self._day} 的 {len(self._fingerprints)} 条记录")
+            self._day = day
+            self._fingerprints = set()
+
+    def today(self):
+        """当前索引对应的日期（上海时区）"""
+        with self._lock:
+            self._rollover()
+            return self._day
+
+    def warm(self):
+        """从ClickHouse加载当天已存在的告警指纹"""
+        with self._lock:
+            self._rollover()
+            day = self._day
         with pool.get_client() as client:
-            client.execute(update_query)
-        logging.info(f"更新告警计数: {alert_data['fingerprint']}: {alert_data['alert_name']}")
-    else:
-        # 插入新记录
-        count_resolved = 0 if send_resolved else -1
-        insert_query = f"""
-            INSERT INTO kubedoor.k8s_pod_alert_days (
-                fingerprint, alert_status, send_resolved, operate, 
-                start_time,count_firing,count_resolved,
-                severity, alert_group, alert_name,
-                env, namespace,
-                container, pod, description
-            ) VALUES (
-                '{alert_data['fingerprint']}', 'firing', {send_resolved}, '未处理',
-                '{alert_data['start_time']}', 1, {count_resolved},
-                '{alert_data['severity']}', '{alert_data['alert_group']}', '{alert_data['alert_name']}',
-                '{alert_data['env']}', '{alert_data['namespace']}',
-                '{alert_data['container']}', '{alert_data['pod']}', '{alert_data['description']}'
+            rows = client.execute(
+                "SELECT DISTINCT fingerprint FROM kubedoor.k8s_pod_alert_state WHERE day = %(day)s", {'day': day}
             )
-        """
-        with pool.get_client() as client:
-            client.execute(insert_query)
-        logging.info(f"新建告警记录: {alert_data['fingerprint']}: {alert_data['alert_name']}")
-    return True, ''
+        with self._lock:
+            if self._day == day:
+                self._fingerprints.update(fingerprint for (fingerprint,) in rows)
+            self.warmed = True
+        logging.info(f"告警指纹索引预热完成: {day} {len(rows)} 条")
+
+    def contains(self, fingerprint):
+        with self._lock:
+            self._rollover()
+            return fingerprint in self._fingerprints
+
+    def add_all(self, fingerprints):
+        with self._lock:
+            self._rollover()
+            self._fingerprints.update(fingerprints)
 
 
-def handle_resolved_alert(alert_data, send_resolved):
-    if not send_resolved:
-        err = f"告警 {alert_data['fingerprint']}: {alert_data['alert_name']} 的 send_resolved 为 false，不入库"
-        logging.warning(err)
-        return False, err
+fingerprint_index = FingerprintIndex()
 
-    check_query = f"""
-        SELECT 1 FROM kubedoor.k8s_pod_alert_days
-        WHERE toDate(start_time) = '{alert_data['start_time'].split()[0]}' and fingerprint = '{alert_data['fingerprint']}'
-        LIMIT 1
+
+def process_alert_batch(items):
+    """批量处理告警：一次查询已存在的告警记录，所有状态变更作为增量一次批量写入，不再使用mutation
+
+    Args:
+        items: [(alert_data, alert_status, send_resolved)]，按接收顺序排列
+
+    Returns:
+        list: 与items一一对应的 (是否成功, 错误信息)
     """
+    if not items:
+        return []
+    keys = {(alert_data['start_time'][:10], alert_data['fingerprint']) for alert_data, _, _ in items}
+    today = fingerprint_index.today()
+    # 当天的告警由内存索引判断；跨天告警和索引中不存在的resolved告警（可能由其他副本写入）回查ClickHouse
+    resolved_keys = {
+        (alert_data['start_time'][:10], alert_data['fingerprint'])
+        for alert_data, alert_status, _ in items
+        if alert_status != 'firing'
+    }
+    if not fingerprint_index.warmed:
+        try:
+            fingerprint_index.warm()
+        except Exception as e:
+            logging.error(f"告警指纹索引预热失败，本批告警回查ClickHouse: {str(e)}")
+    if fingerprint_index.warmed:
+        existing = {key for key in keys if key[0] == today and fingerprint_index.contains(key[1])}
+        lookup = {key for key in keys if key[0] != today} | (resolved_keys - existing)
+    else:
+        # 索引不完整时不能把索引中不存在的当天告警当作新告警
+        existing = set()
+        lookup = set(keys)
+
     with pool.get_client() as client:
-        existing = client.execute(check_query)
-
-    if existing:
-        update_query = f"""
-            ALTER TABLE kubedoor.k8s_pod_alert_days
-            UPDATE alert_status = 'resolved', end_time = '{alert_data['end_time']}', 
-            count_resolved = count_resolved + 1, description = '{alert_data['description']}'
-            WHERE toDate(start_time) = '{alert_data['start_time'].split()[0]}' AND 
-            fingerprint = '{alert_data['fingerprint']}'
-        """
-        with pool.get_client() as client:
-            client.execute(update_query)
+        if lookup:
+            rows = client.execute(
+                """
+                SELECT DISTINCT toString(day), fingerprint FROM kubedoor.k8s_pod_alert_state
+                WHERE day IN %(days)s AND (toString(day), fingerprint) IN %(keys)s
+                """,
+                {'days': tuple(sorted({day for day, _ in lookup})), 'keys': tuple(lookup)},
+            )
+            existing |= {(day, fingerprint) for day, fingerprint in rows}
+
+        rows = []
+        results = []
+        now = datetime.now()
+        for alert_data, alert_status, send_resolved in items:
+            key = (alert_data['start_time'][:10], alert_data['fingerprint'])
+            row = dict(
+                alert_data,
+                # 同一批次内按顺序递增，保证最新状态的先后关系
+                ts=now + timedelta(microseconds=len(rows)),
+                start_time=datetime.strptime(alert_data['start_time'], "%Y-%m-%d %H:%M:%S"),
+                send_resolved=send_resolved,
+            )
+            if alert_status == 'firing':
+                if key in existing:
+                    row.update(end_time=now.replace(microsecond=0), count_resolved=0)
+                else:
+                    existing.add(key)
+                    row.update(end_time=None, count_resolved=0 if send_resolved else -1)
+                row.update(alert_status='firing', operate='未处理', count_firing=1)
+            elif not send_resolved:
+                err = f"告警 {alert_data['fingerprint']}: {alert_data['alert_name']} 的 send_resolved 为 false，不入库"
+                logging.warning(err)
+                results.append((False, err))
+                continue
+            elif key in existing:
+                row.update(
+                    alert_status='resolved',
+                    operate='',
+                    end_time=datetime.strptime(alert_data['end_time'], "%Y-%m-%d %H:%M:%S"),
+                    count_firing=0,
+                    count_resolved=1,
+                )
+            else:
+                err = f"未找到对应告警记录: {alert_data['fingerprint']}: {alert_data['alert_name']}"
+                logging.error(err)
+                results.append((False, err))
+                continue
+            rows.append(tuple(row[column] for column in EVENT_COLUMNS))
+            results.append((True, ''))
+
+        if rows:
+            client.execute(f"INSERT INTO kubedoor.k8s_pod_alert_events ({', '.join(EVENT_COLUMNS)}) VALUES", rows)
+            logging.info(f"写入告警状态: {len(rows)} 条")
+            fingerprint_index.add_all(fingerprint for day, fingerprint in existing if day == today)
+
+    return results
+
+
+# Alertmanager推送的告警先进入队列，由后台线程按批次入库，webhook请求无需等待ClickHouse
+alert_queue = queue.Queue(maxsize=utils.ALERT_QUEUE_SIZE)
+
+
+def alert_ingest_worker():
+    """后台入库线程：攒够ALERT_BATCH_SIZE条或等待ALERT_BATCH_WAIT秒后批量处理"""
+    while True:
+        items = alert_queue.get()
+        if items is None:
+            return
+        deadline = time.monotonic() + utils.ALERT_BATCH_WAIT
+        stop = False
+        while len(items) < utils.ALERT_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                more = alert_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if more is None:
+                stop = True
+                break
+            items.extend(more)
+        try:
+            process_alert_batch(items)
+        except Exception as e:
+            logging.error(f"批量处理告警失败({len(items)} 条): {str(e)}", exc_info=True)
+        if stop:
+            return
 
-        logging.info(f"标记告警解决: {alert_data['fingerprint']}: {alert_data['alert_name']}")
-        return True, ''
-    else:
-        err = f"未找到对应告警记录: {alert_data['fingerprint']}: {alert_data['alert_name']}"
-        logging.error(err)
-        return False, err
+
+def stop_alert_ingest_worker():
+    """进程退出前处理完队列中的告警"""
+    alert_queue.put(None)
+    ingest_thread.join(timeout=30)
+
+
+try:
+    init_alert_tables()
+except Exception as e:
+    logging.error(f"告警表结构初始化失败: {str(e)}")
+try:
+    fingerprint_index.warm()
+except Exception as e:
+    logging.error(f"告警指纹索引预热失败: {str(e)}")
+ingest_thread = threading.Thread(target=alert_ingest_worker, name='alert-ingest', daemon=True)
+ingest_thread.start()
+atexit.register(stop_alert_ingest_worker)
 
 
 app = Flask(__name__)
@@ -280,11 +422,22 @@ def handle_alert():
         if not data or 'alerts' not in data:
             return jsonify({'status': 'error', 'message': '无效的请求格式'}), 400
 
+        items = []
         for alert in data['alerts']:
             logging.debug(str(alert))
-            process_single_alert(alert)
+            item = parse_alert(alert)
+            if item:
+                items.append(item)
 
-        return jsonify({'status': 'success', 'message': '告警处理完成'}), 200
+        if items:
+            try:
+                alert_queue.put_nowait(items)
+            except queue.Full:
+                # 返回5xx让Alertmanager稍后重试
+                logging.error(f"告警入库队列已满，拒绝 {len(items)} 条告警")
+                return jsonify({'status': 'error', 'message': '告警入库队列已满'}), 503
+
+        return jsonify({'status': 'success', 'message': f'已接收 {len(items)} 条告警'}), 200
 
     except Exception as e:
         logging.error(f"处理请求时发生异常: {str(e)}")
@@ -373,11 +526,8 @@ def handle_custom_alert():
         send_resolved = data['send_resolved']
         alert_status = data['alert_status']
 
-        # 根据alert_status调用相应的处理函数
-        if alert_status == 'firing':
-            result, msg = handle_firing_alert(alert_data, send_resolved)
-        else:
-            result, msg = handle_resolved_alert(alert_data, send_resolved)
+        # 自定义告警同步入库，以便返回处理结果
+        result, msg = process_alert_batch([(alert_data, alert_status, send_resolved)])[0]
         if result:
             return jsonify({'status': 'success', 'message': '自定义告警处理完成'}), 200
         else:
@@ -401,7 +551,8 @@ def alertnode(token):
 
     # if (now_cn > time1830 or now_cn < time0830):
     #    return Response(status=204)
-    allmd = ''
+    # 按告警注解中需要@的人分组，每组@各自的人
+    blocks = {}
     for i in req["alerts"]:
         status = "故障" if i['status'] == "firing" else "恢复"
         try:
@@ -433,17 +584,21 @@ def alertnode(token):
             info = f"### {status}<font color=\"#6aa84f\">{summary}</font>\n- {message}\n\n"
         else:
             info = f"### {status}<font color=\"#ff0000\">{summary}</font>\n- {message}[【屏蔽】]({url})\n\n"
-        allmd = allmd + info
-
-    im, key = token.split('=', 1)
-    if im == 'wecom':
-        wecom(key, allmd, at)
-    elif im == 'dingding':
-        dingding(key, allmd, at)
-    elif im == 'feishu':
-        feishu(key, allmd, at)
+        blocks.setdefault(at, []).append(info)
+
+    # 由后台线程合并、限速后发送，webhook请求不再等待IM接口
+    for at, at_blocks in blocks.items():
+        if not notify_dispatcher.dispatch(token, at_blocks, at):
+            logging.warning(f"不支持的消息类型: {token.split('=', 1)[0]}")
+            return Response(status=400)
     return Response(status=200)
 
 
+@app.route("/msg/stats", methods=['GET'])
+def notify_stats():
+    """各机器人通道的告警通知发送统计"""
+    return jsonify({'status': 'success', 'data': notify_dispatcher.get_stats()})
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=80)
@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+"""
+IM告警通知分发
+每个机器人token一个队列和发送线程：窗口期内到达的告警合并为一条摘要，按各IM的单条消息大小上限拆分，
+按机器人的频率限制用令牌桶限速发送，失败后指数退避重试
+"""
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+import requests
+import utils
+
+# 各IM自定义机器人的限制：rate为每秒补充的令牌数，burst为令牌桶容量，max_bytes为单条消息内容上限
+PROVIDER_LIMITS = {
+    'wecom': {'rate': 20 / 60, 'burst': 20, 'max_bytes': 4000},
+    'dingding': {'rate': 20 / 60, 'burst': 20, 'max_bytes': 18000},
+    'feishu': {'rate': 100 / 60, 'burst': 5, 'max_bytes': 18000},
+    'slack': {'rate': 1, 'burst': 1, 'max_bytes': 36000},
+}
+
+
+def wecom(session, webhook, content, at):
+    webhook = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=' + webhook
+    params = {'msgtype': 'markdown', 'markdown': {'content': f"{content}<@{at}>"}}
+    response = session.post(webhook, json=params, timeout=10)
+    response.raise_for_status()
+    result = response.json()
+    logging.info(f'【wecom】{result}')
+    return result.get('errcode', 0) == 0
+
+
+def dingding(session, webhook, content, at):
+    webhook = 'https://oapi.dingtalk.com/robot/send?access_token=' + webhook
+    params = {
+        "msgtype": "markdown",
+        "markdown": {"title": "告警", "text": content},
+        "at": {"atMobiles": [at]},
+    }
+    response = session.post(webhook, json=params, timeout=10)
+    response.raise_for_status()
+    result = response.json()
+    logging.info(f'【dingding】{result}')
+    return result.get('errcode', 0) == 0
+
+
+def feishu(session, webhook, content, at):
+    title = "告警通知"
+    webhook = f'https://open.feishu.cn/open-apis/bot/v2/hook/{webhook}'
+    params = {
+        "msg_type": "interactive",
+        "card": {
+            "header": {"title": {"tag": "plain_text", "content": title}, "template": "red"},
+            "elements": [
+                {
+                    "tag": "markdown",
+                    "content": f"{content}\n<at id={at}></at>",
+                }
+            ],
+        },
+    }
+    response = session.post(webhook, json=params, timeout=10)
+    response.raise_for_status()
+    result = response.json()
+    logging.info(f'【feishu】{result}')
+    return result.get('code', result.get('StatusCode', 0)) == 0
+
+
+def slack(session, webhook, content, at=""):
+    """发送Slack告警通知"""
+    # 构建完整的Slack Webhook URL
+    webhook_url = f'https://hooks.slack.com/services/{webhook}'
+
+    # 构建消息内容，如果有@用户则添加
+    message_text = content
+    if at:
+        message_text += f" <@{at}>"
+
+    response = session.post(webhook_url, json={"text": message_text}, timeout=10)
+    response.raise_for_status()
+    # Slack成功时返回纯文本ok
+    logging.info(f'【slack】{response.text}')
+    return True
+
+
+SENDERS = {'wecom': wecom, 'dingding': dingding, 'feishu': feishu, 'slack': slack}
+
+
+class TokenBucket:
+    """令牌桶限速"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """取一个令牌，不足时阻塞等待"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+def split_content(blocks, max_bytes):
+    """将告警块按大小上限拼接成若干条消息，单个块超过上限时截断
+
+    Args:
+        blocks: 每条告警的markdown文本
+        max_bytes: 单条消息内容的字节上限
+
+    Returns:
+        list: 消息内容列表
+    """
+    messages = []
+    current, current_bytes = [], 0
+    for block in blocks:
+        size = len(block.encode('utf-8'))
+        if size > max_bytes:
+            block = block.encode('utf-8')[: max_bytes - 16].decode('utf-8', errors='ignore') + '...(已截断)\n\n'
+            size = len(block.encode('utf-8'))
+        if current and current_bytes + size > max_bytes:
+            messages.append(''.join(current))
+            current, current_bytes = [], 0
+        current.append(block)
+        current_bytes += size
+    if current:
+        messages.append(''.join(current))
+    return messages
+
+
+class TokenChannel:
+    """单个机器人token的发送通道"""
+
+    def __init__(self, im, key):
+        self.im = im
+        self.key = key
+        limits = PROVIDER_LIMITS[im]
+        self.max_bytes = limits['max_bytes']
+        self.bucket = TokenBucket(limits['rate'], limits['burst'])
+        self.session = requests.Session()
+        self.pending = deque()
+        self.dropped = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.stats = {'alerts': 0, 'messages': 0, 'failed': 0, 'dropped': 0}
+        self.thread = threading.Thread(target=self.run, name=f'notify-{im}', daemon=True)
+        self.thread.start()
+
+    def put(self, blocks, at):
+        """追加一次请求中的告警，队列满时丢弃最早的告警"""
+        with self.cond:
+            for block in blocks:
+                if len(self.pending) >= utils.NOTIFY_QUEUE_SIZE:
+                    self.pending.popleft()
+                    self.dropped += 1
+                    self.stats['dropped'] += 1
+                self.pending.append((block, at))
+            self.stats['alerts'] += len(blocks)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _take(self):
+        """等待第一条告警后再等待一个合并窗口，取出窗口内的所有告警并按需要@的人分组
+
+        Returns:
+            tuple: ([(at, blocks)], 丢弃数)，按每个at第一次出现的顺序排列；通道关闭时分组为None
+        """
+        with self.cond:
+            while not self.pending and not self.closed:
+                self.cond.wait()
+            if not self.pending:
+                return None, 0
+            deadline = time.monotonic() + utils.NOTIFY_GROUP_WAIT
+            while not self.closed:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self.cond.wait(timeout)
+            items = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        # 不同路由/规则的告警可能需要@不同的人，每个at单独汇总成一条摘要
+        groups = {}
+        for block, at in items:
+            groups.setdefault(at, []).append(block)
+        return list(groups.items()), dropped
+
+    def run(self):
+        while True:
+            groups, dropped = self._take()
+            if groups is None:
+                return
+            if dropped:
+                groups[0][1].insert(0, f"> 告警过多，已丢弃 {dropped} 条较早的告警\n\n")
+            for at, blocks in groups:
+                # 预留分页序号的长度
+                messages = split_content(blocks, self.max_bytes - 32)
+                for index, content in enumerate(messages, 1):
+                    if len(messages) > 1:
+                        content = f"**({index}/{len(messages)})**\n{content}"
+                    self.bucket.acquire()
+                    self._send(content, at)
+
+    def _send(self, content, at):
+        """发送一条消息，失败后指数退避重试"""
+        for attempt in range(utils.NOTIFY_RETRY + 1):
+            try:
+                if SENDERS[self.im](self.session, self.key, content, at):
+                    self.stats['messages'] += 1
+                    return
+            except Exception as e:
+                logging.error(f"【{self.im}】发送告警通知失败(第{attempt + 1}次): {str(e)}")
+            if attempt < utils.NOTIFY_RETRY:
+                time.sleep(utils.NOTIFY_RETRY_BACKOFF * 2**attempt)
+                # 重试同样受频率限制
+                self.bucket.acquire()
+        self.stats['failed'] += 1
+        logging.error(f"【{self.im}】告警通知重试{utils.NOTIFY_RETRY}次后仍失败，放弃发送")
+
+
+_channels = {}
+_lock = threading.Lock()
+
+
+def dispatch(token, blocks, at):
+    """将告警加入对应token的发送队列
+
+    Args:
+        token: 形如 im=key 的机器人标识，如 wecom=xxx
+        blocks: 每条告警的markdown文本
+        at: 需要@的人
+
+    Returns:
+        bool: im类型不支持时返回False
+    """
+    im, key = token.split('=', 1)
+    if im not in SENDERS:
+        return False
+    with _lock:
+        channel = _channels.get(token)
+        if channel is None:
+            channel = _channels[token] = TokenChannel(im, key)
+    channel.put(blocks, at)
+    return True
+
+
+def get_stats():
+    """获取各token通道的发送统计（token只保留im类型）"""
+    with _lock:
+        channels = list(_channels.values())
+    return [dict(channel.stats, im=channel.im, pending=len(channel.pending)) for channel in channels]
+
+
+def shutdown(timeout=30):
+    """进程退出前发送队列中剩余的告警"""
+    with _lock:
+        channels = list(_channels.values())
+    for channel in channels:
+        channel.close()
+    deadline = time.monotonic() + timeout
+    for channel in channels:
+        channel.thread.join(max(0, deadline - time.monotonic()))
+
+
+atexit.register(shutdown)
@@ -13,3 +13,12 @@ PROM_K8S_TAG_KEY = os.environ.get('PROM_K8S_TAG_KEY')
 DEFAULT_AT = os.environ.get('DEFAULT_AT')
 ALERTMANAGER_EXTURL = os.environ.get('ALERTMANAGER_EXTURL')
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# 告警批量入库：批大小、最长等待时间（秒）、队列容量（webhook请求数）
+ALERT_BATCH_SIZE = int(os.environ.get('ALERT_BATCH_SIZE', 500))
+ALERT_BATCH_WAIT = float(os.environ.get('ALERT_BATCH_WAIT', 1))
+ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE', 1000))
+# IM告警通知：合并窗口（秒）、每个机器人的队列容量（告警条数）、失败重试次数及退避基数（秒）
+NOTIFY_GROUP_WAIT = float(os.environ.get('NOTIFY_GROUP_WAIT', 10))
+NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', 1000))
+NOTIFY_RETRY = int(os.environ.get('NOTIFY_RETRY', 3))
+NOTIFY_RETRY_BACKOFF = float(os.environ.get('NOTIFY_RETRY_BACKOFF', 2))
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件链路压测
+模拟多个agent通过WebSocket向master推送事件风暴，完整经过
+websocket_handler -> process_k8s_event_async -> K8SEventProcessor -> EventAlertProcessor，
+统计吞吐、端到端延迟、master事件循环延迟和内存占用，用于发版前发现性能回退
+
+默认使用进程内的ClickHouse替身和本地webhook接收端，无需任何外部依赖（单进程模式）；
+加 --clickhouse 时使用CK_*环境变量指向的真实ClickHouse，可配合 --workers 测试多进程分片，
+此时工作进程内的告警通过实际配置的MSG_TYPE/MSG_TOKEN发送，压测前请指向测试webhook
+
+使用方式（在kubedoor-master目录下执行）:
+    python3 benchmark/event_pipeline_bench.py --clusters 4 --events 20000
+    python3 benchmark/event_pipeline_bench.py --clickhouse --workers 4 --events 100000 --rate 5000
+    python3 benchmark/event_pipeline_bench.py --json result.json --baseline last.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import asyncio
+import argparse
+import tempfile
+import threading
+import importlib.util
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+
+MASTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 事件原因: (reason, level, kind)
+EVENT_REASONS = [
+    ('BackOff', 'Warning', 'Pod'),
+    ('Unhealthy', 'Warning', 'Pod'),
+    ('FailedMount', 'Warning', 'Pod'),
+    ('FailedScheduling', 'Warning', 'Pod'),
+    ('Pulled', 'Normal', 'Pod'),
+    ('Created', 'Normal', 'Pod'),
+    ('ScalingReplicaSet', 'Normal', 'Deployment'),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='K8S事件链路压测')
+    parser.add_argument('--clusters', type=int, default=4, help='模拟的K8S集群（agent）数量')
+    parser.add_argument('--events', type=int, default=20000, help='发送的事件总数')
+    parser.add_argument('--uids', type=int, default=500, help='每个集群的事件对象数，越小MODIFIED风暴越集中')
+    parser.add_argument('--batch', type=int, default=0, help='按k8s_event_batch合并发送的批大小（同一eventUid只保留最后一条），0表示逐条发送')
+    parser.add_argument('--rate', type=int, default=0, help='总发送速率（条/秒），0表示不限速')
+    parser.add_argument('--min-message', type=int, default=64, help='事件消息最小字节数')
+    parser.add_argument('--max-message', type=int, default=2048, help='事件消息最大字节数')
+    parser.add_argument('--ck-latency-ms', type=float, default=2.0, help='ClickHouse替身每次调用的模拟耗时')
+    parser.add_argument('--webhook-latency-ms', type=float, default=50.0, help='webhook接收端的模拟耗时')
+    parser.add_argument('--clickhouse', action='store_true', help='使用真实ClickHouse（CK_*环境变量）')
+    parser.add_argument('--workers', type=int, default=0, help='事件处理进程数，仅在--clickhouse时生效')
+    parser.add_argument('--timeout', type=float, default=300, help='等待处理完成的超时时间（秒）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--baseline', help='基准结果JSON文件，用于回退检查')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的回退比例')
+    return parser.parse_args()
+
+
+class WebhookStub:
+    """本地webhook接收端，模拟IM服务器的响应耗时"""
+
+    def __init__(self, latency_ms: float):
+        stub = self
+        self.received = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(latency_ms / 1000)
+                stub.received += 1
+                body = b'{"errcode":0,"errmsg":"ok"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def send(self, content, msg_token=None):
+        """替代utils.send_msg"""
+        data = json.dumps({'msgtype': 'markdown', 'markdown': {'content': content}}).encode('utf-8')
+        req = urllib_request.Request(self.url, data=data, headers={'Content-Type': 'application/json'})
+        with urllib_request.urlopen(req) as resp:
+            return resp.read().decode('utf-8')
+
+
+class FakeClickHouse:
+    """进程内ClickHouse替身：记录写入并计算端到端延迟"""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.sent_at = {}
+        self.latencies = []
+        self.inserted = 0
+        self._lock = threading.Lock()
+
+    def insert_events(self, client_self, events):
+        time.sleep(self.latency)
+        now = time.perf_counter()
+        with self._lock:
+            for event in events:
+                sent = self.sent_at.pop((event['eventUid'], event['count']), None)
+                if sent is not None:
+                    self.latencies.append(now - sent)
+            self.inserted += len(events)
+
+    def execute_query(self, pool_self, query, parameters=None):
+        time.sleep(self.latency)
+        return []
+
+
+def load_master(args, fake_ck, webhook):
+    """加载master模块并按压测模式替换外部依赖"""
+    os.chdir(MASTER_DIR)
+    sys.path.insert(0, MASTER_DIR)
+    os.environ['EVENT_SPOOL_DIR'] = tempfile.mkdtemp(prefix='kubedoor-bench-spool-')
+    os.environ['EVENT_WORKERS'] = str(args.workers if args.clickhouse else 0)
+
+    import utils
+    from k8s_event import clickhouse_client, connection_pool, event_alert_processor
+
+    event_alert_processor.send_msg = webhook.send
+    if not args.clickhouse:
+        utils.ck_init_agent_status = lambda env: None
+        clickhouse_client.ClickHouseClient.insert_events = fake_ck.insert_events
+        connection_pool.ClickHouseConnectionPool.execute_query = fake_ck.execute_query
+
+    spec = importlib.util.spec_from_file_location('kubedoor_master', os.path.join(MASTER_DIR, 'kubedoor-master.py'))
+    master = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(master)
+    # 压测关注事件链路本身，只输出WARNING以上日志
+    master.logger.remove()
+    master.logger.add(sys.stderr, level='WARNING')
+    return master
+
+
+def build_events(args):
+    """生成各集群的事件流：每个对象先ADDED，之后MODIFIED只变化count和lastTimestamp"""
+    rng = random.Random(args.seed)
+    streams = {f"bench-k8s-{i}": [] for i in range(args.clusters)}
+    counters = {}
+    clusters = list(streams)
+    for n in range(args.events):
+        k8s = clusters[n % args.clusters]
+        uid_index = rng.randrange(args.uids)
+        uid = f"{k8s}-uid-{uid_index}"
+        reason, level, kind = EVENT_REASONS[uid_index % len(EVENT_REASONS)]
+        count = counters.get(uid, 0) + 1
+        counters[uid] = count
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        size = rng.randint(args.min_message, args.max_message)
+        streams[k8s].append(
+            {
+                'type': 'k8s_event',
+                'data': {
+                    'eventUid': uid,
+                    'eventStatus': 'ADDED' if count == 1 else 'MODIFIED',
+                    'level': level,
+                    'count': count,
+                    'kind': kind,
+                    'k8s': k8s,
+                    'namespace': f"ns-{uid_index % 20}",
+                    'name': f"app-{uid_index % 50}-7d9f8c6b5-{''.join(rng.choices(string.ascii_lowercase, k=5))}",
+                    'reason': reason,
+                    'message': ''.join(rng.choices(string.ascii_letters + ' ', k=size)),
+                    'firstTimestamp': now,
+                    'lastTimestamp': now,
+                    'reportingComponent': 'kubelet',
+                    'reportingInstance': f"node-{uid_index % 10}",
+                    'msgToken': 'bench',
+                },
+            }
+        )
+    return streams
+
+
+def run_agents(url, streams, rate, batch, fake_ck, sent_total, done_sending):
+    """在独立线程和事件循环中运行模拟agent，避免干扰master事件循环的测量"""
+    import aiohttp
+
+    async def agent(k8s, events, interval):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"{url}?env={k8s}&ver=bench") as ws:
+                next_send = time.perf_counter()
+                pending = {}
+                for message in events:
+                    data = message['data']
+                    fake_ck.sent_at[(data['eventUid'], data['count'])] = time.perf_counter()
+                    if batch:
+                        pending[data['eventUid']] = data
+                        if len(pending) >= batch or message is events[-1]:
+                            sent_total[0] += len(pending)
+                            await ws.send_json({'type': 'k8s_event_batch', 'data': list(pending.values())})
+                            pending = {}
+                    else:
+                        sent_total[0] += 1
+                        await ws.send_json(message)
+                    if interval:
+                        next_send += interval
+                        delay = next_send - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                finished.append(k8s)
+                if len(finished) == len(streams):
+                    done_sending.set()
+                # 保持连接直到master处理完，避免被判定为离线
+                await asyncio.sleep(1)
+
+    finished = []
+
+    async def main():
+        per_agent_interval = len(streams) / rate if rate else 0
+        await asyncio.gather(*(agent(k8s, events, per_agent_interval) for k8s, events in streams.items()))
+
+    asyncio.run(main())
+
+
+def rss_mb():
+    """当前进程RSS（MB），仅Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        return 0.0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_bench(args):
+    from aiohttp import web
+
+    fake_ck = FakeClickHouse(args.ck_latency_ms)
+    webhook = WebhookStub(args.webhook_latency_ms)
+    master = load_master(args, fake_ck, webhook)
+    from k8s_event import get_alert_stats, init_clickhouse_tables, start_event_workers, stop_event_workers
+
+    if args.clickhouse:
+        init_clickhouse_tables()
+    start_event_workers()
+
+    # 只挂载agent的WebSocket入口，不启动心跳检查等与事件链路无关的后台任务
+    app = web.Application()
+    app.router.add_get('/ws', master.websocket_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    streams = build_events(args)
+    total = sum(len(events) for events in streams.values())
+
+    # 事件循环延迟：每10ms唤醒一次，统计实际唤醒的滞后
+    loop_lags = []
+    rss_samples = [rss_mb()]
+    stop = asyncio.Event()
+
+    async def monitor():
+        while not stop.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            loop_lags.append(max(0.0, time.perf_counter() - expected))
+            if len(loop_lags) % 50 == 0:
+                rss_samples.append(rss_mb())
+
+    def processed():
+        if not args.clickhouse:
+            return fake_ck.inserted
+        stats = get_alert_stats()
+        if 'shards' in stats:
+            return sum(shard['processed'] for shard in stats['shards'].values())
+        return stats['processor_stats']['total_events']
+
+    monitor_task = asyncio.create_task(monitor())
+    sent_total = [0]
+    done_sending = threading.Event()
+    started = time.perf_counter()
+    threading.Thread(
+        target=run_agents,
+        args=(f"http://127.0.0.1:{port}/ws", streams, args.rate, args.batch, fake_ck, sent_total, done_sending),
+        daemon=True,
+    ).start()
+
+    while (not done_sending.is_set() or processed() < sent_total[0]) and time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    done = processed()
+    stop.set()
+    await monitor_task
+    stats = get_alert_stats()
+    stop_event_workers()
+    await runner.cleanup()
+
+    result = {
+        'mode': 'clickhouse' if args.clickhouse else 'fake',
+        'workers': args.workers if args.clickhouse else 0,
+        'clusters': args.clusters,
+        'batch': args.batch,
+        'events_generated': total,
+        'events_sent': sent_total[0],
+        'events_processed': done,
+        'elapsed_s': round(elapsed, 3),
+        # 以agent侧产生的事件数计算吞吐，合并发送时可直接与逐条发送对比
+        'events_per_s': round(total * min(1.0, done / max(sent_total[0], 1)) / elapsed, 1) if elapsed else 0,
+        'e2e_p50_ms': round(percentile(fake_ck.latencies, 50) * 1000, 2),
+        'e2e_p99_ms': round(percentile(fake_ck.latencies, 99) * 1000, 2),
+        'loop_lag_p50_ms': round(percentile(loop_lags, 50) * 1000, 2),
+        'loop_lag_p99_ms': round(percentile(loop_lags, 99) * 1000, 2),
+        'loop_lag_max_ms': round(max(loop_lags, default=0) * 1000, 2),
+        'rss_start_mb': round(rss_samples[0], 1),
+        'rss_peak_mb': round(max(rss_samples), 1),
+        'alerts_sent': stats.get('processor_stats', {}).get('alerts_sent', 0),
+        'webhook_received': webhook.received,
+    }
+    if args.clickhouse:
+        # 真实ClickHouse模式下端到端延迟无法在进程内测量
+        result['e2e_p50_ms'] = result['e2e_p99_ms'] = None
+    return result
+
+
+def check_regression(result, baseline, tolerance):
+    """与基准结果比较，吞吐下降或延迟上升超过容忍比例时返回问题列表"""
+    problems = []
+    if baseline.get('events_per_s') and result['events_per_s'] < baseline['events_per_s'] * (1 - tolerance):
+        problems.append(f"吞吐下降: {result['events_per_s']} < {baseline['events_per_s']}")
+    for key in ('e2e_p99_ms', 'loop_lag_p99_ms', 'rss_peak_mb'):
+        if baseline.get(key) and result.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            problems.append(f"{key} 上升: {result[key]} > {baseline[key]}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run_bench(args))
+
+    width = max(len(key) for key in result)
+    for key, value in result.items():
+        print(f"{key.ljust(width)}  {value}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if result['events_processed'] < result['events_sent']:
+        print(f"❌ 超时: 仅处理 {result['events_processed']}/{result['events_sent']} 条事件")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = check_regression(result, json.load(f), args.tolerance)
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            sys.exit(1)
+        print("✅ 未发现性能回退")
+
+
+if __name__ == '__main__':
+    main()
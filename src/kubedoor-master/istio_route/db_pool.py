@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Istio Route MySQL 连接池
+
+mysql.connector 是同步驱动，所有数据库操作都放到专用线程池中执行，避免阻塞 kubedoor-master 的事件循环；
+连接在线程间复用，支持最小/最大连接数、超时回收和空闲连接健康检查
+"""
+
+import time
+import asyncio
+import threading
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+from loguru import logger
+
+
+class MySQLPool:
+    """MySQL连接池，通过 await pool.run(func, *args) 在线程池中执行 func(*args, connection=conn)"""
+
+    def __init__(self, config, min_size=1, max_size=10, recycle=3600, ping_interval=30):
+        """初始化连接池，最小连接数在后台线程中预先建立
+
+        Args:
+            config: mysql.connector.connect 的连接参数（需包含database）
+            min_size: 最小空闲连接数
+            max_size: 最大连接数，同时也是执行数据库操作的线程数
+            recycle: 连接最长使用时间（秒），超过后关闭重建
+            ping_interval: 连接空闲超过该时间（秒）后，取出时先ping检查
+        """
+        self.config = dict(config, charset='utf8mb4', autocommit=False, buffered=True)
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._idle = deque()  # (connection, created_at, last_used)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='istio-mysql')
+        self.stats = {'created': 0, 'recycled': 0, 'broken': 0, 'in_use': 0}
+        self._executor.submit(self._warm)
+
+    def _connect(self):
+        """建立新连接，数据库不存在时先创建数据库"""
+        try:
+            connection = mysql.connector.connect(**self.config)
+        except mysql.connector.Error as e:
+            if e.errno != mysql.connector.errorcode.ER_BAD_DB_ERROR:
+                raise
+            server_config = {k: v for k, v in self.config.items() if k != 'database'}
+            temp_conn = mysql.connector.connect(**server_config)
+            cursor = temp_conn.cursor()
+            cursor.execute(
+                f"CREATE DATABASE IF NOT EXISTS {self.config['database']} "
+                "CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+            )
+            temp_conn.commit()
+            cursor.close()
+            temp_conn.close()
+            connection = mysql.connector.connect(**self.config)
+        with self._lock:
+            self.stats['created'] += 1
+        return connection
+
+    def _warm(self):
+        """预先建立最小连接数"""
+        try:
+            connections = [self._connect() for _ in range(self.min_size)]
+        except Exception as e:
+            logger.error(f"Istio Route 数据库连接池预热失败: {e}")
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._idle.extend((connection, now, now) for connection in connections)
+        logger.info(f"Istio Route 数据库连接池已就绪，预建连接 {len(connections)} 个")
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        """取出一个可用连接：超过回收时间的关闭重建，空闲较久的先ping检查"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    return self._connect(), time.monotonic()
+                connection, created_at, last_used = item
+                now = time.monotonic()
+                if now - created_at > self.recycle:
+                    self._close(connection)
+                    with self._lock:
+                        self.stats['recycled'] += 1
+                    continue
+                if now - last_used > self.ping_interval:
+                    try:
+                        connection.ping(reconnect=False)
+                    except Exception:
+                        self._close(connection)
+                        with self._lock:
+                            self.stats['broken'] += 1
+                        continue
+                return connection, created_at
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection, created_at, broken):
+        """归还连接，未提交的事务回滚，连接异常时直接关闭"""
+        try:
+            if not broken:
+                try:
+                    connection.rollback()
+                except Exception:
+                    broken = True
+            if broken:
+                self._close(connection)
+                with self._lock:
+                    self.stats['broken'] += 1
+                return
+            with self._lock:
+                self._idle.append((connection, created_at, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _execute(self, func, args, kwargs):
+        connection, created_at = self._acquire()
+        with self._lock:
+            self.stats['in_use'] += 1
+        broken = False
+        try:
+            return func(*args, connection=connection, **kwargs)
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            broken = True
+            raise
+        finally:
+            with self._lock:
+                self.stats['in_use'] -= 1
+            self._release(connection, created_at, broken)
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行同步函数，连接通过connection关键字参数传入
+
+        Args:
+            func: 同步数据库操作函数，签名需包含connection参数
+            *args, **kwargs: 传给func的其他参数
+
+        Returns:
+            func的返回值
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._execute, func, args, kwargs))
+
+    def get_stats(self):
+        """获取连接池统计信息"""
+        with self._lock:
+            return dict(self.stats, idle=len(self._idle), max_size=self.max_size)
+
+    def close(self):
+        """关闭所有空闲连接并停止线程池"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            while self._idle:
+                self._close(self._idle.pop()[0])
@@ -13,6 +13,31 @@ import mysql.connector
 import sys
 
 
+def upgrade_tables(cursor):
+    """补充旧版本数据库缺少的字段和索引，可重复执行；kubedoor-master启动时也会调用
+
+    Args:
+        cursor: 数据库游标
+    """
+    # 旧版本的vs_global没有route_count字段，补充字段后按路由表回填
+    try:
+        cursor.execute("ALTER TABLE vs_global ADD COLUMN route_count INT NOT NULL DEFAULT 0 AFTER df_forward_timeout")
+        cursor.execute(
+            "UPDATE vs_global v SET route_count = (SELECT COUNT(*) FROM vs_http_routes r WHERE r.vs_global_id = v.id)"
+        )
+    except mysql.connector.Error as e:
+        if e.errno != mysql.connector.errorcode.ER_DUP_FIELDNAME:
+            raise e
+
+    # VS列表按名称/host搜索使用的ngram全文索引；停用词表会过滤掉in、on等常见片段，建索引时关闭
+    try:
+        cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+        cursor.execute("CREATE FULLTEXT INDEX ft_vs_global_name_hosts ON vs_global(name, hosts) WITH PARSER ngram")
+    except mysql.connector.Error as e:
+        if e.errno != mysql.connector.errorcode.ER_DUP_KEYNAME:
+            raise e
+
+
 class VirtualServiceDB:
     def __init__(
         self,
@@ -95,6 +120,7 @@ class VirtualServiceDB:
             df_forward_type VARCHAR(20),  -- 默认路由类型: 'route' 或 'delegate'
             df_forward_detail TEXT,  -- 默认路由详情: JSON格式
             df_forward_timeout VARCHAR(50),  -- 默认路由超时设置
+            route_count INT NOT NULL DEFAULT 0,  -- 路由数量，增删路由时在同一事务中更新
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             UNIQUE KEY unique_name_namespace (name, namespace),
@@ -159,6 +185,8 @@ class VirtualServiceDB:
             if e.errno != mysql.connector.errorcode.ER_DUP_KEYNAME:
                 raise e
 
+        upgrade_tables(cursor)
+
         self.conn.commit()
         
         # 验证表是否创建成功
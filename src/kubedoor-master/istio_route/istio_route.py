@@ -6,7 +6,11 @@ Istio VirtualService 路由管理函数库
 提供数据库操作和业务逻辑函数，供 kubedoor-master.py 调用
 """
 
+import re
+import copy
 import json
+import time
+import hashlib
 from typing import Dict, Any, Optional, List
 import os
 from datetime import datetime
@@ -14,6 +18,10 @@ import mysql.connector
 from pydantic import BaseModel, Field
 from aiohttp import web
 from loguru import logger
+from utils import DB_POOL_MIN, DB_POOL_MAX, DB_POOL_RECYCLE, VS_JSON_CACHE_TTL
+from istio_route.db_pool import MySQLPool
+from istio_route.init_database import upgrade_tables
+from istio_route.route_simulator import RouteMatcher, parse_request
 
 
 def datetime_serializer(obj):
@@ -159,81 +167,233 @@ class MessageResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
 
 
-async def connect_database():
-    """连接数据库"""
-    try:
-        connection = mysql.connector.connect(
-            host=db_host,
-            port=db_port,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-            charset='utf8mb4',
-            autocommit=False,
+_db_pool = None
+
+
+def get_db_pool() -> MySQLPool:
+    """获取数据库连接池（首次调用时创建）"""
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = MySQLPool(
+            {'host': db_host, 'port': db_port, 'user': db_user, 'password': db_password, 'database': db_name},
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            recycle=DB_POOL_RECYCLE,
         )
-        return connection
+    return _db_pool
+
+
+def close_db_pool() -> None:
+    """关闭数据库连接池，释放线程池和空闲连接"""
+    global _db_pool
+    if _db_pool is not None:
+        _db_pool.close()
+        _db_pool = None
+
+
+async def run_db(func, *args, **kwargs):
+    """在数据库线程池中执行同步数据库操作，不阻塞事件循环"""
+    return await get_db_pool().run(func, *args, **kwargs)
+
+
+# 数据库实际具备的可选字段和索引，启动时由ensure_schema确认；
+# 旧版本数据库未能补充时，VS列表改为实时统计路由数、搜索只用LIKE
+_schema_features = None
+
+
+def schema_features(connection) -> Dict[str, bool]:
+    """获取数据库是否具备route_count字段和VS搜索全文索引（首次调用时查询）"""
+    global _schema_features
+    if _schema_features is None:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'vs_global' AND COLUMN_NAME = 'route_count'"
+        )
+        route_count = cursor.fetchone()[0] > 0
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'vs_global' AND INDEX_NAME = 'ft_vs_global_name_hosts'"
+        )
+        fulltext = cursor.fetchone()[0] > 0
+        _schema_features = {'route_count': route_count, 'fulltext': fulltext}
+    return _schema_features
+
+
+def ensure_schema(connection):
+    """启动时补充旧版本数据库缺少的字段和索引，失败时记录日志并按实际表结构降级"""
+    global _schema_features
+    cursor = connection.cursor()
+    try:
+        upgrade_tables(cursor)
+        connection.commit()
     except mysql.connector.Error as e:
-        if e.errno == mysql.connector.errorcode.ER_BAD_DB_ERROR:
-            # 数据库不存在，先创建数据库
-            temp_conn = mysql.connector.connect(
-                host=db_host, port=db_port, user=db_user, password=db_password, charset='utf8mb4'
-            )
-            cursor = temp_conn.cursor()
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            temp_conn.commit()
-            cursor.close()
-            temp_conn.close()
-
-            # 重新连接到新创建的数据库
-            connection = mysql.connector.connect(
-                host=db_host,
-                port=db_port,
-                user=db_user,
-                password=db_password,
-                database=db_name,
-                charset='utf8mb4',
-                autocommit=False,
-            )
-            return connection
-        else:
-            raise e
+        connection.rollback()
+        logger.error(f"Istio Route 数据库表结构升级失败: {e}")
+    _schema_features = None
+    features = schema_features(connection)
+    logger.info(f"Istio Route 数据库表结构检查完成: {features}")
+    return features
+
+
+def check_database(connection):
+    """检查数据库连接是否可用"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1")
+    cursor.fetchall()
+    return True
 
 
-async def close_database(connection):
-    """关闭数据库连接"""
-    if connection and connection.is_connected():
-        connection.close()
+def vs_exists(vs_id: int, connection):
+    """检查VirtualService是否存在"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT id FROM vs_global WHERE id = %s", (vs_id,))
+    return cursor.fetchone() is not None
+
+
+# 路由优先级间隔，新路由和重新整理后的优先级都是它的倍数，移动路由时在相邻优先级的间隔中取中间值
+PRIORITY_STEP = 10
+# VS列表分页时每页的最大条数
+VS_LIST_MAX_LIMIT = 500
+
 
+def refresh_route_counts(cursor, vs_ids: List[int]) -> None:
+    """按路由表重新计算vs_global.route_count，在增删路由的同一事务中调用，数据库没有该字段时跳过
 
-async def reorder_route_priorities(vs_global_id: int, connection):
+    Args:
+        cursor: 数据库游标
+        vs_ids: 路由有增删的VirtualService ID列表
+    """
+    if _schema_features is not None and not _schema_features['route_count']:
+        return
+    vs_ids = sorted(set(vs_ids))
+    for start in range(0, len(vs_ids), SYNC_BATCH_SIZE):
+        chunk = vs_ids[start : start + SYNC_BATCH_SIZE]
+        cursor.execute(
+            f"""
+        UPDATE vs_global v
+        SET route_count = (SELECT COUNT(*) FROM vs_http_routes r WHERE r.vs_global_id = v.id)
+        WHERE v.id IN ({', '.join(['%s'] * len(chunk))})
+        """,
+            chunk,
+        )
+
+
+def renumber_priorities(cursor, ordered_routes: List[Dict[str, Any]]) -> int:
+    """按给定顺序以PRIORITY_STEP为间隔重新编号，只用一条CASE语句更新优先级有变化的行
+
+    Args:
+        cursor: 数据库游标
+        ordered_routes: 按目标顺序排列的路由，需包含id和priority
+
+    Returns:
+        int: 更新的行数
+    """
+    changes = [
+        (route['id'], (index + 1) * PRIORITY_STEP)
+        for index, route in enumerate(ordered_routes)
+        if route['priority'] != (index + 1) * PRIORITY_STEP
+    ]
+    if not changes:
+        return 0
+    cursor.execute(
+        f"""
+    UPDATE vs_http_routes SET priority = CASE id {' '.join(['WHEN %s THEN %s'] * len(changes))} END
+    WHERE id IN ({', '.join(['%s'] * len(changes))})
+    """,
+        [value for change in changes for value in change] + [route_id for route_id, _ in changes],
+    )
+    return len(changes)
+
+
+def reorder_route_priorities(vs_global_id: int, connection):
     """重新整理路由规则的优先级，确保连续性"""
     cursor = connection.cursor(dictionary=True)
 
     # 获取所有路由规则，按当前优先级排序
     cursor.execute(
         """
-    SELECT id FROM vs_http_routes WHERE vs_global_id = %s ORDER BY priority ASC, id ASC
+    SELECT id, priority FROM vs_http_routes WHERE vs_global_id = %s ORDER BY priority ASC, id ASC
     """,
         (vs_global_id,),
     )
 
     routes = cursor.fetchall()
 
-    # 重新分配优先级
-    for index, route in enumerate(routes):
-        new_priority = (index + 1) * 10  # 使用10的倍数，便于后续插入
-        cursor.execute(
-            """
-        UPDATE vs_http_routes SET priority = %s WHERE id = %s
-        """,
-            (new_priority, route['id']),
-        )
+    # 重新分配优先级，使用10的倍数，便于后续插入
+    updated = renumber_priorities(cursor, routes)
 
     connection.commit()
-    print(f"已重新整理 {len(routes)} 条路由规则的优先级")
+    logger.info(f"已重新整理 {len(routes)} 条路由规则的优先级，更新 {updated} 条")
 
 
-async def insert_route_with_priority(
+def move_route(route_id: int, connection, before_id: int = None, after_id: int = None):
+    """移动路由到指定路由之前或之后
+
+    新优先级取相邻两条路由优先级的中间值，只更新被移动的一行；
+    相邻优先级之间没有间隔时，按新顺序整体重新编号（一条CASE语句）
+
+    Args:
+        route_id: 被移动的路由ID
+        connection: 数据库连接
+        before_id: 移动到该路由之前
+        after_id: 移动到该路由之后（两者都不传时移动到最后）
+
+    Returns:
+        tuple: (VirtualService ID, 移动后的优先级)
+    """
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(
+        """
+    SELECT r.id, r.vs_global_id, r.priority FROM vs_http_routes r
+    INNER JOIN vs_http_routes m ON m.vs_global_id = r.vs_global_id
+    WHERE m.id = %s ORDER BY r.priority ASC, r.id ASC
+    """,
+        (route_id,),
+    )
+    routes = cursor.fetchall()
+    moving = next((route for route in routes if route['id'] == route_id), None)
+    if moving is None:
+        raise ValueError("HTTP路由不存在")
+    others = [route for route in routes if route['id'] != route_id]
+    ids = [route['id'] for route in others]
+
+    # 目标位置：移动后排在others[index]之前
+    target_id = before_id if before_id is not None else after_id
+    if target_id is None:
+        index = len(others)
+    elif target_id not in ids:
+        raise ValueError(f"目标路由 {target_id} 不属于同一个VirtualService")
+    else:
+        index = ids.index(target_id) + (0 if before_id is not None else 1)
+
+    lower = others[index - 1]['priority'] if index > 0 else 0
+    upper = others[index]['priority'] if index < len(others) else None
+    if upper is None:
+        new_priority = lower + PRIORITY_STEP
+    elif upper - lower >= 2:
+        new_priority = (lower + upper) // 2
+    else:
+        new_priority = None
+
+    if new_priority is not None:
+        if new_priority != moving['priority']:
+            cursor.execute(
+                "UPDATE vs_http_routes SET priority = %s, updated_at = %s WHERE id = %s",
+                (new_priority, datetime.now(), route_id),
+            )
+    else:
+        # 间隔已用完，整体重新编号
+        ordered = others[:index] + [moving] + others[index:]
+        renumber_priorities(cursor, ordered)
+        new_priority = (index + 1) * PRIORITY_STEP
+        logger.info(f"路由优先级间隔已用完，已重新编号 {len(ordered)} 条路由规则")
+
+    connection.commit()
+    return moving['vs_global_id'], new_priority
+
+
+def insert_route_with_priority(
     vs_global_id: int, route_data: Dict[str, Any], priority: int = None, connection=None
 ):
     """插入路由规则
@@ -246,46 +406,48 @@ async def insert_route_with_priority(
     """
     cursor = connection.cursor(dictionary=True)
 
-    # 如果没有传入priority，自动追加到最后
+    values = (
+        route_data.get('name'),
+        route_data.get('match_rules'),
+        route_data.get('rewrite_rules'),
+        route_data['forward_type'],
+        route_data['forward_detail'],
+        route_data.get('timeout'),
+    )
+
     if priority is None:
+        # 没有传入priority，自动追加到最后，最大优先级在同一条语句中计算
         cursor.execute(
-            "SELECT MAX(priority) as max_priority FROM vs_http_routes WHERE vs_global_id = %s", (vs_global_id,)
+            """
+        INSERT INTO vs_http_routes
+        (vs_global_id, priority, name, match_rules, rewrite_rules, forward_type, forward_detail, timeout)
+        SELECT %s, COALESCE(MAX(priority), 0) + %s, %s, %s, %s, %s, %s, %s
+        FROM vs_http_routes WHERE vs_global_id = %s
+        """,
+            (vs_global_id, PRIORITY_STEP) + values + (vs_global_id,),
         )
-        result = cursor.fetchone()
-        priority = (result['max_priority'] or 0) + 10
     else:
-        # 检查priority是否已存在
+        # 指定了priority，仅在该优先级不存在时插入
         cursor.execute(
-            "SELECT id FROM vs_http_routes WHERE vs_global_id = %s AND priority = %s", (vs_global_id, priority)
+            """
+        INSERT INTO vs_http_routes
+        (vs_global_id, priority, name, match_rules, rewrite_rules, forward_type, forward_detail, timeout)
+        SELECT %s, %s, %s, %s, %s, %s, %s, %s FROM DUAL
+        WHERE NOT EXISTS (SELECT 1 FROM vs_http_routes WHERE vs_global_id = %s AND priority = %s)
+        """,
+            (vs_global_id, priority) + values + (vs_global_id, priority),
         )
-        if cursor.fetchone():
+        if cursor.rowcount == 0:
             raise ValueError(f"Priority {priority} already exists")
 
-    # 插入新路由规则
-    cursor.execute(
-        """
-    INSERT INTO vs_http_routes 
-    (vs_global_id, name, priority, match_rules, rewrite_rules, forward_type, forward_detail, timeout)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """,
-        (
-            vs_global_id,
-            route_data.get('name'),
-            priority,
-            route_data.get('match_rules'),
-            route_data.get('rewrite_rules'),
-            route_data['forward_type'],
-            route_data['forward_detail'],
-            route_data.get('timeout'),
-        ),
-    )
-
+    route_id = cursor.lastrowid
+    refresh_route_counts(cursor, [vs_global_id])
     connection.commit()
-    print(f"已插入新的路由规则，优先级: {priority}")
-    return cursor.lastrowid
+    logger.info(f"已插入新的路由规则，ID: {route_id}")
+    return route_id
 
 
-async def get_routes_by_priority(vs_global_id: int, connection):
+def get_routes_by_priority(vs_global_id: int, connection):
     """获取路由规则列表，按优先级排序"""
     cursor = connection.cursor(dictionary=True)
 
@@ -304,7 +466,30 @@ async def get_routes_by_priority(vs_global_id: int, connection):
     return routes
 
 
-async def generate_virtualservice_json(vs_id: int, connection) -> Optional[Dict[str, Any]]:
+def load_simulation_routes(vs_id: int, connection) -> Optional[List[Dict[str, Any]]]:
+    """按优先级加载路由匹配模拟使用的路由列表，配置了默认路由时追加在最后
+
+    Returns:
+        list: [{"id", "name", "priority", "match"}]，VS不存在时返回None
+    """
+    global_config = get_vs_by_id(vs_id, connection)
+    if not global_config:
+        return None
+    routes = [
+        {
+            "id": route['id'],
+            "name": route['name'],
+            "priority": route['priority'],
+            "match": json.loads(route['match_rules']) if route['match_rules'] else None,
+        }
+        for route in get_routes_by_priority(vs_id, connection)
+    ]
+    if global_config['df_forward_type'] and global_config['df_forward_detail']:
+        routes.append({"id": None, "name": "default", "priority": None, "match": None})
+    return routes
+
+
+def generate_virtualservice_json(vs_id: int, connection) -> Optional[Dict[str, Any]]:
     """根据vs_id生成VirtualService JSON配置"""
     cursor = connection.cursor(dictionary=True)
 
@@ -393,11 +578,65 @@ async def generate_virtualservice_json(vs_id: int, connection) -> Optional[Dict[
     return vs_config
 
 
+class VSJsonCache:
+    """渲染后的VirtualService JSON缓存
+
+    按vs_id缓存generate_virtualservice_json的结果，VS或路由的增删改都会使对应vs_id的版本号递增并清除缓存；
+    渲染期间如果版本号发生变化则丢弃本次结果，TTL用于兜底直接修改数据库的情况
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries: Dict[int, tuple] = {}  # vs_id -> (version, rendered_at, vs_config)
+        self._versions: Dict[int, int] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def version(self, vs_id: int) -> int:
+        return self._versions.get(vs_id, 0)
+
+    def get(self, vs_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(vs_id)
+        if entry and entry[0] == self.version(vs_id) and time.monotonic() - entry[1] < self.ttl:
+            self.stats['hits'] += 1
+            return copy.deepcopy(entry[2])
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, vs_id: int, version: int, vs_config: Dict[str, Any]) -> None:
+        if version == self.version(vs_id):
+            self._entries[vs_id] = (version, time.monotonic(), copy.deepcopy(vs_config))
+
+    def invalidate(self, vs_id: Optional[int]) -> None:
+        if vs_id is None:
+            return
+        self._versions[vs_id] = self.version(vs_id) + 1
+        self._entries.pop(vs_id, None)
+        self.stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, entries=len(self._entries))
+
+
+vs_json_cache = VSJsonCache(VS_JSON_CACHE_TTL)
+
+
+async def get_virtualservice_json(vs_id: int) -> Optional[Dict[str, Any]]:
+    """获取VirtualService JSON配置，优先使用缓存，未命中时查询数据库渲染"""
+    vs_config = vs_json_cache.get(vs_id)
+    if vs_config is not None:
+        return vs_config
+    version = vs_json_cache.version(vs_id)
+    vs_config = await run_db(generate_virtualservice_json, vs_id)
+    if vs_config is not None:
+        vs_json_cache.put(vs_id, version, vs_config)
+    return vs_config
+
+
 # ==================== K8S数据同步函数 ====================
 async def sync_vs_from_k8s(cluster_name: str, vs_data_list: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
-    将从K8S采集到的VirtualService数据写入数据库
-    包含清理现有数据和同步新数据的完整流程
+    将从K8S采集到的VirtualService数据增量同步到数据库
+    按VS和路由的内容摘要与已存储的数据比对，只写入变化的行，未变化的VS和路由保留原ID
 
     Args:
         cluster_name: K8S集群名称
@@ -409,193 +648,292 @@ async def sync_vs_from_k8s(cluster_name: str, vs_data_list: List[Dict[str, Any]]
     Raises:
         Exception: 当同步过程中发生错误时抛出异常
     """
-    connection = await connect_database()
-    if not connection:
-        logger.error("数据库连接失败")
-        return safe_json_response({"error": "数据库连接失败"}, status=500)
-    cursor = None
-    processed_count = 0
+    result = await run_db(_sync_vs_from_k8s, cluster_name, vs_data_list)
+    for vs_id in result.pop('changed_vs_ids', []):
+        vs_json_cache.invalidate(vs_id)
+    return result
 
-    try:
-        # 开启事务
-        connection.start_transaction()
-        cursor = connection.cursor(dictionary=True)
 
-        # ========== 清理现有数据逻辑 ==========
-        logger.info(f"开始清理集群 '{cluster_name}' 的现有数据")
+# 参与比对的VS字段和路由字段（不含priority，路由顺序由列表顺序体现）
+VS_SYNC_COLUMNS = ('gateways', 'hosts', 'protocol', 'df_forward_type', 'df_forward_detail', 'df_forward_timeout')
+ROUTE_SYNC_COLUMNS = ('name', 'match_rules', 'rewrite_rules', 'forward_type', 'forward_detail', 'timeout')
+SYNC_BATCH_SIZE = 500
 
-        # 1. 查找指定集群的所有vs_id
-        cursor.execute("SELECT vs_id FROM k8s_cluster WHERE k8s_name = %s", (cluster_name,))
-        cluster_records = cursor.fetchall()
 
-        if cluster_records:
-            vs_ids = [record['vs_id'] for record in cluster_records]
-            vs_ids_str = ','.join(map(str, vs_ids))
-            logger.info(f"找到集群 '{cluster_name}' 关联的VirtualService ID: {vs_ids}")
+def content_hash(row: Dict[str, Any], columns) -> str:
+    """计算指定字段的内容摘要"""
+    return hashlib.md5(json.dumps([row.get(c) for c in columns], ensure_ascii=False).encode('utf-8')).hexdigest()
 
-            # 查询这些VS ID关联的所有集群（因为VS ID和集群是多对多关系）
-            cursor.execute(
-                f"SELECT k8s_name, COUNT(*) as count FROM k8s_cluster WHERE vs_id IN ({vs_ids_str}) GROUP BY k8s_name",
+
+def parse_k8s_vs(vs_data: Dict[str, Any]):
+    """将K8S中的VirtualService转换为数据库行格式
+
+    有match的HTTP路由写入vs_http_routes，第一个没有match的路由作为vs_global的默认路由
+
+    Returns:
+        tuple: (vs_global行, 按顺序排列的vs_http_routes行列表)
+    """
+    spec = vs_data.get('spec', {})
+    vs_row = {
+        'gateways': json.dumps(spec.get('gateways', [])),
+        'hosts': json.dumps(spec.get('hosts', [])),
+        'protocol': 'http',
+        'df_forward_type': None,
+        'df_forward_detail': None,
+        'df_forward_timeout': None,
+    }
+    routes = []
+    default_route_found = False
+    for route_data in spec.get('http', []):
+        # 确定forward_type和forward_detail
+        if 'route' in route_data:
+            forward_type, forward_detail = 'route', json.dumps(route_data['route'])
+        elif 'delegate' in route_data:
+            forward_type, forward_detail = 'delegate', json.dumps(route_data['delegate'])
+        else:
+            continue
+
+        if 'match' in route_data:
+            routes.append(
+                {
+                    'name': route_data.get('name'),
+                    'match_rules': json.dumps(route_data.get('match', [])),
+                    'rewrite_rules': json.dumps(route_data.get('rewrite')) if route_data.get('rewrite') else None,
+                    'forward_type': forward_type,
+                    'forward_detail': forward_detail,
+                    'timeout': route_data.get('timeout'),
+                }
             )
-            affected_clusters = cursor.fetchall()
-            affected_cluster_info = {cluster['k8s_name']: cluster['count'] for cluster in affected_clusters}
-
-            # 2. 删除vs_http_routes表中的相关数据
-            delete_routes_sql = f"DELETE FROM vs_http_routes WHERE vs_global_id IN ({vs_ids_str})"
-            cursor.execute(delete_routes_sql)
-            routes_deleted = cursor.rowcount
-            logger.info(f"删除了 {routes_deleted} 条HTTP路由记录")
-
-            # 3. 删除vs_global表中的相关数据
-            delete_global_sql = f"DELETE FROM vs_global WHERE id IN ({vs_ids_str})"
-            cursor.execute(delete_global_sql)
-            global_deleted = cursor.rowcount
-            logger.info(f"删除了 {global_deleted} 条全局配置记录")
-
-            # 4. 删除k8s_cluster表中的相关数据
-            delete_cluster_sql = f"DELETE FROM k8s_cluster WHERE vs_id IN ({vs_ids_str})"
-            cursor.execute(delete_cluster_sql)
-            cluster_deleted = cursor.rowcount
-
-            # 按集群分别显示删除的记录数
-            for cluster_name_affected, record_count in affected_cluster_info.items():
-                logger.info(f"{cluster_name_affected} 集群删除了 {record_count} 条关联记录")
+        elif not default_route_found:  # 只处理第一个默认路由
+            vs_row.update(
+                df_forward_type=forward_type,
+                df_forward_detail=forward_detail,
+                df_forward_timeout=route_data.get('timeout'),
+            )
+            default_route_found = True
+    return vs_row, routes
+
+
+def diff_routes(vs_id: int, stored_routes: List[Dict[str, Any]], new_routes: List[Dict[str, Any]]):
+    """比对一个VS的路由，返回需要upsert的行和需要删除的路由ID
+
+    内容未变化的路由保留原ID（仅在顺序变化时更新priority），内容变化的路由复用剩余的原记录ID
+
+    Returns:
+        tuple: (upsert行列表, 删除ID列表, 插入数, 更新数)
+    """
+    by_hash = {}
+    for route in stored_routes:
+        by_hash.setdefault(content_hash(route, ROUTE_SYNC_COLUMNS), []).append(route)
+
+    upserts, unmatched, matched_ids = [], [], set()
+    updated = 0
+    for index, route in enumerate(new_routes):
+        priority = (index + 1) * PRIORITY_STEP
+        candidates = by_hash.get(content_hash(route, ROUTE_SYNC_COLUMNS))
+        if candidates:
+            old = candidates.pop(0)
+            matched_ids.add(old['id'])
+            if old['priority'] != priority:
+                upserts.append(route_upsert_row(old['id'], vs_id, priority, route))
+                updated += 1
         else:
-            logger.info(f"集群 '{cluster_name}' 没有找到相关数据")
+            unmatched.append((priority, route))
 
-        logger.info(f"集群 '{cluster_name}' 数据清理完成，开始同步新数据")
+    leftovers = [route for route in stored_routes if route['id'] not in matched_ids]
+    for (priority, route), old in zip(unmatched, leftovers):
+        upserts.append(route_upsert_row(old['id'], vs_id, priority, route))
+        updated += 1
+    inserted = 0
+    for priority, route in unmatched[len(leftovers) :]:
+        upserts.append(route_upsert_row(None, vs_id, priority, route))
+        inserted += 1
+    deletes = [old['id'] for old in leftovers[len(unmatched) :]]
+    return upserts, deletes, inserted, updated
 
-        # ========== 同步新数据逻辑 ==========
 
-        logger.info(f"开始同步集群 '{cluster_name}' 的VirtualService数据，共 {len(vs_data_list)} 个")
+def route_upsert_row(route_id, vs_id, priority, route):
+    return (route_id, vs_id, route['name'], priority) + tuple(route[c] for c in ROUTE_SYNC_COLUMNS[1:])
 
-        for vs_data in vs_data_list:
-            try:
-                # 提取基本信息
-                vs_name = vs_data.get('name')
-                vs_namespace = vs_data.get('namespace', 'default')
-                spec = vs_data.get('spec', {})
 
-                # 1. 检查是否已存在相同name+namespace的记录
-                cursor.execute("SELECT id FROM vs_global WHERE name = %s AND namespace = %s", (vs_name, vs_namespace))
-                existing_record = cursor.fetchone()
+def executemany_batched(cursor, sql: str, rows: List[tuple]):
+    """分批执行executemany，避免单条语句超过max_allowed_packet"""
+    for start in range(0, len(rows), SYNC_BATCH_SIZE):
+        cursor.executemany(sql, rows[start : start + SYNC_BATCH_SIZE])
 
-                if existing_record:
-                    return {
-                        "success": False,
-                        "error": f"VirtualService '{vs_name}' 在命名空间 '{vs_namespace}' 中已存在，ID: {existing_record['id']}",
-                    }
 
-                # 2. 写入vs_global表
-                gateways = json.dumps(spec.get('gateways', []))
-                hosts = json.dumps(spec.get('hosts', []))
+def _sync_vs_from_k8s(cluster_name: str, vs_data_list: List[Dict[str, Any]], connection) -> Dict[str, Any]:
+    """在数据库线程中执行的增量同步逻辑，见sync_vs_from_k8s"""
+    cursor = None
+    stats = {
+        'created': 0,
+        'updated': 0,
+        'deleted': 0,
+        'unchanged': 0,
+        'routes_inserted': 0,
+        'routes_updated': 0,
+        'routes_deleted': 0,
+    }
 
-                cursor.execute(
-                    """
-                    INSERT INTO vs_global (name, namespace, gateways, hosts, protocol)
-                    VALUES (%s, %s, %s, %s, %s)
-                    """,
-                    (vs_name, vs_namespace, gateways, hosts, 'http'),
-                )
+    try:
+        # 开启事务
+        connection.start_transaction()
+        cursor = connection.cursor(dictionary=True)
+
+        incoming = {}
+        for vs_data in vs_data_list:
+            incoming[(vs_data.get('name'), vs_data.get('namespace', 'default'))] = parse_k8s_vs(vs_data)
+
+        # ========== 读取已存储的数据 ==========
+        cursor.execute(
+            f"""
+            SELECT v.id, v.name, v.namespace, {', '.join('v.' + c for c in VS_SYNC_COLUMNS)}
+            FROM vs_global v INNER JOIN k8s_cluster k ON v.id = k.vs_id
+            WHERE k.k8s_name = %s
+            """,
+            (cluster_name,),
+        )
+        stored = {(row['name'], row['namespace']): row for row in cursor.fetchall()}
+        stored_routes = {}
+        if stored:
+            vs_ids = [row['id'] for row in stored.values()]
+            cursor.execute(
+                f"""
+                SELECT id, vs_global_id, priority, {', '.join(ROUTE_SYNC_COLUMNS)}
+                FROM vs_http_routes WHERE vs_global_id IN ({', '.join(['%s'] * len(vs_ids))})
+                ORDER BY priority ASC, id ASC
+                """,
+                vs_ids,
+            )
+            for route in cursor.fetchall():
+                stored_routes.setdefault(route['vs_global_id'], []).append(route)
 
-                vs_global_id = cursor.lastrowid
-                logger.info(f"创建VirtualService '{vs_name}' (ID: {vs_global_id})")
+        # 新增的VS不能与其他集群已有的同名VS冲突
+        new_keys = [key for key in incoming if key not in stored]
+        if new_keys:
+            cursor.execute(
+                f"SELECT id, name, namespace FROM vs_global WHERE (name, namespace) IN "
+                f"({', '.join(['(%s, %s)'] * len(new_keys))}) LIMIT 1",
+                [value for key in new_keys for value in key],
+            )
+            existing_record = cursor.fetchone()
+            if existing_record:
+                connection.rollback()
+                return {
+                    "success": False,
+                    "error": f"VirtualService '{existing_record['name']}' 在命名空间 '{existing_record['namespace']}' 中已存在，ID: {existing_record['id']}",
+                }
+
+        # ========== 比对VS ==========
+        vs_upserts, changed = [], []
+        for key, (vs_row, routes) in incoming.items():
+            old = stored.get(key)
+            if old is not None:
+                old_hash = content_hash(old, VS_SYNC_COLUMNS) + ''.join(
+                    content_hash(route, ROUTE_SYNC_COLUMNS) for route in stored_routes.get(old['id'], [])
+                )
+                new_hash = content_hash(vs_row, VS_SYNC_COLUMNS) + ''.join(
+                    content_hash(route, ROUTE_SYNC_COLUMNS) for route in routes
+                )
+                if old_hash == new_hash:
+                    stats['unchanged'] += 1
+                    continue
+                if content_hash(old, VS_SYNC_COLUMNS) != content_hash(vs_row, VS_SYNC_COLUMNS):
+                    vs_upserts.append(key + tuple(vs_row[c] for c in VS_SYNC_COLUMNS))
+                stats['updated'] += 1
+            else:
+                vs_upserts.append(key + tuple(vs_row[c] for c in VS_SYNC_COLUMNS))
+                stats['created'] += 1
+            changed.append(key)
+
+        executemany_batched(
+            cursor,
+            f"""
+            INSERT INTO vs_global (name, namespace, {', '.join(VS_SYNC_COLUMNS)})
+            VALUES ({', '.join(['%s'] * (len(VS_SYNC_COLUMNS) + 2))})
+            ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in VS_SYNC_COLUMNS)}
+            """,
+            vs_upserts,
+        )
 
-                # 3. 写入k8s_cluster表
+        # 新增VS的ID及集群关联
+        vs_ids = {key: row['id'] for key, row in stored.items()}
+        if stats['created']:
+            created_keys = [key for key in changed if key not in stored]
+            for start in range(0, len(created_keys), SYNC_BATCH_SIZE):
+                chunk = created_keys[start : start + SYNC_BATCH_SIZE]
                 cursor.execute(
-                    """
-                    INSERT INTO k8s_cluster (k8s_name, vs_id)
-                    VALUES (%s, %s)
-                    """,
-                    (cluster_name, vs_global_id),
+                    f"SELECT id, name, namespace FROM vs_global WHERE (name, namespace) IN "
+                    f"({', '.join(['(%s, %s)'] * len(chunk))})",
+                    [value for key in chunk for value in key],
                 )
+                vs_ids.update({(row['name'], row['namespace']): row['id'] for row in cursor.fetchall()})
+            executemany_batched(
+                cursor,
+                "INSERT INTO k8s_cluster (k8s_name, vs_id) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE updated_at = CURRENT_TIMESTAMP",
+                [(cluster_name, vs_ids[key]) for key in created_keys],
+            )
 
-                # 4. 处理HTTP路由规则
-                http_routes = spec.get('http', [])
-                default_route_found = False
-                priority_counter = 10  # 优先级计数器，从10开始
-
-                for route_data in http_routes:
-                    # 检查是否有match字段
-                    if 'match' in route_data:
-                        # 有match字段，写入vs_http_routes表
-                        route_name = route_data.get('name')
-                        match_rules = json.dumps(route_data.get('match', []))
-                        rewrite_rules = json.dumps(route_data.get('rewrite')) if route_data.get('rewrite') else None
-                        timeout = route_data.get('timeout')
-
-                        # 确定forward_type和forward_detail
-                        forward_type = None
-                        forward_detail = None
-
-                        if 'route' in route_data:
-                            forward_type = 'route'
-                            forward_detail = json.dumps(route_data['route'])
-                        elif 'delegate' in route_data:
-                            forward_type = 'delegate'
-                            forward_detail = json.dumps(route_data['delegate'])
-
-                        if forward_type:
-                            cursor.execute(
-                                """
-                                INSERT INTO vs_http_routes 
-                                (vs_global_id, name, priority, match_rules, rewrite_rules, forward_type, forward_detail, timeout)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                """,
-                                (
-                                    vs_global_id,
-                                    route_name,
-                                    priority_counter,
-                                    match_rules,
-                                    rewrite_rules,
-                                    forward_type,
-                                    forward_detail,
-                                    timeout,
-                                ),
-                            )
-                            logger.debug(f"添加HTTP路由规则: {route_name or 'unnamed'} (优先级: {priority_counter})")
-                            priority_counter += 10  # 优先级递增10
-                    else:
-                        # 没有match字段，更新vs_global表的默认路由
-                        if not default_route_found:  # 只处理第一个默认路由
-                            df_forward_type = None
-                            df_forward_detail = None
-                            df_timeout = route_data.get('timeout')
-
-                            if 'route' in route_data:
-                                df_forward_type = 'route'
-                                df_forward_detail = json.dumps(route_data['route'])
-                            elif 'delegate' in route_data:
-                                df_forward_type = 'delegate'
-                                df_forward_detail = json.dumps(route_data['delegate'])
-
-                            if df_forward_type:
-                                cursor.execute(
-                                    """
-                                    UPDATE vs_global 
-                                    SET df_forward_type = %s, df_forward_detail = %s, df_forward_timeout = %s
-                                    WHERE id = %s
-                                    """,
-                                    (df_forward_type, df_forward_detail, df_timeout, vs_global_id),
-                                )
-                                logger.debug(f"更新默认路由配置: {df_forward_type}")
-                                default_route_found = True
-
-                processed_count += 1
-
-            except Exception as e:
-                logger.error(f"处理VirtualService '{vs_data.get('name', 'unknown')}' 时发生错误: {e}")
-                raise e
+        # ========== 比对路由 ==========
+        route_upserts, route_deletes = [], []
+        for key in changed:
+            vs_id = vs_ids[key]
+            upserts, deletes, inserted, updated = diff_routes(vs_id, stored_routes.get(vs_id, []), incoming[key][1])
+            route_upserts.extend(upserts)
+            route_deletes.extend(deletes)
+            stats['routes_inserted'] += inserted
+            stats['routes_updated'] += updated
+
+        for start in range(0, len(route_deletes), SYNC_BATCH_SIZE):
+            chunk = route_deletes[start : start + SYNC_BATCH_SIZE]
+            cursor.execute(f"DELETE FROM vs_http_routes WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+        stats['routes_deleted'] = len(route_deletes)
+        executemany_batched(
+            cursor,
+            f"""
+            INSERT INTO vs_http_routes (id, vs_global_id, priority, {', '.join(ROUTE_SYNC_COLUMNS)})
+            VALUES ({', '.join(['%s'] * (len(ROUTE_SYNC_COLUMNS) + 3))})
+            ON DUPLICATE KEY UPDATE priority = VALUES(priority), {', '.join(f'{c} = VALUES({c})' for c in ROUTE_SYNC_COLUMNS)}
+            """,
+            route_upserts,
+        )
+        if route_upserts or route_deletes:
+            refresh_route_counts(cursor, [vs_ids[key] for key in changed])
+
+        # ========== 删除K8S中已不存在的VS ==========
+        removed_ids = [row['id'] for key, row in stored.items() if key not in incoming]
+        changed_vs_ids = [vs_ids[key] for key in changed] + removed_ids
+        if removed_ids:
+            placeholders = ', '.join(['%s'] * len(removed_ids))
+            # 只解除本集群的关联，VS仍被其他集群关联时保留
+            cursor.execute(
+                f"DELETE FROM k8s_cluster WHERE k8s_name = %s AND vs_id IN ({placeholders})",
+                [cluster_name] + removed_ids,
+            )
+            cursor.execute(
+                f"SELECT DISTINCT vs_id FROM k8s_cluster WHERE vs_id IN ({placeholders})",
+                removed_ids,
+            )
+            still_linked = {row['vs_id'] for row in cursor.fetchall()}
+            orphan_ids = [vs_id for vs_id in removed_ids if vs_id not in still_linked]
+            if orphan_ids:
+                placeholders = ', '.join(['%s'] * len(orphan_ids))
+                cursor.execute(f"DELETE FROM vs_http_routes WHERE vs_global_id IN ({placeholders})", orphan_ids)
+                cursor.execute(f"DELETE FROM vs_global WHERE id IN ({placeholders})", orphan_ids)
+            stats['deleted'] = len(removed_ids)
 
         # 提交事务
         connection.commit()
-        logger.info(f"集群 '{cluster_name}' VirtualService数据同步完成，共处理 {processed_count} 个")
+        logger.info(f"集群 '{cluster_name}' VirtualService增量同步完成: {stats}")
 
         return {
             "success": True,
-            "message": f"成功同步 {processed_count} 个VirtualService",
-            "processed": processed_count,
+            "message": f"成功同步 {len(incoming)} 个VirtualService",
+            "processed": len(incoming),
             "cluster_name": cluster_name,
+            "stats": stats,
+            "changed_vs_ids": changed_vs_ids,
         }
 
     except mysql.connector.Error as e:
@@ -620,72 +958,93 @@ async def sync_vs_from_k8s(cluster_name: str, vs_data_list: List[Dict[str, Any]]
 
 
 # ==================== VS级别操作函数 ====================
-async def get_vs_list_by_k8s_cluster(k8s_name: str, connection, namespace: str = None):
-    """根据K8S集群名称获取关联的VirtualService列表"""
+def escape_like(value: str) -> str:
+    """转义LIKE中的通配符"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_vs_list_by_k8s_cluster(
+    k8s_name: str,
+    connection,
+    namespace: str = None,
+    search: str = None,
+    cursor_id: int = None,
+    limit: int = None,
+):
+    """根据K8S集群名称获取关联的VirtualService列表，按ID倒序（即创建时间倒序）
+
+    Args:
+        k8s_name: K8S集群名称
+        connection: 数据库连接
+        namespace: 命名空间（可选）
+        search: 按名称或host搜索（可选），通过vs_global的ngram全文索引查找
+        cursor_id: 分页游标，返回ID小于它的VS（可选）
+        limit: 每页条数（可选，不传时返回全部）
+
+    Returns:
+        tuple: (VS列表, 下一页游标)，没有下一页时游标为None
+    """
     cursor = connection.cursor(dictionary=True)
+    features = schema_features(connection)
+    route_count = (
+        "v.route_count"
+        if features['route_count']
+        else "(SELECT COUNT(*) FROM vs_http_routes r WHERE r.vs_global_id = v.id) AS route_count"
+    )
 
+    conditions = ["k.k8s_name = %s"]
+    params = [k8s_name]
     if namespace:
-        # 如果提供了namespace参数，添加namespace过滤条件
-        cursor.execute(
-            """
-            SELECT 
-                v.id,
-                v.name,
-                v.namespace,
-                v.gateways,
-                v.hosts,
-                v.protocol,
-                v.df_forward_type,
-                v.df_forward_detail,
-                v.df_forward_timeout,
-                v.created_at,
-                v.updated_at,
-                k.updated_at as relation_updated_at,
-                COALESCE(COUNT(r.id), 0) as route_count
-            FROM vs_global v
-            INNER JOIN k8s_cluster k ON v.id = k.vs_id
-            LEFT JOIN vs_http_routes r ON v.id = r.vs_global_id
-            WHERE k.k8s_name = %s AND v.namespace = %s
-            GROUP BY v.id, v.name, v.namespace, v.gateways, v.hosts, v.protocol, 
-                     v.df_forward_type, v.df_forward_detail, v.df_forward_timeout, 
-                     v.created_at, v.updated_at, k.updated_at
-            ORDER BY v.created_at DESC
-            """,
-            (k8s_name, namespace),
-        )
-    else:
-        # 如果没有提供namespace参数，查询所有namespace的VS
-        cursor.execute(
-            """
-            SELECT 
-                v.id,
-                v.name,
-                v.namespace,
-                v.gateways,
-                v.hosts,
-                v.protocol,
-                v.df_forward_type,
-                v.df_forward_detail,
-                v.df_forward_timeout,
-                v.created_at,
-                v.updated_at,
-                k.updated_at as relation_updated_at,
-                COALESCE(COUNT(r.id), 0) as route_count
-            FROM vs_global v
-            INNER JOIN k8s_cluster k ON v.id = k.vs_id
-            LEFT JOIN vs_http_routes r ON v.id = r.vs_global_id
-            WHERE k.k8s_name = %s
-            GROUP BY v.id, v.name, v.namespace, v.gateways, v.hosts, v.protocol, 
-                     v.df_forward_type, v.df_forward_detail, v.df_forward_timeout, 
-                     v.created_at, v.updated_at, k.updated_at
-            ORDER BY v.created_at DESC
-            """,
-            (k8s_name,),
-        )
-    return cursor.fetchall()
+        conditions.append("v.namespace = %s")
+        params.append(namespace)
+    if cursor_id is not None:
+        conditions.append("k.vs_id < %s")
+        params.append(cursor_id)
+    if search:
+        pattern = f"%{escape_like(search)}%"
+        # ngram分词长度为2，单个字符无法使用全文索引
+        if len(search) >= 2 and features['fulltext']:
+            conditions.append("MATCH(v.name, v.hosts) AGAINST (%s IN BOOLEAN MODE)")
+            params.append('"' + search.replace('"', '') + '"')
+        # 全文索引按分词匹配，再用LIKE精确过滤
+        conditions.append("(v.name LIKE %s OR v.hosts LIKE %s)")
+        params.extend([pattern, pattern])
+
+    sql = f"""
+        SELECT
+            v.id,
+            v.name,
+            v.namespace,
+            v.gateways,
+            v.hosts,
+            v.protocol,
+            v.df_forward_type,
+            v.df_forward_detail,
+            v.df_forward_timeout,
+            v.created_at,
+            v.updated_at,
+            k.updated_at as relation_updated_at,
+            {route_count}
+        FROM k8s_cluster k
+        INNER JOIN vs_global v ON v.id = k.vs_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY k.vs_id DESC
+        """
+    if limit is not None:
+        # 多取一条用于判断是否还有下一页
+        sql += " LIMIT %s"
+        params.append(limit + 1)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['id']
+    return rows, next_cursor
 
 
-async def create_vs(vs_request: VSCreateRequest, connection):
+def create_vs(vs_request: VSCreateRequest, connection):
     """创建VirtualService"""
     cursor = connection.cursor()
 
@@ -719,21 +1078,21 @@ async def create_vs(vs_request: VSCreateRequest, connection):
     return cursor.lastrowid
 
 
-async def get_vs_by_name(vs_name: str, namespace: str, connection):
+def get_vs_by_name(vs_name: str, namespace: str, connection):
     """根据名称获取VirtualService详情"""
     cursor = connection.cursor(dictionary=True)
     cursor.execute("SELECT * FROM vs_global WHERE name = %s AND namespace = %s", (vs_name, namespace))
     return cursor.fetchone()
 
 
-async def get_vs_by_id(vs_id: int, connection):
+def get_vs_by_id(vs_id: int, connection):
     """根据ID获取VirtualService详情"""
     cursor = connection.cursor(dictionary=True)
     cursor.execute("SELECT * FROM vs_global WHERE id = %s", (vs_id,))
     return cursor.fetchone()
 
 
-async def get_k8s_clusters_by_vs(vs_id: int, connection):
+def get_k8s_clusters_by_vs(vs_id: int, connection):
     """根据VirtualService ID获取关联的所有K8S集群"""
     cursor = connection.cursor(dictionary=True)
     cursor.execute(
@@ -751,7 +1110,7 @@ async def get_k8s_clusters_by_vs(vs_id: int, connection):
     return cursor.fetchall()
 
 
-async def add_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], connection):
+def add_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], connection):
     """为VirtualService添加K8S集群关联关系"""
     if not k8s_clusters:
         return
@@ -770,7 +1129,7 @@ async def add_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], connect
     connection.commit()
 
 
-async def update_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], connection):
+def update_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], connection):
     """编辑VirtualService的K8S集群关联关系
 
     Args:
@@ -798,7 +1157,7 @@ async def update_k8s_cluster_relations(vs_id: int, k8s_clusters: List[str], conn
     connection.commit()
 
 
-async def update_vs_by_id(vs_id: int, vs_request: VSUpdateRequest, connection):
+def update_vs_by_id(vs_id: int, vs_request: VSUpdateRequest, connection):
     """根据ID更新VirtualService"""
     cursor = connection.cursor()
 
@@ -830,7 +1189,7 @@ async def update_vs_by_id(vs_id: int, vs_request: VSUpdateRequest, connection):
     connection.commit()
 
 
-async def delete_vs(vs_name: str, namespace: str, connection):
+def delete_vs(vs_name: str, namespace: str, connection):
     """删除VirtualService"""
     cursor = connection.cursor()
 
@@ -851,7 +1210,7 @@ async def delete_vs(vs_name: str, namespace: str, connection):
     connection.commit()
 
 
-async def delete_vs_by_id(vs_id: int, connection):
+def delete_vs_by_id(vs_id: int, connection):
     """根据ID删除VirtualService"""
     cursor = connection.cursor()
 
@@ -872,9 +1231,9 @@ async def delete_vs_by_id(vs_id: int, connection):
 # ==================== HTTP路由级别操作函数 ====================
 
 
-async def create_route(vs_global_id: int, route_request: HTTPRouteCreateRequest, connection):
+def create_route(vs_global_id: int, route_request: HTTPRouteCreateRequest, connection):
     """创建HTTP路由"""
-    return await insert_route_with_priority(
+    return insert_route_with_priority(
         vs_global_id,
         {
             'name': route_request.name,
@@ -889,60 +1248,72 @@ async def create_route(vs_global_id: int, route_request: HTTPRouteCreateRequest,
     )
 
 
-async def get_route_by_id(route_id: int, connection):
+def get_route_by_id(route_id: int, connection):
     """根据ID获取HTTP路由详情"""
     cursor = connection.cursor(dictionary=True)
     cursor.execute("SELECT * FROM vs_http_routes WHERE id = %s", (route_id,))
     return cursor.fetchone()
 
 
-async def update_route(route_id: int, vs_id: int, route_request: HTTPRouteUpdateRequest, connection):
-    """更新HTTP路由"""
+def update_route(route_id: int, vs_id: int, route_request: HTTPRouteUpdateRequest, connection):
+    """更新HTTP路由，优先级冲突检查或追加到最后的最大优先级在同一条UPDATE语句中完成"""
     cursor = connection.cursor(dictionary=True)
 
     vs_global_id = vs_id
     priority = route_request.priority
+    values = (
+        route_request.name,
+        json.dumps(route_request.match_rules),
+        json.dumps(route_request.rewrite_rules) if route_request.rewrite_rules else None,
+        route_request.forward_type,
+        json.dumps(route_request.forward_detail),
+        route_request.timeout,
+        datetime.now(),
+    )
+    set_clause = """r.name = %s, r.match_rules = %s, r.rewrite_rules = %s, r.forward_type = %s,
+        r.forward_detail = %s, r.timeout = %s, r.updated_at = %s"""
 
-    # 处理优先级逻辑
     if priority is not None:
-        # 检查priority是否已存在（排除当前路由）
+        # 同一VS中已有其他路由使用该priority时不更新
         cursor.execute(
-            "SELECT id FROM vs_http_routes WHERE vs_global_id = %s AND priority = %s AND id != %s",
-            (vs_global_id, priority, route_id),
+            f"""
+        UPDATE vs_http_routes r
+        LEFT JOIN vs_http_routes c ON c.vs_global_id = %s AND c.priority = %s AND c.id != r.id
+        SET {set_clause}, r.priority = %s
+        WHERE r.id = %s AND c.id IS NULL
+        """,
+            (vs_global_id, priority) + values + (priority, route_id),
         )
-        if cursor.fetchone():
-            raise ValueError(f"Priority {priority} already exists")
     else:
-        # 如果没有传入priority，自动追加到最后
+        # 如果没有传入priority，自动追加到最后（聚合的派生表会先物化，可以引用被更新的表）
         cursor.execute(
-            "SELECT MAX(priority) as max_priority FROM vs_http_routes WHERE vs_global_id = %s", (vs_global_id,)
+            f"""
+        UPDATE vs_http_routes r
+        JOIN (SELECT COALESCE(MAX(priority), 0) AS max_priority FROM vs_http_routes WHERE vs_global_id = %s) m
+        SET {set_clause}, r.priority = m.max_priority + %s
+        WHERE r.id = %s
+        """,
+            (vs_global_id,) + values + (PRIORITY_STEP, route_id),
         )
-        result = cursor.fetchone()
-        priority = (result['max_priority'] or 0) + 10
 
-    # 更新HTTP路由
-    cursor.execute(
-        """UPDATE vs_http_routes 
-           SET name = %s, match_rules = %s, rewrite_rules = %s, forward_type = %s, forward_detail = %s, timeout = %s, priority = %s, updated_at = %s 
-           WHERE id = %s""",
-        (
-            route_request.name,
-            json.dumps(route_request.match_rules),
-            json.dumps(route_request.rewrite_rules) if route_request.rewrite_rules else None,
-            route_request.forward_type,
-            json.dumps(route_request.forward_detail),
-            route_request.timeout,
-            priority,
-            datetime.now(),
-            route_id,
-        ),
-    )
+    if cursor.rowcount == 0:
+        # 未更新时再区分原因：路由不存在、优先级冲突或内容没有变化
+        cursor.execute("SELECT id FROM vs_http_routes WHERE id = %s", (route_id,))
+        if not cursor.fetchone():
+            raise ValueError("HTTP路由不存在")
+        if priority is not None:
+            cursor.execute(
+                "SELECT id FROM vs_http_routes WHERE vs_global_id = %s AND priority = %s AND id != %s",
+                (vs_global_id, priority, route_id),
+            )
+            if cursor.fetchone():
+                raise ValueError(f"Priority {priority} already exists")
 
     connection.commit()
 
 
-async def delete_route(route_id: int, connection):
-    """删除HTTP路由"""
+def delete_route(route_id: int, connection):
+    """删除HTTP路由，删除只会增大优先级间隔，不需要重新编号"""
     cursor = connection.cursor()
 
     # 获取路由信息
@@ -955,43 +1326,10 @@ async def delete_route(route_id: int, connection):
 
     # 删除HTTP路由
     cursor.execute("DELETE FROM vs_http_routes WHERE id = %s", (route_id,))
+    refresh_route_counts(cursor, [vs_global_id])
 
     connection.commit()
-
-    # 重新整理优先级
-    await reorder_route_priorities(vs_global_id, connection)
-
-
-async def update_route_priority(route_id: int, new_priority: int, connection):
-    """更新路由优先级"""
-    cursor = connection.cursor()
-
-    # 获取路由信息
-    cursor.execute("SELECT vs_global_id, priority FROM vs_http_routes WHERE id = %s", (route_id,))
-    result = cursor.fetchone()
-    if not result:
-        raise ValueError("HTTP路由不存在")
-
-    vs_global_id, current_priority = result
-
-    if current_priority == new_priority:
-        return  # 优先级没有变化
-
-    # 检查新优先级是否已存在
-    cursor.execute(
-        "SELECT id FROM vs_http_routes WHERE vs_global_id = %s AND priority = %s AND id != %s",
-        (vs_global_id, new_priority, route_id),
-    )
-    if cursor.fetchone():
-        raise ValueError(f"Priority {new_priority} already exists")
-
-    # 更新优先级
-    cursor.execute(
-        "UPDATE vs_http_routes SET priority = %s, updated_at = %s WHERE id = %s",
-        (new_priority, datetime.now(), route_id),
-    )
-
-    connection.commit()
+    return vs_global_id
 
 
 # ==================== Istio Route 相关处理函数 ====================
@@ -1000,58 +1338,69 @@ async def get_vs_list_handler(request):
     try:
         logger.info(f"get_vs_list_handler 请求参数: {dict(request.query)}")
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         # 从query参数中获取vs_id，如果有则返回单个VS详情
         vs_id = request.query.get('vs_id')
         if vs_id:
             try:
                 vs_id = int(vs_id)
                 logger.info(f"查询单个VS详情，vs_id: {vs_id}")
-                vs_detail = await get_vs_by_id(vs_id, connection)
+                vs_detail = await run_db(get_vs_by_id, vs_id)
 
                 if vs_detail:
                     # 获取关联的K8S集群列表
                     logger.info(f"查询VS关联的K8S集群列表，vs_id: {vs_id}")
-                    k8s_clusters = await get_k8s_clusters_by_vs(vs_id, connection)
-                    await close_database(connection)
+                    k8s_clusters = await run_db(get_k8s_clusters_by_vs, vs_id)
 
                     # 将集群列表添加到VS详情中
                     vs_detail['k8s_clusters'] = k8s_clusters
                     logger.info(f"找到VS详情: {vs_detail['name']}，关联 {len(k8s_clusters)} 个K8S集群")
                     return safe_json_response({"data": vs_detail})
                 else:
-                    await close_database(connection)
                     logger.warning(f"未找到VS，vs_id: {vs_id}")
                     return safe_json_response({"error": "VirtualService not found"}, status=404)
             except ValueError:
-                await close_database(connection)
                 logger.error(f"vs_id格式错误: {vs_id}")
                 return safe_json_response({"error": "vs_id必须是有效的整数"}, status=400)
 
         # 从query参数中获取k8s_cluster，必须提供
         k8s_cluster = request.query.get('k8s_cluster')
-        # 从query参数中获取namespace，可选参数
+        # 从query参数中获取namespace、搜索关键字和分页参数，均为可选参数
         namespace = request.query.get('namespace')
+        search = request.query.get('search', '').strip() or None
+        cursor_id = request.query.get('cursor')
+        limit = request.query.get('limit')
 
         if not k8s_cluster:
-            await close_database(connection)
             logger.error("缺少k8s_cluster参数")
             return safe_json_response({"error": "缺少必需的参数: k8s_cluster"}, status=400)
 
+        try:
+            cursor_id = int(cursor_id) if cursor_id else None
+            limit = min(int(limit), VS_LIST_MAX_LIMIT) if limit else None
+        except ValueError:
+            logger.error(f"分页参数格式错误: cursor={cursor_id}, limit={limit}")
+            return safe_json_response({"error": "cursor和limit必须是有效的整数"}, status=400)
+        if limit is not None and limit <= 0:
+            return safe_json_response({"error": "limit必须大于0"}, status=400)
+
         # 根据K8S集群名称查询关联的VirtualService
-        if namespace:
-            logger.info(f"查询K8S集群关联的VS列表，k8s_cluster: {k8s_cluster}, namespace: {namespace}")
-        else:
-            logger.info(f"查询K8S集群关联的VS列表，k8s_cluster: {k8s_cluster}")
-        vs_list = await get_vs_list_by_k8s_cluster(k8s_cluster, connection, namespace)
+        logger.info(
+            f"查询K8S集群关联的VS列表，k8s_cluster: {k8s_cluster}, namespace: {namespace}, "
+            f"search: {search}, cursor: {cursor_id}, limit: {limit}"
+        )
+        vs_list, next_cursor = await run_db(
+            get_vs_list_by_k8s_cluster,
+            k8s_cluster,
+            namespace=namespace,
+            search=search,
+            cursor_id=cursor_id,
+            limit=limit,
+        )
         logger.info(f"查询到 {len(vs_list)} 个VirtualService")
 
-        await close_database(connection)
-        return safe_json_response({"data": vs_list})
+        if limit is None:
+            return safe_json_response({"data": vs_list})
+        return safe_json_response({"data": vs_list, "next_cursor": next_cursor})
     except Exception as e:
         logger.error(f"get_vs_list_handler 异常: {e}")
         return safe_json_response({"error": str(e)}, status=500)
@@ -1064,21 +1413,15 @@ async def create_vs_handler(request):
         logger.info(f"create_vs_handler 请求数据: {data}")
         vs_request = VSCreateRequest(**data)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"创建新的VS: {vs_request.name}/{vs_request.namespace}")
-        vs_id = await create_vs(vs_request, connection)
+        vs_id = await run_db(create_vs, vs_request)
         logger.info(f"VS创建成功，vs_id: {vs_id}")
 
         # 添加K8S集群关联关系（k8s_clusters为必填字段）
         logger.info(f"添加K8S集群关联关系，集群列表: {vs_request.k8s_clusters}")
-        await add_k8s_cluster_relations(vs_id, vs_request.k8s_clusters, connection)
+        await run_db(add_k8s_cluster_relations, vs_id, vs_request.k8s_clusters)
         logger.info(f"成功关联 {len(vs_request.k8s_clusters)} 个K8S集群")
 
-        await close_database(connection)
         return safe_json_response({"success": True, "message": "VirtualService创建成功", "id": vs_id})
     except Exception as e:
         logger.error(f"create_vs_handler 异常: {e}")
@@ -1105,14 +1448,9 @@ async def update_vs_handler(request):
         logger.info(f"update_vs_handler 请求数据: {data}")
         vs_request = VSUpdateRequest(**data)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"更新VS，vs_id: {vs_id}")
-        await update_vs_by_id(vs_id, vs_request, connection)
-        await close_database(connection)
+        await run_db(update_vs_by_id, vs_id, vs_request)
+        vs_json_cache.invalidate(vs_id)
 
         logger.info(f"VS更新成功，vs_id: {vs_id}")
         return safe_json_response({"success": True, "message": "VirtualService更新成功"})
@@ -1137,14 +1475,9 @@ async def delete_vs_handler(request):
             logger.error(f"vs_id格式错误: {vs_id}")
             return safe_json_response({"error": "vs_id必须是有效的整数"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"删除VS，vs_id: {vs_id}")
-        await delete_vs_by_id(vs_id, connection)
-        await close_database(connection)
+        await run_db(delete_vs_by_id, vs_id)
+        vs_json_cache.invalidate(vs_id)
 
         logger.info(f"VS删除成功，vs_id: {vs_id}")
         return safe_json_response({"success": True, "message": "VirtualService删除成功"})
@@ -1172,16 +1505,10 @@ async def get_routes_handler(request):
             logger.error(f"参数格式错误: vs_id={vs_id}, route_id={route_id}")
             return safe_json_response({"error": "vs_id和route_id必须是有效的整数"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         # 如果提供了route_id，返回单个路由详情
         if route_id:
             logger.info(f"查询单个路由详情，route_id: {route_id}")
-            route_detail = await get_route_by_id(route_id, connection)
-            await close_database(connection)
+            route_detail = await run_db(get_route_by_id, route_id)
 
             if route_detail:
                 logger.info(f"找到路由详情: {route_detail.get('name', 'unnamed')}")
@@ -1192,8 +1519,7 @@ async def get_routes_handler(request):
 
         # 否则返回VS的所有路由列表
         logger.info(f"查询VS的所有路由列表，vs_id: {vs_id}")
-        routes = await get_routes_by_priority(vs_id, connection)
-        await close_database(connection)
+        routes = await run_db(get_routes_by_priority, vs_id)
 
         logger.info(f"查询到 {len(routes)} 个路由")
         return safe_json_response({"data": routes})
@@ -1222,14 +1548,9 @@ async def create_route_handler(request):
         logger.info(f"create_route_handler 请求数据: {data}")
         route_request = HTTPRouteCreateRequest(**data)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"创建新路由规则，vs_id: {vs_id}")
-        route_id = await create_route(vs_id, route_request, connection)
-        await close_database(connection)
+        route_id = await run_db(create_route, vs_id, route_request)
+        vs_json_cache.invalidate(vs_id)
 
         logger.info(f"路由规则创建成功，route_id: {route_id}")
         return safe_json_response({"success": True, "message": "HTTP路由规则创建成功", "id": route_id})
@@ -1264,14 +1585,9 @@ async def update_route_handler(request):
         logger.info(f"update_route_handler 请求数据: {data}")
         route_request = HTTPRouteUpdateRequest(**data)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"更新路由，route_id: {route_id}, vs_id: {vs_id}")
-        await update_route(route_id, vs_id, route_request, connection)
-        await close_database(connection)
+        await run_db(update_route, route_id, vs_id, route_request)
+        vs_json_cache.invalidate(vs_id)
 
         logger.info(f"路由更新成功，route_id: {route_id}")
         return safe_json_response({"success": True, "message": "HTTP路由更新成功"})
@@ -1296,14 +1612,8 @@ async def delete_route_handler(request):
             logger.error(f"route_id格式错误: {route_id}")
             return safe_json_response({"error": "route_id必须是有效的整数"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"删除路由，route_id: {route_id}")
-        await delete_route(route_id, connection)
-        await close_database(connection)
+        vs_json_cache.invalidate(await run_db(delete_route, route_id))
 
         logger.info(f"路由删除成功，route_id: {route_id}")
         return safe_json_response({"success": True, "message": "HTTP路由删除成功"})
@@ -1328,14 +1638,9 @@ async def reorder_routes_handler(request):
             logger.error(f"vs_id格式错误: {vs_id}")
             return safe_json_response({"error": "vs_id必须是有效的整数"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"重新整理路由优先级，vs_id: {vs_id}")
-        await reorder_route_priorities(vs_id, connection)
-        await close_database(connection)
+        await run_db(reorder_route_priorities, vs_id)
+        vs_json_cache.invalidate(vs_id)
 
         logger.info(f"路由优先级重新整理成功，vs_id: {vs_id}")
         return safe_json_response({"success": True, "message": "路由优先级重新整理成功"})
@@ -1344,6 +1649,108 @@ async def reorder_routes_handler(request):
         return safe_json_response({"error": str(e)}, status=500)
 
 
+async def move_route_handler(request):
+    """移动路由到指定路由之前或之后，只更新被移动的路由"""
+    try:
+        route_id = request.query.get('route_id')
+        before_id = request.query.get('before_id')
+        after_id = request.query.get('after_id')
+        logger.info(f"move_route_handler 请求参数: route_id={route_id}, before_id={before_id}, after_id={after_id}")
+
+        if not route_id:
+            logger.error("缺少route_id参数")
+            return safe_json_response({"error": "缺少必需的参数: route_id"}, status=400)
+
+        try:
+            route_id = int(route_id)
+            before_id = int(before_id) if before_id else None
+            after_id = int(after_id) if after_id else None
+        except ValueError:
+            logger.error(f"参数格式错误: route_id={route_id}, before_id={before_id}, after_id={after_id}")
+            return safe_json_response({"error": "route_id、before_id和after_id必须是有效的整数"}, status=400)
+
+        if before_id is not None and after_id is not None:
+            return safe_json_response({"error": "before_id和after_id只能传一个"}, status=400)
+
+        vs_id, priority = await run_db(move_route, route_id, before_id=before_id, after_id=after_id)
+        vs_json_cache.invalidate(vs_id)
+
+        logger.info(f"路由移动成功，route_id: {route_id}, priority: {priority}")
+        return safe_json_response({"success": True, "message": "路由移动成功", "priority": priority})
+    except Exception as e:
+        logger.error(f"move_route_handler 异常: {e}")
+        return safe_json_response({"error": str(e)}, status=500)
+
+
+async def simulate_routes_handler(request):
+    """离线模拟请求命中的路由，并报告被遮蔽和未命中的路由
+
+    body: {"requests": [{"uri": "/api/a?x=1", "method": "GET", "authority": "a.com", "headers": {...},
+           "expect": 路由ID或名称(可选)}]}
+    """
+    try:
+        vs_id = request.query.get('vs_id')
+        if not vs_id or not vs_id.isdigit():
+            logger.error(f"vs_id格式错误: {vs_id}")
+            return safe_json_response({"error": "vs_id必须是有效的整数"}, status=400)
+        vs_id = int(vs_id)
+
+        body = await request.json()
+        samples = body.get('requests', [])
+        if not isinstance(samples, list):
+            return safe_json_response({"error": "requests必须是数组"}, status=400)
+
+        routes = await run_db(load_simulation_routes, vs_id)
+        if routes is None:
+            return safe_json_response({"error": "VirtualService not found"}, status=404)
+
+        try:
+            matcher = RouteMatcher(routes)
+        except (ValueError, re.error) as e:
+            return safe_json_response({"error": f"路由匹配规则编译失败: {e}"}, status=400)
+
+        def brief(route):
+            if route is None:
+                return None
+            return {"id": route['id'], "name": route['name'], "priority": route['priority']}
+
+        start = time.perf_counter()
+        results, mismatches = [], []
+        hits = {index: 0 for index in range(len(routes))}
+        index_of = {id(route): index for index, route in enumerate(routes)}
+        for index, sample in enumerate(samples):
+            route = matcher.match(parse_request(sample))
+            if route is not None:
+                hits[index_of[id(route)]] += 1
+            results.append({"index": index, "uri": sample.get('uri'), "route": brief(route)})
+            expect = sample.get('expect')
+            if expect is not None and (route is None or expect not in (route['id'], route['name'])):
+                mismatches.append({"index": index, "uri": sample.get('uri'), "expect": expect, "route": brief(route)})
+        elapsed = time.perf_counter() - start
+
+        shadowed = [
+            {"route": brief(item['route']), "shadowed_by": [brief(r) for r in item['shadowed_by']]}
+            for item in matcher.find_shadowed()
+        ]
+        logger.info(f"路由匹配模拟完成，vs_id: {vs_id}, 请求数: {len(samples)}, 耗时: {elapsed:.3f}s")
+        return safe_json_response(
+            {
+                "success": not mismatches,
+                "data": {
+                    "results": results,
+                    "mismatches": mismatches,
+                    "shadowed_routes": shadowed,
+                    "unhit_routes": [brief(routes[index]) for index, count in hits.items() if not count],
+                    "hits": [dict(brief(routes[index]), count=count) for index, count in hits.items()],
+                    "elapsed_ms": round(elapsed * 1000, 2),
+                },
+            }
+        )
+    except Exception as e:
+        logger.error(f"simulate_routes_handler 异常: {e}")
+        return safe_json_response({"error": str(e)}, status=500)
+
+
 async def generate_json_handler(request):
     """生成VirtualService JSON配置"""
     try:
@@ -1360,14 +1767,8 @@ async def generate_json_handler(request):
             logger.error(f"vs_id格式错误: {vs_id}")
             return safe_json_response({"error": "vs_id必须是有效的整数"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         logger.info(f"生成VirtualService JSON配置，vs_id: {vs_id}")
-        json_config = await generate_virtualservice_json(vs_id, connection)
-        await close_database(connection)
+        json_config = await get_virtualservice_json(vs_id)
 
         if json_config:
             logger.info(f"JSON配置生成成功，vs_id: {vs_id}")
@@ -1386,19 +1787,19 @@ async def health_check_handler(request):
         logger.info("health_check_handler 健康检查请求")
 
         # 检查数据库连接
-        connection = await connect_database()
-        if connection:
-            await close_database(connection)
-            db_status = True
+        try:
+            db_status = await run_db(check_database)
             logger.info("数据库连接正常")
-        else:
+        except Exception as e:
             db_status = False
-            logger.warning("数据库连接失败")
+            logger.warning(f"数据库连接失败: {e}")
 
         return safe_json_response(
             {
                 "status": "healthy" if db_status else "unhealthy",
                 "database": "connected" if db_status else "disconnected",
+                "pool": get_db_pool().get_stats(),
+                "vs_json_cache": vs_json_cache.get_stats(),
             }
         )
     except Exception as e:
@@ -1430,22 +1831,13 @@ async def update_k8s_vs_handler(request):
             logger.error(f"k8s_clusters格式错误: {k8s_clusters}")
             return safe_json_response({"error": "k8s_clusters必须是数组"}, status=400)
 
-        connection = await connect_database()
-        if not connection:
-            logger.error("数据库连接失败")
-            return safe_json_response({"error": "数据库连接失败"}, status=500)
-
         # 检查VS是否存在
-        cursor = connection.cursor()
-        cursor.execute("SELECT id FROM vs_global WHERE id = %s", (vs_id,))
-        if not cursor.fetchone():
-            await close_database(connection)
+        if not await run_db(vs_exists, vs_id):
             logger.error(f"VirtualService不存在，vs_id: {vs_id}")
             return safe_json_response({"error": "VirtualService不存在"}, status=404)
 
         logger.info(f"编辑K8S集群关联关系，vs_id: {vs_id}, k8s_clusters: {k8s_clusters}")
-        await update_k8s_cluster_relations(vs_id, k8s_clusters, connection)
-        await close_database(connection)
+        await run_db(update_k8s_cluster_relations, vs_id, k8s_clusters)
 
         logger.info(f"K8S集群关联关系编辑成功，vs_id: {vs_id}")
         return safe_json_response({"success": True, "message": "K8S集群关联关系编辑成功"})
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Istio VirtualService 路由匹配模拟
+
+按数据库中保存的 match_rules 和优先级，把路由编译成有序匹配器，离线判断请求命中哪条路由，
+不需要先应用到集群再用Envoy验证。匹配语义与Istio一致：
+- 路由按优先级顺序匹配，第一条满足的路由生效
+- match列表中任意一项满足即命中，同一项中的所有条件都要满足；没有match的路由匹配所有请求
+- uri只比较路径部分（不含查询参数），regex为完整匹配
+- port/sourceLabels/gateways/sourceNamespace 无法从模拟请求判断，port只在请求指定时比较，其余忽略
+- regex 使用Python re模拟Envoy的RE2，常见写法结果一致
+
+编译结果：exact用字典，prefix用前缀树，regex预编译并按开头的固定字符串挂到前缀树上；
+一个请求只需在前缀树上走一遍路径，再按顺序检查候选匹配项的其余条件
+"""
+
+import re
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlsplit, parse_qsl
+
+# 请求中的伪头部字段，对应match中的同名条件
+PSEUDO_HEADERS = ('uri', 'scheme', 'method', 'authority')
+# 无法从模拟请求中判断的条件，只有值完全相同时才认为覆盖
+OPAQUE_FIELDS = ('port', 'sourceLabels', 'gateways', 'sourceNamespace')
+# 正则中的特殊字符，用于提取开头的固定字符串
+REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+def regex_literal_prefix(pattern: str) -> str:
+    """取正则开头的固定字符串，完整匹配的路径一定以它开头；含有分支|时返回空字符串"""
+    if '|' in pattern:
+        return ''
+    prefix = []
+    for char in pattern:
+        if char in REGEX_META:
+            # 后面是量词时，最后一个字符不是必须出现的
+            if char in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+class StringMatcher:
+    """Istio StringMatch 的编译结果，exact/prefix/regex 三选一，空条件表示只要求字段存在"""
+
+    def __init__(self, rule: Dict[str, Any], ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.kind, self.value = next(iter(rule.items())) if rule else ('present', '')
+        if self.kind not in ('exact', 'prefix', 'regex', 'present'):
+            raise ValueError(f"不支持的StringMatch类型: {self.kind}")
+        if ignore_case and self.kind != 'regex':
+            self.value = self.value.lower()
+        self.pattern = re.compile(self.value, re.IGNORECASE if ignore_case else 0) if self.kind == 'regex' else None
+
+    def match(self, value: Optional[str]) -> bool:
+        if value is None:
+            return False
+        if self.ignore_case and self.kind != 'regex':
+            value = value.lower()
+        if self.kind == 'exact':
+            return value == self.value
+        if self.kind == 'prefix':
+            return value.startswith(self.value)
+        if self.kind == 'regex':
+            return self.pattern.fullmatch(value) is not None
+        return True
+
+    def covers(self, other: 'StringMatcher') -> bool:
+        """判断满足other的值是否一定满足self（保守判断，不确定时返回False）"""
+        if self.kind == 'present':
+            return True
+        if self.ignore_case != other.ignore_case and not self.ignore_case:
+            return False
+        other_value = other.value.lower() if self.ignore_case and other.kind != 'regex' else other.value
+        if other.kind == 'exact':
+            return self.match(other_value)
+        if other.kind == 'prefix':
+            return self.kind == 'prefix' and other_value.startswith(self.value)
+        if other.kind == 'regex':
+            return self.kind == 'regex' and self.value == other.value
+        return False
+
+
+class MatchClause:
+    """一个HTTPMatchRequest，所有条件都满足才算匹配"""
+
+    def __init__(self, order: int, route_index: int, rule: Dict[str, Any]):
+        """编译一个匹配项
+
+        Args:
+            order: 匹配项在整个VS中的顺序，越小越先匹配
+            route_index: 所属路由在路由列表中的下标
+            rule: HTTPMatchRequest 配置
+        """
+        self.order = order
+        self.route_index = route_index
+        ignore_case = bool(rule.get('ignoreUriCase'))
+        self.uri = StringMatcher(rule['uri'], ignore_case) if rule.get('uri') is not None else None
+        # uri之外的条件，以(名称, 匹配器)列表保存
+        self.fields = [(name, StringMatcher(rule[name])) for name in PSEUDO_HEADERS[1:] if rule.get(name) is not None]
+        self.headers = [(name.lower(), StringMatcher(m or {})) for name, m in (rule.get('headers') or {}).items()]
+        self.query_params = [(name, StringMatcher(m or {})) for name, m in (rule.get('queryParams') or {}).items()]
+        self.without_headers = [
+            (name.lower(), StringMatcher(m or {})) for name, m in (rule.get('withoutHeaders') or {}).items()
+        ]
+        self.opaque = {name: rule[name] for name in OPAQUE_FIELDS if rule.get(name) is not None}
+
+    def match_rest(self, request: Dict[str, Any]) -> bool:
+        """检查uri之外的条件（uri已由索引或正则判断）"""
+        if self.uri is not None and self.uri.kind == 'regex' and not self.uri.match(request['path']):
+            return False
+        for name, matcher in self.fields:
+            if not matcher.match(request.get(name)):
+                return False
+        headers = request['headers']
+        for name, matcher in self.headers:
+            if not matcher.match(headers.get(name)):
+                return False
+        for name, matcher in self.without_headers:
+            if matcher.match(headers.get(name)):
+                return False
+        query_params = request['query_params']
+        for name, matcher in self.query_params:
+            if not matcher.match(query_params.get(name)):
+                return False
+        if 'port' in self.opaque and request.get('port') is not None:
+            return self.opaque['port'] == request['port']
+        return True
+
+    def covers(self, other: 'MatchClause') -> bool:
+        """判断满足other的请求是否一定满足self，用于检测被遮蔽的路由"""
+        if self.opaque and any(other.opaque.get(name) != value for name, value in self.opaque.items()):
+            return False
+        if self.without_headers:
+            other_without = {name: matcher for name, matcher in other.without_headers}
+            for name, matcher in self.without_headers:
+                if name not in other_without or not other_without[name].covers(matcher) or not matcher.covers(
+                    other_without[name]
+                ):
+                    return False
+        pairs = [(self.uri, other.uri)] if self.uri is not None else []
+        other_fields = dict(other.fields)
+        pairs += [(matcher, other_fields.get(name)) for name, matcher in self.fields]
+        other_headers = dict(other.headers)
+        pairs += [(matcher, other_headers.get(name)) for name, matcher in self.headers]
+        other_params = dict(other.query_params)
+        pairs += [(matcher, other_params.get(name)) for name, matcher in self.query_params]
+        return all(theirs is not None and mine.covers(theirs) for mine, theirs in pairs)
+
+
+class PrefixTrie:
+    """uri前缀树，节点上保存以该前缀匹配的匹配项"""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, prefix: str, clause: MatchClause) -> None:
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(clause)
+
+    def collect(self, path: str, out: List[MatchClause]) -> None:
+        """沿路径走一遍，收集所有前缀命中的匹配项"""
+        node = self.root
+        out.extend(node.get(None, ()))
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                return
+            out.extend(node.get(None, ()))
+
+
+def parse_request(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """把模拟请求转换为匹配时使用的结构
+
+    Args:
+        sample: {"uri": "/api/a?x=1", "method": "GET", "authority": "a.com", "scheme": "https",
+                 "headers": {...}, "port": 80}，uri中的查询参数会解析为queryParams
+
+    Returns:
+        dict: 匹配用的请求
+    """
+    uri = sample.get('uri') or '/'
+    parts = urlsplit(uri)
+    request = {name: sample.get(name) for name in PSEUDO_HEADERS[1:]}
+    request['uri'] = uri
+    request['path'] = parts.path or '/'
+    request['port'] = sample.get('port')
+    request['headers'] = {str(k).lower(): str(v) for k, v in (sample.get('headers') or {}).items()}
+    request['query_params'] = dict(parse_qsl(parts.query, keep_blank_values=True))
+    return request
+
+
+class RouteMatcher:
+    """VirtualService的有序路由匹配器"""
+
+    def __init__(self, routes: List[Dict[str, Any]]):
+        """编译路由列表
+
+        Args:
+            routes: 按优先级排好序的路由，每项包含 id、name、priority、match（HTTPMatchRequest列表或None）
+        """
+        self.routes = routes
+        self.clauses = []
+        self.exact = {}
+        self.exact_ignore_case = {}
+        self.prefix = PrefixTrie()
+        self.prefix_ignore_case = PrefixTrie()
+        # 没有uri条件的匹配项，每个请求都要检查
+        self.scan = []
+        for route_index, route in enumerate(routes):
+            for rule in route.get('match') or [{}]:
+                clause = MatchClause(len(self.clauses), route_index, rule)
+                self.clauses.append(clause)
+                uri = clause.uri
+                if uri is None or uri.kind == 'present':
+                    self.scan.append(clause)
+                elif uri.kind == 'exact':
+                    target = self.exact_ignore_case if uri.ignore_case else self.exact
+                    target.setdefault(uri.value, []).append(clause)
+                elif uri.kind == 'prefix':
+                    (self.prefix_ignore_case if uri.ignore_case else self.prefix).add(uri.value, clause)
+                elif uri.ignore_case:
+                    self.prefix_ignore_case.add(regex_literal_prefix(uri.value).lower(), clause)
+                else:
+                    self.prefix.add(regex_literal_prefix(uri.value), clause)
+
+    def match(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """返回请求命中的路由，没有命中时返回None
+
+        Args:
+            request: parse_request 的结果
+        """
+        path = request['path']
+        lower_path = path.lower()
+        candidates = list(self.scan)
+        candidates.extend(self.exact.get(path, ()))
+        candidates.extend(self.exact_ignore_case.get(lower_path, ()))
+        self.prefix.collect(path, candidates)
+        self.prefix_ignore_case.collect(lower_path, candidates)
+        candidates.sort(key=lambda clause: clause.order)
+        for clause in candidates:
+            if clause.match_rest(request):
+                return self.routes[clause.route_index]
+        return None
+
+    def find_shadowed(self) -> List[Dict[str, Any]]:
+        """找出被前面的路由完全遮蔽、永远不会命中的路由
+
+        Returns:
+            list: [{"route": 被遮蔽的路由, "shadowed_by": [遮蔽它的路由]}]
+        """
+        shadowed = []
+        by_route = {}
+        for clause in self.clauses:
+            by_route.setdefault(clause.route_index, []).append(clause)
+        for route_index, clauses in by_route.items():
+            blockers = []
+            for clause in clauses:
+                blocker = next(
+                    (c for c in self.clauses[: clauses[0].order] if c.covers(clause)),
+                    None,
+                )
+                if blocker is None:
+                    break
+                if blocker.route_index not in blockers:
+                    blockers.append(blocker.route_index)
+            else:
+                shadowed.append({"route": self.routes[route_index], "shadowed_by": [self.routes[i] for i in blockers]})
+        return shadowed
@@ -10,10 +10,14 @@ from .event_processor import (
     K8SEventProcessor, 
     get_event_processor, 
     process_k8s_event_async,
+    process_k8s_event_batch_async,
     reload_alert_rules,
-    get_alert_stats
+    get_alert_stats,
+    start_event_workers,
+    stop_event_workers,
 )
 from .alert_rule_matcher import AlertRuleMatcher
+from .agent_filter import get_agent_filter, record_agent_filter_stats, get_agent_filter_stats
 from .event_alert_processor import EventAlertProcessor
 
 __all__ = [
@@ -23,9 +27,15 @@ __all__ = [
     'K8SEventProcessor',
     'get_event_processor',
     'process_k8s_event_async',
+    'process_k8s_event_batch_async',
     'reload_alert_rules',
     'get_alert_stats',
+    'start_event_workers',
+    'stop_event_workers',
     'AlertRuleMatcher',
+    'get_agent_filter',
+    'record_agent_filter_stats',
+    'get_agent_filter_stats',
     'EventAlertProcessor',
 ]
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件agent侧预过滤
+将告警规则文件中的全局忽略规则和Normal事件存储策略编译为agent可直接执行的格式，
+由master下发到各agent，命中的事件在源头丢弃或采样，不再经过WAN传输和存储
+"""
+
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Any
+from loguru import logger
+from .alert_rule_matcher import AlertRuleMatcher
+
+# 字段条件的判断顺序，与AlertRuleMatcher._match_field_condition保持一致，每个字段只生效第一个出现的条件
+STRING_OPERATORS = ['contains', 'not_contains', 'starts_with', 'not_starts_with', 'ends_with', 'not_ends_with']
+EQUAL_OPERATORS = ['equals', 'not_equals']
+COUNT_OPERATORS = ['greater_than', 'less_than', 'greater_equal', 'less_equal']
+
+
+def compile_conditions(conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """将规则条件组编译为[{field, op, values}]列表，字符串统一转为小写
+
+    Args:
+        conditions: 规则条件组
+
+    Returns:
+        List[Dict]: 编译后的条件列表
+    """
+    compiled = []
+    for field_name, field_conditions in conditions.items():
+        op, values = 'any', []
+        for name in STRING_OPERATORS + EQUAL_OPERATORS:
+            if name in field_conditions:
+                raw = field_conditions[name]
+                if not isinstance(raw, list) or name in EQUAL_OPERATORS:
+                    raw = [raw]
+                op, values = name, [str(value).lower() for value in raw]
+                break
+        else:
+            if field_name == 'count':
+                for name in COUNT_OPERATORS:
+                    if name in field_conditions:
+                        op, values = name, [field_conditions[name]]
+                        break
+        compiled.append({'field': field_name, 'op': op, 'values': values})
+    return compiled
+
+
+def build_agent_filter(matcher: AlertRuleMatcher) -> Dict[str, Any]:
+    """根据告警规则生成下发给agent的过滤配置
+
+    规则文件中的agent_filter配置:
+    {
+      "enabled": true,
+      "drop_ignored_events": true,
+      "store_normal_events": true,
+      "normal_sample_rate": 1.0
+    }
+    drop_ignored_events为true时下发所有启用的全局忽略规则，单条忽略规则可设置"agent_drop": false排除；
+    store_normal_events为false时丢弃所有Normal级别事件，为true时按normal_sample_rate采样（同一eventUid结果固定）
+
+    Args:
+        matcher: 已加载规则的匹配器
+
+    Returns:
+        Dict: agent过滤配置，version为配置内容的摘要
+    """
+    policy = matcher.agent_filter if matcher.agent_filter.get('enabled', False) else {}
+    ignore_rules = []
+    if policy.get('drop_ignored_events', False):
+        for rule in matcher.global_ignore_rules:
+            if rule.get('enabled', True) and rule.get('agent_drop', True):
+                ignore_rules.append(
+                    {'name': rule.get('name', ''), 'conditions': compile_conditions(rule.get('conditions', {}))}
+                )
+
+    agent_filter = {
+        'ignore_rules': ignore_rules,
+        'store_normal_events': bool(policy.get('store_normal_events', True)),
+        'normal_sample_rate': min(1.0, max(0.0, float(policy.get('normal_sample_rate', 1.0)))),
+    }
+    content = json.dumps(agent_filter, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    agent_filter['version'] = hashlib.md5(content).hexdigest()[:12]
+    return agent_filter
+
+
+# 当前生效的agent过滤配置及各agent上报的丢弃统计
+_agent_filter = None
+_agent_filter_stats: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def get_agent_filter() -> Dict[str, Any]:
+    """获取当前生效的agent过滤配置"""
+    global _agent_filter
+    with _lock:
+        if _agent_filter is None:
+            _agent_filter = build_agent_filter(AlertRuleMatcher())
+            logger.info(
+                f"agent事件预过滤配置已生成: version={_agent_filter['version']} "
+                f"忽略规则 {len(_agent_filter['ignore_rules'])} 条"
+            )
+        return _agent_filter
+
+
+def reload_agent_filter() -> None:
+    """规则文件变更后重新生成过滤配置，agent在下次心跳时发现版本不一致后重新下发"""
+    global _agent_filter
+    with _lock:
+        _agent_filter = None
+    get_agent_filter()
+
+
+def record_agent_filter_stats(env: str, stats: Dict[str, Any]) -> None:
+    """记录agent心跳上报的预过滤统计
+
+    Args:
+        env: agent对应的K8S集群名称
+        stats: agent上报的统计信息
+    """
+    with _lock:
+        _agent_filter_stats[env] = dict(stats, reported_at=int(time.time()))
+
+
+def get_agent_filter_stats() -> Dict[str, Any]:
+    """获取预过滤配置版本及各agent的丢弃统计"""
+    current = get_agent_filter()
+    with _lock:
+        return {'version': current['version'], 'agents': dict(_agent_filter_stats)}
@@ -2,11 +2,11 @@
 # -*- coding: utf-8 -*-
 """
 K8S事件告警规则匹配引擎
-支持对事件字段的包含/不包含判断以及count字段的数值比较
+支持对事件字段的包含/不包含判断以及count字段的数值比较，以及窗口聚合规则的条件匹配
 """
 
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, List, Any, Optional
 from loguru import logger
 
 
@@ -25,6 +25,8 @@ class AlertRuleMatcher:
         self.rules_file = rules_file
         self.rules = []
         self.global_ignore_rules = []
+        self.aggregate_rules = []
+        self.agent_filter = {}
         self.load_rules()
 
     def load_rules(self) -> None:
@@ -34,12 +36,16 @@ class AlertRuleMatcher:
                 config = json.load(f)
                 self.rules = config.get('alert_rules', [])
                 self.global_ignore_rules = config.get('global_ignore_rules', [])
+                self.aggregate_rules = config.get('aggregate_rules', [])
+                self.agent_filter = config.get('agent_filter', {})
 
-            logger.info(f"加载了 {len(self.rules)} 条告警规则")
+            logger.info(f"加载了 {len(self.rules)} 条告警规则, {len(self.aggregate_rules)} 条聚合告警规则")
 
         except Exception as e:
             logger.error(f"加载告警规则失败: {e}")
             self.rules = []
+            self.aggregate_rules = []
+            self.agent_filter = {}
             self.global_config = {}
 
     def reload_rules(self) -> None:
@@ -94,6 +100,21 @@ class AlertRuleMatcher:
         logger.debug(f"事件未匹配任何规则: {event.get('eventUid')}")
         return None
 
+    def match_aggregate_rules(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """匹配窗口聚合规则
+
+        Args:
+            event: K8S事件数据（调用方已完成忽略规则检查）
+
+        Returns:
+            List[Dict]: 事件命中的所有启用的聚合规则
+        """
+        return [
+            rule
+            for rule in self.aggregate_rules
+            if rule.get('enabled', True) and self._match_rule(event, rule)
+        ]
+
     def _match_rule(self, event: Dict[str, Any], rule: Dict[str, Any]) -> bool:
         """检查事件是否匹配规则
 
@@ -261,5 +282,6 @@ class AlertRuleMatcher:
             'total_rules': len(self.rules),
             'enabled_rules': len(enabled_rules),
             'disabled_rules': len(disabled_rules),
+            'aggregate_rules': len([r for r in self.aggregate_rules if r.get('enabled', True)]),
             'rules_file': str(self.rules_file),
         }
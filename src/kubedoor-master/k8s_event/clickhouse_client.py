@@ -6,12 +6,54 @@ ClickHouse客户端模块
 """
 
 import os
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple, Iterator
+from datetime import datetime, timedelta
 from loguru import logger
 from .connection_pool import get_connection_pool
 
 
+# k8s_events写入列及缺省值
+EVENT_COLUMNS = [
+    ('eventUid', ''),
+    ('eventStatus', ''),
+    ('level', ''),
+    ('count', 0),
+    ('kind', ''),
+    ('k8s', ''),
+    ('namespace', ''),
+    ('name', ''),
+    ('reason', ''),
+    ('message', ''),
+    ('firstTimestamp', None),
+    ('lastTimestamp', None),
+    ('reportingComponent', ''),
+    ('reportingInstance', ''),
+]
+
+
+# 事件统计支持的TopN维度
+STATS_GROUP_FIELDS = ['namespace', 'kind', 'reason', 'level']
+
+
+def parse_stats_time(value: str, end: bool) -> datetime:
+    """解析统计接口的时间参数，只有日期时开始时间取当天0点，结束时间取当天23:59:59"""
+    if len(value) == 10:
+        return datetime.strptime(f"{value} {'23:59:59' if end else '00:00:00'}", '%Y-%m-%d %H:%M:%S')
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def escape_like(value: str) -> str:
+    """转义LIKE模式中的特殊字符
+
+    Args:
+        value: 原始字符串
+
+    Returns:
+        str: 可安全用于LIKE模式的字符串
+    """
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
 class ClickHouseClient:
     """ClickHouse客户端类"""
 
@@ -63,46 +105,7 @@ class ClickHouseClient:
             event_data: 事件数据字典
         """
         try:
-            # 准备插入数据 - 使用clickhouse-connect的insert方法
-            with self.pool.get_client() as client:
-                client.insert(
-                    'k8s_events',
-                    [
-                        [
-                            event_data.get('eventUid', ''),
-                            event_data.get('eventStatus', ''),
-                            event_data.get('level', ''),
-                            event_data.get('count', 0),
-                            event_data.get('kind', ''),
-                            event_data.get('k8s', ''),
-                            event_data.get('namespace', ''),
-                            event_data.get('name', ''),
-                            event_data.get('reason', ''),
-                            event_data.get('message', ''),
-                            event_data.get('firstTimestamp'),
-                            event_data.get('lastTimestamp'),
-                            event_data.get('reportingComponent', ''),
-                            event_data.get('reportingInstance', ''),
-                        ]
-                    ],
-                    column_names=[
-                        'eventUid',
-                        'eventStatus',
-                        'level',
-                        'count',
-                        'kind',
-                        'k8s',
-                        'namespace',
-                        'name',
-                        'reason',
-                        'message',
-                        'firstTimestamp',
-                        'lastTimestamp',
-                        'reportingComponent',
-                        'reportingInstance',
-                    ],
-                )
-
+            self.insert_events([event_data])
             logger.debug(f"已更新事件: {event_data.get('eventUid')} 在命名空间 {event_data.get('namespace')}")
 
         except Exception as e:
@@ -110,12 +113,26 @@ class ClickHouseClient:
             logger.error(f"事件数据: {event_data}")
             raise
 
-    def query_events_advanced(
+    def insert_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        批量插入K8S事件数据（单次INSERT）
+
+        Args:
+            events: 事件数据字典列表
+        """
+        if not events:
+            return
+        rows = [[event_data.get(column, default) for column, default in EVENT_COLUMNS] for event_data in events]
+        # 使用clickhouse-connect的insert方法
+        with self.pool.get_client() as client:
+            client.insert('k8s_events', rows, column_names=[column for column, _ in EVENT_COLUMNS])
+
+    def build_events_query(
         self,
         k8s: str,
         start_time: datetime,
         end_time: datetime,
-        limit: int,
+        limit: Optional[int],
         namespace: str = None,
         count: int = None,
         level: str = None,
@@ -125,14 +142,16 @@ class ClickHouseClient:
         reporting_component: str = None,
         reporting_instance: str = None,
         message: str = None,
-    ) -> List[Dict[str, Any]]:
-        """高级查询K8S事件数据
+        cursor: Optional[Tuple[str, str]] = None,
+        with_uid: bool = False,
+    ) -> Tuple[str, List[Any]]:
+        """构建K8S事件高级查询SQL
 
         Args:
             k8s: K8S集群名称（必填）
             start_time: 开始时间（必填）
             end_time: 结束时间（必填）
-            limit: 返回记录数限制（必填）
+            limit: 返回记录数限制，为None时不限制（导出）
             namespace: 命名空间（可选）
             count: 事件发生次数，大于等于匹配（可选）
             level: 事件级别（可选）
@@ -142,112 +161,243 @@ class ClickHouseClient:
             reporting_component: 报告组件（可选）
             reporting_instance: 报告实例（可选）
             message: 事件消息，包含匹配（可选）
+            cursor: 分页游标(lastTimestamp, eventUid)，返回排在游标之后的记录（可选）
+            with_uid: 是否在结果最后追加eventUid列，用于生成下一页游标
+
+        Returns:
+            (SQL语句, 参数列表)
+        """
+        # 内层条件：同一eventUid的各版本取值相同（或只会单调增大）的字段，先过滤再去重不影响结果
+        inner_conditions = []
+        inner_params = []
+        # 外层条件：会随版本变化的字段，在去重后的最新版本上过滤，与FINAL的语义一致
+        where_conditions = []
+        params = []
+
+        # 必填条件
+        inner_conditions.append("k8s = %s")
+        inner_params.append(k8s)
+
+        # lastTimestamp是版本列，新版本只会更大，下限可以在去重前过滤；上限必须在去重后过滤
+        inner_conditions.append("lastTimestamp >= %s")
+        inner_params.append(f'{start_time} 00:00:00')
+
+        where_conditions.append("lastTimestamp <= %s")
+        params.append(f'{end_time} 23:59:59')
+
+        # 可选条件
+        if namespace and namespace != "[全部]":
+            if namespace == "[空值]":
+                inner_conditions.append("(namespace IS NULL OR namespace = '')")
+            else:
+                inner_conditions.append("namespace = %s")
+                inner_params.append(namespace)
+
+        if count is not None:
+            where_conditions.append("count >= %s")
+            params.append(count)
+
+        if level:
+            where_conditions.append("level = %s")
+            params.append(level)
+
+        if kind and kind != "[全部]":
+            if kind == "[空值]":
+                inner_conditions.append("(kind IS NULL OR kind = '')")
+            else:
+                inner_conditions.append("kind = %s")
+                inner_params.append(kind)
+
+        if name and name != "[全部]":
+            if name == "[空值]":
+                inner_conditions.append("(name IS NULL OR name = '')")
+            else:
+                inner_conditions.append("name = %s")
+                inner_params.append(name)
+
+        # reason和报告来源在事件创建时确定，同一eventUid的各版本相同，放在内层可以在排序去重前缩小范围
+        if reason and reason != "[全部]":
+            if reason == "[空值]":
+                inner_conditions.append("(reason IS NULL OR reason = '')")
+            else:
+                inner_conditions.append("positionCaseInsensitive(reason, %s) > 0")
+                inner_params.append(reason)
+
+        if reporting_component and reporting_component != "[全部]":
+            if reporting_component == "[空值]":
+                inner_conditions.append("(reportingComponent IS NULL OR reportingComponent = '')")
+            else:
+                inner_conditions.append("reportingComponent = %s")
+                inner_params.append(reporting_component)
+
+        if reporting_instance and reporting_instance != "[全部]":
+            if reporting_instance == "[空值]":
+                inner_conditions.append("(reportingInstance IS NULL OR reportingInstance = '')")
+            else:
+                inner_conditions.append("reportingInstance = %s")
+                inner_params.append(reporting_instance)
+
+        if message:
+            pattern = f"%{escape_like(message.lower())}%"
+            # 先用 idx_message_ngram 跳数索引找出有版本命中的eventUid，缩小去重范围，最新版本再精确过滤
+            inner_conditions.append(
+                "eventUid IN (SELECT eventUid FROM k8s_events WHERE k8s = %s AND lastTimestamp >= %s AND lower(message) LIKE %s)"
+            )
+            inner_params.extend([k8s, f'{start_time} 00:00:00', pattern])
+            where_conditions.append("lower(message) LIKE %s")
+            params.append(pattern)
+
+        # 键集分页：按(lastTimestamp, eventUid)倒序，取游标之后的记录
+        # 必须在去重后过滤，否则已在前一页返回的事件的旧版本也满足游标条件，会在下一页重复出现
+        if cursor:
+            cursor_time, cursor_uid = cursor
+            where_conditions.append("(lastTimestamp, eventUid) < (toDateTime(%s, 'Asia/Shanghai'), %s)")
+            params.extend([cursor_time, cursor_uid])
+
+        columns = """eventStatus,
+            level,
+            count,
+            kind,
+            k8s,
+            namespace,
+            name,
+            reason,
+            message,
+            firstTimestamp,
+            lastTimestamp,
+            reportingComponent,
+            reportingInstance"""
+        uid_column = ",\n            eventUid" if with_uid else ""
+        limit_clause = f"LIMIT {int(limit)}" if limit is not None else ""
+
+        # 查询除了eventUid和createdAt之外的所有字段
+        # 不使用FINAL：内层按lastTimestamp倒序后每个eventUid只取最新版本（可使用proj_k8s_time投影），
+        # 外层再按随版本变化的字段过滤，避免旧版本命中条件而被返回。
+        # 内层的排序覆盖所有通过内层条件的版本，选择性高的条件要尽量放在内层，只能放不随版本变化的字段
+        sql = f"""
+        SELECT 
+            {columns}{uid_column}
+        FROM
+        (
+            SELECT
+            {columns},
+            eventUid
+            FROM k8s_events
+            WHERE {" AND ".join(inner_conditions)}
+            ORDER BY lastTimestamp DESC, count DESC
+            LIMIT 1 BY eventUid
+        )
+        WHERE {" AND ".join(where_conditions)}
+        ORDER BY lastTimestamp DESC, eventUid DESC
+        {limit_clause}
+        """
+        return sql, inner_params + params
+
+    def query_events_advanced(self, *args, **kwargs) -> List[Any]:
+        """高级查询K8S事件数据，参数同build_events_query
 
         Returns:
-            事件数据列表，不包含eventUid和createdAt字段
+            事件数据列表，不包含eventUid（with_uid为True时追加在最后一列）和createdAt字段
         """
         try:
-            where_conditions = []
-            params = []
-
-            # 必填条件
-            where_conditions.append("k8s = %s")
-            params.append(k8s)
-
-            where_conditions.append("lastTimestamp >= %s")
-            params.append(f'{start_time} 00:00:00')
-
-            where_conditions.append("lastTimestamp <= %s")
-            params.append(f'{end_time} 23:59:59')
-
-            # 可选条件
-            if namespace and namespace != "[全部]":
-                if namespace == "[空值]":
-                    where_conditions.append("(namespace IS NULL OR namespace = '')")
-                else:
-                    where_conditions.append("namespace = %s")
-                    params.append(namespace)
-
-            if count is not None:
-                where_conditions.append("count >= %s")
-                params.append(count)
-
-            if level:
-                where_conditions.append("level = %s")
-                params.append(level)
-
-            if kind and kind != "[全部]":
-                if kind == "[空值]":
-                    where_conditions.append("(kind IS NULL OR kind = '')")
-                else:
-                    where_conditions.append("kind = %s")
-                    params.append(kind)
-
-            if name and name != "[全部]":
-                if name == "[空值]":
-                    where_conditions.append("(name IS NULL OR name = '')")
-                else:
-                    where_conditions.append("name = %s")
-                    params.append(name)
-
-            if reason and reason != "[全部]":
-                if reason == "[空值]":
-                    where_conditions.append("(reason IS NULL OR reason = '')")
-                else:
-                    where_conditions.append("positionCaseInsensitive(reason, %s) > 0")
-                    params.append(reason)
-
-            if reporting_component and reporting_component != "[全部]":
-                if reporting_component == "[空值]":
-                    where_conditions.append("(reportingComponent IS NULL OR reportingComponent = '')")
-                else:
-                    where_conditions.append("reportingComponent = %s")
-                    params.append(reporting_component)
-
-            if reporting_instance and reporting_instance != "[全部]":
-                if reporting_instance == "[空值]":
-                    where_conditions.append("(reportingInstance IS NULL OR reportingInstance = '')")
-                else:
-                    where_conditions.append("reportingInstance = %s")
-                    params.append(reporting_instance)
-
-            if message:
-                where_conditions.append("positionCaseInsensitive(message, %s) > 0")
-                params.append(message)
-
-            where_clause = " AND ".join(where_conditions)
-
-            # 查询除了eventUid和createdAt之外的所有字段
-            sql = f"""
-            SELECT 
-                eventStatus,
-                level,
-                count,
-                kind,
-                k8s,
-                namespace,
-                name,
-                reason,
-                message,
-                firstTimestamp,
-                lastTimestamp,
-                reportingComponent,
-                reportingInstance
-            FROM k8s_events FINAL
-            WHERE {where_clause}
-            ORDER BY lastTimestamp DESC
-            LIMIT {limit}
-            """
+            sql, params = self.build_events_query(*args, **kwargs)
             logger.debug(f"执行SQL: {sql}")
             logger.debug(f"参数: {params}")
             # 对于SELECT查询，使用execute_query
-            result = self.pool.execute_query(sql, params)
-            return result
+            return self.pool.execute_query(sql, params)
 
         except Exception as e:
             logger.error(f"高级查询事件失败: {e}")
             raise
 
+    def stream_events_advanced(self, *args, **kwargs) -> Iterator[List[Any]]:
+        """流式查询K8S事件数据，按ClickHouse返回的数据块逐块产出，参数同build_events_query
+
+        Returns:
+            事件数据块迭代器，每块为行列表
+        """
+        sql, params = self.build_events_query(*args, **kwargs)
+        logger.debug(f"流式执行SQL: {sql}")
+        with self.pool.get_client() as client:
+            with client.query_row_block_stream(sql, parameters=params) as stream:
+                for block in stream:
+                    yield block
+
+    def query_event_stats(
+        self,
+        k8s: str,
+        start_time: str,
+        end_time: str,
+        group_by: str = 'reason',
+        top: int = 10,
+        namespace: str = None,
+        kind: str = None,
+        reason: str = None,
+        level: str = None,
+    ) -> Dict[str, Any]:
+        """从预聚合表查询事件趋势和TopN
+
+        根据时间范围自动选择粒度：不超过6小时用分钟表，不超过7天用小时表，否则用天表
+
+        Args:
+            k8s: K8S集群名称（必填）
+            start_time: 开始时间，YYYY-MM-DD或YYYY-MM-DD HH:MM:SS
+            end_time: 结束时间，YYYY-MM-DD或YYYY-MM-DD HH:MM:SS
+            group_by: TopN维度，namespace/kind/reason/level
+            top: TopN数量
+            namespace: 命名空间（可选）
+            kind: 对象类型（可选）
+            reason: 事件原因（可选）
+            level: 事件级别（可选）
+
+        Returns:
+            Dict: {'interval': 粒度, 'histogram': [(时间桶, 事件数)], 'top': [(维度值, 事件数, 新增事件数)]}
+        """
+        if group_by not in STATS_GROUP_FIELDS:
+            raise ValueError(f"不支持的统计维度: {group_by}")
+
+        start_dt = parse_stats_time(start_time, end=False)
+        end_dt = parse_stats_time(end_time, end=True)
+        span = end_dt - start_dt
+        if span <= timedelta(hours=6):
+            interval, table = '1m', 'k8s_events_rollup_1m'
+        elif span <= timedelta(days=7):
+            interval, table = '1h', 'k8s_events_rollup_1h'
+        else:
+            interval, table = '1d', 'k8s_events_rollup_1d'
+
+        where_conditions = ["k8s = %s", "bucket >= %s", "bucket <= %s"]
+        params = [k8s, start_dt.strftime('%Y-%m-%d %H:%M:%S'), end_dt.strftime('%Y-%m-%d %H:%M:%S')]
+        for field, value in (('namespace', namespace), ('kind', kind), ('reason', reason), ('level', level)):
+            if value and value != "[全部]":
+                where_conditions.append(f"{field} = %s")
+                params.append('' if value == "[空值]" else value)
+        where_clause = " AND ".join(where_conditions)
+
+        histogram_sql = f"""
+        SELECT bucket, sum(events) AS events
+        FROM {table}
+        WHERE {where_clause}
+        GROUP BY bucket
+        ORDER BY bucket
+        """
+        top_sql = f"""
+        SELECT {group_by}, sum(events) AS events, sum(new_events) AS new_events
+        FROM {table}
+        WHERE {where_clause}
+        GROUP BY {group_by}
+        ORDER BY events DESC
+        LIMIT {int(top)}
+        """
+        try:
+            histogram = self.pool.execute_query(histogram_sql, params)
+            top_rows = self.pool.execute_query(top_sql, params)
+        except Exception as e:
+            logger.error(f"查询事件统计失败: {e}")
+            raise
+
+        return {'interval': interval, 'histogram': histogram, 'top': top_rows}
+
     def close(self) -> None:
         """关闭连接"""
         # 连接池会自动管理连接，无需手动关闭
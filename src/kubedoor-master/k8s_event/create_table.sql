@@ -31,4 +31,69 @@ SETTINGS index_granularity = 8192;
 -- 基于k8s, namespace, lastTimestamp, level, kind的查询优化
 CREATE INDEX IF NOT EXISTS idx_k8s_namespace_time ON k8s_events (k8s, namespace, lastTimestamp) TYPE minmax GRANULARITY 1;
 CREATE INDEX IF NOT EXISTS idx_level_kind ON k8s_events (level, kind) TYPE set(100) GRANULARITY 1;
-CREATE INDEX IF NOT EXISTS idx_reason ON k8s_events (reason) TYPE bloom_filter(0.01) GRANULARITY 1;
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_reason ON k8s_events (reason) TYPE bloom_filter(0.01) GRANULARITY 1;
+
+-- 按时间查询优化（存量表迁移，可重复执行）
+-- 查询总是按 k8s + lastTimestamp 范围过滤并按 lastTimestamp 倒序，主键为 eventUid 时需要扫描整个分区
+-- 增加按 (k8s, lastTimestamp, namespace) 排序的投影，新写入的数据自动生成投影
+-- 存量数据可手动执行 ALTER TABLE k8s_events MATERIALIZE PROJECTION proj_k8s_time 生成投影
+-- ReplacingMergeTree 合并时需要重建投影
+ALTER TABLE k8s_events MODIFY SETTING deduplicate_merge_projection_mode = 'rebuild';
+ALTER TABLE k8s_events ADD PROJECTION IF NOT EXISTS proj_k8s_time (SELECT * ORDER BY (k8s, lastTimestamp, namespace));
+
+-- 消息和对象名称的文本跳数索引，消息按 lower(message) LIKE 查询以命中 ngram 索引
+ALTER TABLE k8s_events ADD INDEX IF NOT EXISTS idx_message_ngram lower(message) TYPE ngrambf_v1(3, 65536, 3, 0) GRANULARITY 1;
+ALTER TABLE k8s_events ADD INDEX IF NOT EXISTS idx_name_token name TYPE tokenbf_v1(8192, 3, 0) GRANULARITY 1;
+
+
+-- 事件数量预聚合（按分钟/小时/天），用于事件趋势图和TopN统计
+-- events 为收到的事件记录数（ADDED/MODIFIED，每次count变化都会产生一条），new_events 为新增事件数
+-- 物化视图只处理创建后写入的数据，存量数据可手动执行
+-- INSERT INTO k8s_events_rollup_1m SELECT ... FROM k8s_events（同物化视图的SELECT）回填
+CREATE TABLE IF NOT EXISTS k8s_events_rollup_1m (
+    k8s String,
+    namespace LowCardinality(String),
+    kind LowCardinality(String),
+    reason LowCardinality(String),
+    level LowCardinality(String),
+    bucket DateTime('Asia/Shanghai'),
+    events UInt64,
+    new_events UInt64
+)
+ENGINE = SummingMergeTree
+PARTITION BY toYYYYMMDD(bucket)
+ORDER BY (k8s, bucket, namespace, kind, reason, level)
+TTL bucket + INTERVAL 7 DAY;
+
+CREATE TABLE IF NOT EXISTS k8s_events_rollup_1h AS k8s_events_rollup_1m
+ENGINE = SummingMergeTree
+PARTITION BY toYYYYMM(bucket)
+ORDER BY (k8s, bucket, namespace, kind, reason, level)
+TTL bucket + INTERVAL 90 DAY;
+
+CREATE TABLE IF NOT EXISTS k8s_events_rollup_1d AS k8s_events_rollup_1m
+ENGINE = SummingMergeTree
+PARTITION BY toYYYYMM(bucket)
+ORDER BY (k8s, bucket, namespace, kind, reason, level)
+TTL bucket + INTERVAL 365 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS k8s_events_rollup_1m_mv TO k8s_events_rollup_1m AS
+SELECT k8s, namespace, kind, reason, level, toStartOfMinute(lastTimestamp) AS bucket,
+       count() AS events, countIf(eventStatus = 'ADDED') AS new_events
+FROM k8s_events
+WHERE eventStatus != 'DELETED'
+GROUP BY k8s, namespace, kind, reason, level, bucket;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS k8s_events_rollup_1h_mv TO k8s_events_rollup_1h AS
+SELECT k8s, namespace, kind, reason, level, toStartOfHour(lastTimestamp) AS bucket,
+       count() AS events, countIf(eventStatus = 'ADDED') AS new_events
+FROM k8s_events
+WHERE eventStatus != 'DELETED'
+GROUP BY k8s, namespace, kind, reason, level, bucket;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS k8s_events_rollup_1d_mv TO k8s_events_rollup_1d AS
+SELECT k8s, namespace, kind, reason, level, toStartOfDay(lastTimestamp) AS bucket,
+       count() AS events, countIf(eventStatus = 'ADDED') AS new_events
+FROM k8s_events
+WHERE eventStatus != 'DELETED'
+GROUP BY k8s, namespace, kind, reason, level, bucket;
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件告警去重缓存
+基于OrderedDict按过期顺序保存告警记录，过期清理均摊O(1)，支持容量上限和落盘持久化
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from loguru import logger
+
+
+# 去重键模式
+DEDUP_KEY_EVENT_UID = 'eventUid'
+DEDUP_KEY_RULE_OBJECT = 'rule_object'
+
+
+class AlertDedupCache:
+    """告警去重缓存
+
+    特性:
+    - 记录按最后告警时间排序，过期项总是位于头部，清理时只弹出头部过期项
+    - 超过容量上限时淘汰最早的记录，内存占用有硬上限
+    - 去重键可选eventUid，或者规则名+涉及对象(k8s/namespace/kind/name)
+    - 可选持久化到磁盘，重启后恢复未过期的去重状态，避免告警风暴
+    """
+
+    def __init__(
+        self,
+        window: int,
+        max_entries: int = 10000,
+        key_mode: str = DEDUP_KEY_EVENT_UID,
+        persist_file: str = None,
+        persist_interval: int = 30,
+    ):
+        """初始化去重缓存
+
+        Args:
+            window: 去重时间窗口（秒）
+            max_entries: 最大缓存条数
+            key_mode: 去重键模式，eventUid 或 rule_object
+            persist_file: 持久化文件路径，为空则不持久化
+            persist_interval: 持久化最小间隔（秒）
+        """
+        if key_mode not in (DEDUP_KEY_EVENT_UID, DEDUP_KEY_RULE_OBJECT):
+            logger.warning(f"未知的告警去重键模式: {key_mode}，使用默认的{DEDUP_KEY_EVENT_UID}")
+            key_mode = DEDUP_KEY_EVENT_UID
+
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.key_mode = key_mode
+        self.persist_file = persist_file
+        self.persist_interval = persist_interval
+
+        # {dedup_key: last_alert_timestamp}，按时间戳升序排列
+        self._entries: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_persist = 0.0
+        self.evicted = 0
+        self.expired = 0
+
+        if self.persist_file:
+            self._load()
+
+    def build_key(self, event: Dict[str, Any], rule: Dict[str, Any] = None) -> Optional[str]:
+        """根据去重键模式构建去重键
+
+        Args:
+            event: K8S事件数据
+            rule: 匹配到的告警规则
+
+        Returns:
+            Optional[str]: 去重键，无法构建时返回None
+        """
+        if self.key_mode == DEDUP_KEY_RULE_OBJECT:
+            rule_name = (rule or {}).get('name', '')
+            return '|'.join(
+                [
+                    rule_name,
+                    str(event.get('k8s', '')),
+                    str(event.get('namespace', '')),
+                    str(event.get('kind', '')),
+                    str(event.get('name', '')),
+                ]
+            )
+        event_uid = event.get('eventUid')
+        return str(event_uid) if event_uid else None
+
+    def get(self, key: str) -> Optional[float]:
+        """获取未过期的上次告警时间
+
+        Args:
+            key: 去重键
+
+        Returns:
+            Optional[float]: 上次告警时间戳，不存在或已过期返回None
+        """
+        if not key:
+            return None
+        with self._lock:
+            self._expire(time.time())
+            return self._entries.get(key)
+
+    def should_skip(self, key: str) -> bool:
+        """检查去重键是否仍在去重时间窗口内
+
+        Args:
+            key: 去重键
+
+        Returns:
+            bool: True表示应该跳过告警
+        """
+        return self.get(key) is not None
+
+    def record(self, key: str) -> None:
+        """记录告警时间
+
+        Args:
+            key: 去重键
+        """
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            # 重新插入到尾部，保持按时间排序
+            self._entries.pop(key, None)
+            self._entries[key] = now
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._expire(now)
+            self._dirty = True
+        self._maybe_persist(now)
+
+    def _expire(self, current_time: float) -> None:
+        """弹出头部所有过期项，调用方需持有锁
+
+        Args:
+            current_time: 当前时间戳
+        """
+        entries = self._entries
+        while entries:
+            key, timestamp = next(iter(entries.items()))
+            if current_time - timestamp < self.window:
+                break
+            entries.popitem(last=False)
+            self.expired += 1
+            self._dirty = True
+
+    def _maybe_persist(self, current_time: float) -> None:
+        """距上次持久化超过间隔时写入磁盘"""
+        if self.persist_file and current_time - self._last_persist >= self.persist_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """将未过期的去重状态写入磁盘（先写临时文件再原子替换）"""
+        if not self.persist_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._expire(time.time())
+            snapshot = list(self._entries.items())
+            self._dirty = False
+            self._last_persist = time.time()
+        tmp_file = f"{self.persist_file}.tmp"
+        try:
+            persist_dir = os.path.dirname(self.persist_file)
+            if persist_dir:
+                os.makedirs(persist_dir, exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'key_mode': self.key_mode, 'entries': snapshot}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.persist_file)
+            logger.debug(f"告警去重缓存已持久化: {len(snapshot)} 条")
+        except Exception as e:
+            logger.error(f"告警去重缓存持久化失败: {e}")
+
+    def _load(self) -> None:
+        """从磁盘恢复未过期的去重状态"""
+        if not os.path.exists(self.persist_file):
+            return
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('key_mode') != self.key_mode:
+                logger.warning("告警去重缓存文件的键模式与当前配置不一致，忽略历史状态")
+                return
+            now = time.time()
+            entries = sorted(
+                ((key, float(ts)) for key, ts in data.get('entries', []) if now - float(ts) < self.window),
+                key=lambda item: item[1],
+            )
+            for key, ts in entries[-self.max_entries :]:
+                self._entries[key] = ts
+            logger.info(f"已从 {self.persist_file} 恢复 {len(self._entries)} 条告警去重记录")
+        except Exception as e:
+            logger.error(f"加载告警去重缓存失败: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_info(self) -> Dict[str, Any]:
+        """获取缓存统计信息
+
+        Returns:
+            Dict: 缓存统计信息
+        """
+        with self._lock:
+            self._expire(time.time())
+            return {
+                'total_cache_items': len(self._entries),
+                'max_cache_items': self.max_entries,
+                'dedup_key_mode': self.key_mode,
+                'evicted_count': self.evicted,
+                'expired_count': self.expired,
+                'persist_file': self.persist_file or '',
+            }
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件窗口聚合告警
+基于内存滑动窗口计数器，对同一工作负载在时间窗口内的事件进行聚合，事件风暴时只发送一条聚合告警
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Any
+
+
+# 默认聚合维度
+DEFAULT_GROUP_BY = ['k8s', 'namespace', 'owner', 'reason']
+# 每个窗口划分的桶数，桶越多窗口边界越精确
+WINDOW_BUCKETS = 30
+# 每个聚合键最多记录的涉及对象数
+MAX_SAMPLE_OBJECTS = 5
+
+# Deployment创建的Pod: <deployment>-<pod-template-hash>-<5位随机串>
+_DEPLOY_POD_PATTERN = re.compile(r'^(?P<owner>.+)-[a-z0-9]{6,10}-[a-z0-9]{5}$')
+# StatefulSet创建的Pod: <statefulset>-<序号>
+_STS_POD_PATTERN = re.compile(r'^(?P<owner>.+)-\d+$')
+# DaemonSet/Job创建的Pod、ReplicaSet: <owner>-<随机串>
+_SUFFIX_PATTERN = re.compile(r'^(?P<owner>.+)-[a-z0-9]{5,10}$')
+
+
+def resolve_owner(event: Dict[str, Any]) -> str:
+    """根据涉及对象名称推断所属工作负载名称
+
+    Args:
+        event: K8S事件数据
+
+    Returns:
+        str: 工作负载名称，无法推断时返回对象名称
+    """
+    name = str(event.get('name', ''))
+    kind = event.get('kind', '')
+    if kind == 'Pod':
+        for pattern in (_DEPLOY_POD_PATTERN, _STS_POD_PATTERN, _SUFFIX_PATTERN):
+            matched = pattern.match(name)
+            if matched:
+                return matched.group('owner')
+    elif kind == 'ReplicaSet':
+        matched = _SUFFIX_PATTERN.match(name)
+        if matched:
+            return matched.group('owner')
+    return name
+
+
+class SlidingWindowCounter:
+    """分桶滑动窗口计数器，增加计数和过期均为均摊O(1)"""
+
+    __slots__ = ('window', 'bucket_size', 'buckets', 'total', 'objects', 'last_fired')
+
+    def __init__(self, window: int):
+        self.window = window
+        self.bucket_size = max(1.0, window / WINDOW_BUCKETS)
+        # [(bucket_start, count)]
+        self.buckets = deque()
+        self.total = 0
+        self.objects = OrderedDict()
+        self.last_fired = 0.0
+
+    def add(self, now: float, obj: str = None) -> int:
+        """增加一次计数并返回窗口内总数"""
+        bucket_start = now - now % self.bucket_size
+        if self.buckets and self.buckets[-1][0] == bucket_start:
+            self.buckets[-1][1] += 1
+        else:
+            self.buckets.append([bucket_start, 1])
+        self.total += 1
+        if obj:
+            self.objects.pop(obj, None)
+            self.objects[obj] = None
+            if len(self.objects) > MAX_SAMPLE_OBJECTS:
+                self.objects.popitem(last=False)
+        self.expire(now)
+        return self.total
+
+    def expire(self, now: float) -> None:
+        """移除窗口外的桶"""
+        while self.buckets and self.buckets[0][0] + self.bucket_size <= now - self.window:
+            _, count = self.buckets.popleft()
+            self.total -= count
+
+
+class EventAggregator:
+    """事件窗口聚合器
+
+    聚合规则示例:
+    {
+      "name": "BackOff风暴",
+      "severity": "warning",
+      "window": 300,
+      "threshold": 20,
+      "group_by": ["k8s", "namespace", "owner", "reason"],
+      "conditions": {"reason": {"equals": "BackOff"}}
+    }
+    窗口内同一聚合键的事件数超过threshold时发送一条聚合告警，并在一个窗口内抑制该键的逐条告警
+    """
+
+    def __init__(self, max_keys: int = 50000):
+        """初始化聚合器
+
+        Args:
+            max_keys: 最大聚合键数量，超出后淘汰最久未更新的键
+        """
+        self.max_keys = max_keys
+        # {(rule_name, group_key): SlidingWindowCounter}，按最近更新时间排序
+        self._counters: 'OrderedDict[tuple, SlidingWindowCounter]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_window = 0
+
+    def reset(self) -> None:
+        """清空所有计数器（规则重新加载时调用）"""
+        with self._lock:
+            self._counters.clear()
+            self._max_window = 0
+
+    def observe(self, event: Dict[str, Any], rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """记录事件并判断是否触发聚合告警
+
+        Args:
+            event: K8S事件数据
+            rules: 事件命中的聚合规则列表
+
+        Returns:
+            Dict: {'alerts': 本次触发的聚合告警结果列表, 'suppressed': 是否处于风暴中需抑制逐条告警}
+        """
+        result = {'alerts': [], 'suppressed': False}
+        if not rules:
+            return result
+
+        now = time.time()
+        owner = resolve_owner(event)
+        obj = f"{event.get('kind', '')}/{event.get('name', '')}"
+
+        with self._lock:
+            for rule in rules:
+                window = int(rule.get('window', 300))
+                threshold = int(rule.get('threshold', 10))
+                group_by = rule.get('group_by', DEFAULT_GROUP_BY)
+                group_values = tuple(owner if field == 'owner' else str(event.get(field, '')) for field in group_by)
+                key = (rule.get('name', ''), group_values)
+
+                counter = self._counters.pop(key, None)
+                if counter is None or counter.window != window:
+                    counter = SlidingWindowCounter(window)
+                self._counters[key] = counter
+                self._max_window = max(self._max_window, window)
+
+                total = counter.add(now, obj)
+                in_storm = now - counter.last_fired < window
+                if total > threshold and not in_storm:
+                    counter.last_fired = now
+                    in_storm = True
+                    result['alerts'].append(
+                        {
+                            'rule': rule,
+                            'event': event,
+                            'group': dict(zip(group_by, group_values)),
+                            'total': total,
+                            'objects': list(counter.objects),
+                        }
+                    )
+                if in_storm:
+                    result['suppressed'] = True
+
+            self._evict(now)
+
+        return result
+
+    def _evict(self, now: float) -> None:
+        """淘汰空闲或超量的计数器，调用方需持有锁"""
+        counters = self._counters
+        while counters:
+            key, counter = next(iter(counters.items()))
+            idle = not counter.buckets or counter.buckets[-1][0] + counter.bucket_size <= now - self._max_window
+            if len(counters) > self.max_keys or (idle and now - counter.last_fired >= counter.window):
+                counters.popitem(last=False)
+            else:
+                break
+
+    def get_info(self) -> Dict[str, Any]:
+        """获取聚合器统计信息"""
+        with self._lock:
+            return {'active_groups': len(self._counters), 'max_groups': self.max_keys}
+
+
+def build_aggregate_message(aggregate_result: Dict[str, Any]) -> str:
+    """构建聚合告警消息
+
+    Args:
+        aggregate_result: EventAggregator.observe返回的聚合告警结果
+
+    Returns:
+        str: 告警消息
+    """
+    rule = aggregate_result['rule']
+    event = aggregate_result['event']
+    group = aggregate_result['group']
+    severity = rule.get('severity', 'warning')
+    emoji_map = {'critical': '🚨', 'warning': '⚠️', 'info': 'ℹ️'}
+    emoji = emoji_map.get(severity, '⚠️')
+    group_str = ' '.join(f"{field}={value}" for field, value in group.items())
+    objects_str = '\n'.join(f"  - {obj}" for obj in aggregate_result['objects'])
+
+    message = f"""
+{emoji} K8S事件聚合告警: {rule.get('name', 'Unknown')}
+🔥 级别: {severity.upper()}
+⏰ 窗口: 最近{rule.get('window', 300)}秒内 {aggregate_result['total']} 次（阈值 {rule.get('threshold', 10)}）
+
+🎯 聚合详情:
+• 维度: {group_str}
+• 集群: {event.get('k8s', 'Unknown')}【{event.get('namespace', 'Unknown')}】
+• 原因: {event.get('reason', 'Unknown')}
+• 最新消息: {event.get('message', 'Unknown')}
+• 涉及对象:
+{objects_str}
+"""
+    return message
@@ -9,19 +9,33 @@ import time
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from loguru import logger
+import notifier
 from .alert_rule_matcher import AlertRuleMatcher
 from .clickhouse_client import get_clickhouse_client
-from utils import send_msg, ALERT_DEDUP_WINDOW
+from .dedup_cache import AlertDedupCache
+from .event_aggregator import EventAggregator, build_aggregate_message
+from utils import (
+    send_msg,
+    ALERT_DEDUP_WINDOW,
+    ALERT_DEDUP_MAX_ENTRIES,
+    ALERT_DEDUP_KEY,
+    ALERT_DEDUP_PERSIST_FILE,
+)
+
+
+# 一次ALTER UPDATE标记的被抑制事件上限
+MARK_BATCH_SIZE = 1000
 
 
 class EventAlertProcessor:
     """事件告警处理器"""
 
-    def __init__(self, rules_file: str = None):
+    def __init__(self, rules_file: str = None, shard_id: int = None):
         """初始化事件告警处理器
 
         Args:
             rules_file: 规则文件路径
+            shard_id: 多进程分片编号，用于区分各分片的去重持久化文件
         """
         self.rule_matcher = AlertRuleMatcher(rules_file)
         self.stats = {
@@ -31,10 +45,25 @@ class EventAlertProcessor:
             'alerts_sent': 0,
             'errors': 0,
             'dedup_blocked': 0,
+            'aggregate_alerts': 0,
+            'aggregate_suppressed': 0,
         }
-        # 告警去重缓存: {eventUid: last_alert_timestamp}
-        self._alert_cache = {}
+        # 告警去重缓存: {dedup_key: last_alert_timestamp}
         self._dedup_window = ALERT_DEDUP_WINDOW
+        persist_file = ALERT_DEDUP_PERSIST_FILE or None
+        if persist_file and shard_id is not None:
+            persist_file = f"{persist_file}.{shard_id}"
+        self._alert_cache = AlertDedupCache(
+            window=ALERT_DEDUP_WINDOW,
+            max_entries=ALERT_DEDUP_MAX_ENTRIES,
+            key_mode=ALERT_DEDUP_KEY,
+            persist_file=persist_file,
+        )
+        # 窗口聚合计数器
+        self.aggregator = EventAggregator()
+        # 被聚合告警抑制的事件，每个聚合窗口合并为一次ALTER UPDATE，避免风暴期间逐条发起mutation
+        self._pending_marks: List[str] = []
+        self._marks_deadline: Optional[float] = None
 
     def process_event(self, event: Dict[str, Any], msg_token: str = None) -> Optional[Dict[str, Any]]:
         """处理单个事件
@@ -48,6 +77,7 @@ class EventAlertProcessor:
         """
         try:
             self.stats['total_events'] += 1
+            self.flush_alert_marks()
 
             # 硬编码忽略 eventStatus=DELETED 的事件，不做任何告警处理
             if event.get('eventStatus') == 'DELETED':
@@ -61,28 +91,32 @@ class EventAlertProcessor:
                 logger.debug(f"事件被忽略: {event.get('eventUid')}")
                 return None
 
+            # 窗口聚合规则：风暴期间只发送一条聚合告警，抑制逐条告警
+            aggregate_rules = self.rule_matcher.match_aggregate_rules(event)
+            if aggregate_rules:
+                aggregate = self.aggregator.observe(event, aggregate_rules)
+                aggregate_info = None
+                for aggregate_result in aggregate['alerts']:
+                    aggregate_info = self._send_aggregate_alert(aggregate_result, msg_token)
+                if aggregate['suppressed']:
+                    self.stats['aggregate_suppressed'] += 1
+                    logger.debug(f"事件处于聚合窗口内，逐条告警被抑制: {event.get('eventUid')}")
+                    # 只有聚合告警已发送时才会抑制，被抑制的事件已由聚合告警覆盖
+                    window = min(int(rule.get('window', 300)) for rule in aggregate_rules)
+                    self._queue_mark(event.get('eventUid'), window)
+                    return aggregate_info
+
             # 匹配告警规则
             alert_result = self.rule_matcher.match_alert_rules(event)
 
             if alert_result:
                 self.stats['matched_events'] += 1
-                event_uid = event.get('eventUid')
-                # 更新数据库中对应eventUid的level字段为"已告警"
-                try:
-                    clickhouse_client = get_clickhouse_client()
-                    # 使用ALTER UPDATE语句更新level字段
-                    update_sql = """
-                    ALTER TABLE k8s_events 
-                    UPDATE level = '已告警' 
-                    WHERE eventUid = %s
-                    """
-                    clickhouse_client.pool.execute_query(update_sql, [event_uid])
-                    logger.info(f"已更新eventUid {event_uid} 的level字段为'已告警'")
-                except Exception as update_e:
-                    logger.error(f"更新level字段失败: {update_e}")
+                self._mark_alerted([event.get('eventUid')])
 
                 # 检查告警去重
-                if self._should_skip_alert(event_uid):
+                dedup_key = self._alert_cache.build_key(event, alert_result['rule'])
+                last_alert_time = self._alert_cache.get(dedup_key)
+                if last_alert_time is not None:
                     self.stats['dedup_blocked'] += 1
                     # 构建资源信息
                     kind = event.get('kind', 'Unknown')
@@ -93,11 +127,7 @@ class EventAlertProcessor:
                     resource_info = f"{kind}/{name}"
 
                     # 获取上次告警时间
-                    last_alert_time = self._alert_cache.get(event_uid)
-                    last_alert_str = "未知"
-                    if last_alert_time:
-                        last_alert_datetime = datetime.fromtimestamp(last_alert_time)
-                        last_alert_str = last_alert_datetime.strftime('%Y-%m-%d %H:%M:%S')
+                    last_alert_str = datetime.fromtimestamp(last_alert_time).strftime('%Y-%m-%d %H:%M:%S')
 
                     logger.warning(
                         f"💤告警被去重阻止(上次告警: {last_alert_str} 时间窗口:{self._dedup_window}秒) - 集群: {k8s_cluster} 资源: {resource_info} 原因: {reason}：{count}次"
@@ -114,9 +144,10 @@ class EventAlertProcessor:
                     self.stats['alerts_sent'] += 1
 
                     # 记录告警时间用于去重
-                    self._record_alert(event_uid)
+                    self._alert_cache.record(dedup_key)
 
-                    logger.info(f"告警已发送: {alert_info['alert_id']}, 响应: {response}")
+                    # send_msg只负责入队，实际发送结果见notify_stats
+                    logger.info(f"告警已提交通知队列: {alert_info['alert_id']}, 响应: {response}")
                 except Exception as e:
                     logger.error(f"发送告警失败: {e}")
                     self.stats['errors'] += 1
@@ -187,9 +218,85 @@ class EventAlertProcessor:
 
         return alert_info
 
+    def _mark_alerted(self, event_uids: List[str]) -> None:
+        """更新数据库中对应eventUid的level字段为"已告警"，多个事件合并为一次mutation
+
+        Args:
+            event_uids: 事件UID列表
+        """
+        try:
+            clickhouse_client = get_clickhouse_client()
+            # 使用ALTER UPDATE语句更新level字段
+            update_sql = f"""
+            ALTER TABLE k8s_events 
+            UPDATE level = '已告警' 
+            WHERE eventUid IN ({', '.join(['%s'] * len(event_uids))})
+            """
+            clickhouse_client.pool.execute_query(update_sql, list(event_uids))
+            if len(event_uids) == 1:
+                logger.info(f"已更新eventUid {event_uids[0]} 的level字段为'已告警'")
+            else:
+                logger.info(f"已更新 {len(event_uids)} 个被聚合告警覆盖的事件的level字段为'已告警'")
+        except Exception as update_e:
+            logger.error(f"更新level字段失败: {update_e}")
+
+    def _queue_mark(self, event_uid: str, window: int) -> None:
+        """记录被聚合告警抑制的事件，窗口结束或数量达到上限时统一标记
+
+        Args:
+            event_uid: 事件UID
+            window: 抑制该事件的聚合规则中最短的窗口（秒）
+        """
+        if self._marks_deadline is None:
+            self._marks_deadline = time.monotonic() + window
+        self._pending_marks.append(event_uid)
+        if len(self._pending_marks) >= MARK_BATCH_SIZE:
+            self.flush_alert_marks(force=True)
+
+    def flush_alert_marks(self, force: bool = False) -> None:
+        """标记等待中的被抑制事件
+
+        Args:
+            force: 为True时不等待聚合窗口结束，立即标记
+        """
+        if not self._pending_marks:
+            return
+        if not force and time.monotonic() < self._marks_deadline:
+            return
+        event_uids, self._pending_marks = self._pending_marks, []
+        self._marks_deadline = None
+        self._mark_alerted(event_uids)
+
+    def _send_aggregate_alert(self, aggregate_result: Dict[str, Any], msg_token: str = None) -> Dict[str, Any]:
+        """发送聚合告警
+
+        Args:
+            aggregate_result: 聚合告警结果
+            msg_token: 消息令牌
+
+        Returns:
+            Dict: 告警信息
+        """
+        rule = aggregate_result['rule']
+        group_id = '_'.join(str(v) for v in aggregate_result['group'].values())
+        alert_info = {
+            'alert_id': f"{rule.get('name', 'unknown')}_{group_id}_{int(datetime.now().timestamp())}",
+            'message': build_aggregate_message(aggregate_result),
+        }
+        try:
+            response = send_msg(alert_info['message'], msg_token)
+            self.stats['aggregate_alerts'] += 1
+            self.stats['alerts_sent'] += 1
+            logger.info(f"聚合告警已提交通知队列: {alert_info['alert_id']}, 窗口内 {aggregate_result['total']} 次, 响应: {response}")
+        except Exception as e:
+            logger.error(f"发送聚合告警失败: {e}")
+            self.stats['errors'] += 1
+        return alert_info
+
     def reload_rules(self) -> None:
         """重新加载规则"""
         self.rule_matcher.reload_rules()
+        self.aggregator.reset()
         logger.info("告警规则已重新加载")
 
     def get_stats(self) -> Dict[str, Any]:
@@ -203,6 +310,9 @@ class EventAlertProcessor:
         return {
             'processor_stats': self.stats.copy(),
             'rule_stats': rule_stats,
+            'aggregate_stats': self.aggregator.get_info(),
+            # alerts_sent 只统计入队数，IM接口的实际发送/失败/丢弃数以此为准
+            'notify_stats': notifier.get_stats(),
             'alert_rate': self.stats['matched_events'] / max(self.stats['total_events'], 1) * 100,
         }
 
@@ -215,77 +325,24 @@ class EventAlertProcessor:
             'alerts_sent': 0,
             'errors': 0,
             'dedup_blocked': 0,
+            'aggregate_alerts': 0,
+            'aggregate_suppressed': 0,
         }
         logger.info("统计信息已重置")
 
-    def _should_skip_alert(self, event_uid: str) -> bool:
-        """检查是否应该跳过告警（去重检查）
-
-        Args:
-            event_uid: 事件唯一标识
-
-        Returns:
-            bool: True表示应该跳过告警，False表示可以发送告警
-        """
-        if not event_uid:
-            return False
-
-        current_time = time.time()
-
-        # 懒清理：检查时顺便清理过期的缓存项
-        self._lazy_cleanup_cache(current_time)
-
-        # 检查是否在去重时间窗口内
-        last_alert_time = self._alert_cache.get(event_uid)
-        if last_alert_time and (current_time - last_alert_time) < self._dedup_window:
-            return True
-
-        return False
-
-    def _record_alert(self, event_uid: str) -> None:
-        """记录告警时间
-
-        Args:
-            event_uid: 事件唯一标识
-        """
-        if event_uid:
-            self._alert_cache[event_uid] = time.time()
-
-    def _lazy_cleanup_cache(self, current_time: float) -> None:
-        """懒清理过期的缓存项
-
-        Args:
-            current_time: 当前时间戳
-        """
-        # 只有当缓存项超过一定数量时才进行清理，避免频繁清理
-        if len(self._alert_cache) < 100:
-            return
-
-        # 清理过期的缓存项
-        expired_keys = [
-            key for key, timestamp in self._alert_cache.items() if (current_time - timestamp) >= self._dedup_window
-        ]
-
-        for key in expired_keys:
-            del self._alert_cache[key]
-
-        if expired_keys:
-            logger.debug(f"清理了 {len(expired_keys)} 个过期的告警去重缓存项")
-
     def get_dedup_cache_info(self) -> Dict[str, Any]:
         """获取去重缓存信息
 
         Returns:
             Dict: 缓存信息统计
         """
-        current_time = time.time()
-        active_count = sum(
-            1 for timestamp in self._alert_cache.values() if (current_time - timestamp) < self._dedup_window
-        )
-
-        return {
-            'total_cache_items': len(self._alert_cache),
-            'active_cache_items': active_count,
-            'dedup_window_seconds': self._dedup_window,
-            'dedup_blocked_count': self.stats.get('dedup_blocked', 0),
-        }
+        cache_info = self._alert_cache.get_info()
+        # 过期项在访问时已被清理，缓存中的记录均处于去重窗口内
+        cache_info['active_cache_items'] = cache_info['total_cache_items']
+        cache_info['dedup_window_seconds'] = self._dedup_window
+        cache_info['dedup_blocked_count'] = self.stats.get('dedup_blocked', 0)
+        return cache_info
+
+    def flush_dedup_cache(self) -> None:
+        """将告警去重状态写入磁盘（未配置持久化时无操作）"""
+        self._alert_cache.flush()
@@ -5,20 +5,50 @@ K8S事件处理器模块
 负责处理从kubedoor-agent接收到的K8S事件数据，并存储到ClickHouse
 """
 
-from typing import Dict, Any, Optional
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
 from datetime import datetime, timezone, timedelta
 from loguru import logger
 from .clickhouse_client import get_clickhouse_client
 from .event_alert_processor import EventAlertProcessor
+from .event_spool import EventSpool, SpoolReplayer
+from .agent_filter import reload_agent_filter
+from .worker_pool import get_worker_pool, start_worker_pool, stop_worker_pool
+from utils import (
+    EVENT_WORKERS,
+    EVENT_QUEUE_SIZE,
+    EVENT_SPOOL_DIR,
+    EVENT_SPOOL_MAX_MB,
+    EVENT_SPOOL_BATCH_SIZE,
+    EVENT_SPOOL_REPLAY_RATE,
+)
+
+# ClickHouse写入失败后直接写入暂存的时长（秒），避免每条事件都等待超时
+CK_FAILURE_BACKOFF = 10
 
 
 class K8SEventProcessor:
     """K8S事件处理器类"""
 
-    def __init__(self):
-        """初始化事件处理器"""
+    def __init__(self, shard_id: int = None):
+        """初始化事件处理器
+
+        Args:
+            shard_id: 多进程分片编号，单进程模式为None
+        """
         self.clickhouse_client = get_clickhouse_client()
-        self.alert_processor = EventAlertProcessor()
+        self.alert_processor = EventAlertProcessor(shard_id=shard_id)
+        self._ck_down_until = 0.0
+        self.spool = None
+        if EVENT_SPOOL_DIR:
+            spool_name = f"shard-{shard_id}" if shard_id is not None else 'local'
+            self.spool = EventSpool(
+                os.path.join(EVENT_SPOOL_DIR, spool_name), max_bytes=EVENT_SPOOL_MAX_MB * 1024 * 1024
+            )
+            SpoolReplayer(self.spool, self._replay_events, EVENT_SPOOL_BATCH_SIZE, EVENT_SPOOL_REPLAY_RATE).start()
         logger.info("K8S事件处理器已初始化")
 
     def process_event_message(self, message_data: Dict[str, Any]) -> bool:
@@ -49,8 +79,8 @@ class K8SEventProcessor:
                 logger.warning("处理事件数据失败")
                 return False
 
-            # 存储到ClickHouse
-            self.clickhouse_client.upsert_event(processed_data)
+            # 存储到ClickHouse，失败时写入本地暂存，恢复后由后台线程回放
+            self._store_events([event_data], [processed_data])
 
             # 处理告警规则匹配
             try:
@@ -72,6 +102,103 @@ class K8SEventProcessor:
             logger.error(f"消息数据: {message_data}")
             return False
 
+    def process_event_batch(self, message_data: Dict[str, Any]) -> int:
+        """
+        处理agent合并发送的K8S事件批量消息，批内事件一次写入ClickHouse后逐条匹配告警
+
+        Args:
+            message_data: 批量消息字典，data为事件数据列表
+
+        Returns:
+            int: 成功处理的事件数
+        """
+        if message_data.get('type') != 'k8s_event_batch':
+            logger.warning(f"无效的消息类型: {message_data.get('type')}")
+            return 0
+
+        event_list = []
+        processed_list = []
+        for event_data in message_data.get('data') or []:
+            processed_data = self._process_event_data(event_data) if event_data else None
+            if not processed_data:
+                logger.warning(f"处理事件数据失败: {event_data}")
+                continue
+            event_list.append(event_data)
+            processed_list.append(processed_data)
+        if not processed_list:
+            return 0
+
+        try:
+            self._store_events(event_list, processed_list)
+        except Exception as e:
+            logger.error(f"批量存储K8S事件失败: {e}")
+            return 0
+
+        for event_data, processed_data in zip(event_list, processed_list):
+            try:
+                self.alert_processor.process_event(processed_data, event_data.get('msgToken'))
+            except Exception as e:
+                logger.error(f"处理告警规则失败: {e}")
+
+        logger.info(f"成功处理K8S事件批量消息: {len(processed_list)} 条")
+        return len(processed_list)
+
+    def _store_events(self, event_list: List[Dict[str, Any]], processed_list: List[Dict[str, Any]]) -> None:
+        """批量写入ClickHouse，不可用时写入本地暂存
+
+        Args:
+            event_list: 原始事件数据列表（暂存格式）
+            processed_list: 处理后的事件数据列表，与event_list一一对应
+        """
+        if self.spool is not None and time.monotonic() < self._ck_down_until:
+            spooled = self._spool_events(event_list)
+            if spooled == len(event_list):
+                return
+            # 暂存写满时，只有未写入暂存的事件继续尝试写ClickHouse，避免重复
+            event_list, processed_list = event_list[spooled:], processed_list[spooled:]
+        try:
+            self.clickhouse_client.insert_events(processed_list)
+        except Exception:
+            if self.spool is None:
+                raise
+            self._ck_down_until = time.monotonic() + CK_FAILURE_BACKOFF
+            spooled = self._spool_events(event_list)
+            if spooled < len(event_list):
+                logger.error(f"ClickHouse写入失败且暂存已满，{len(event_list) - spooled} 条事件丢失")
+                raise
+            logger.warning(f"ClickHouse写入失败，{len(event_list)} 条事件已写入本地暂存")
+
+    def _spool_events(self, event_list: List[Dict[str, Any]]) -> int:
+        """按顺序写入本地暂存，遇到写入失败即停止
+
+        Returns:
+            int: 成功写入暂存的事件数，即event_list中前多少条已暂存
+        """
+        for index, event_data in enumerate(event_list):
+            if not self.spool.append(event_data):
+                return index
+        return len(event_list)
+
+    def _replay_events(self, records: List[Dict[str, Any]]) -> None:
+        """将暂存的原始事件批量写回ClickHouse（不重复触发告警）
+
+        Args:
+            records: 暂存的原始事件数据列表
+        """
+        events = [event for event in (self._process_event_data(record) for record in records) if event]
+        self.clickhouse_client.insert_events(events)
+        self._ck_down_until = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取告警及暂存统计信息
+
+        Returns:
+            Dict: 统计信息
+        """
+        stats = self.alert_processor.get_stats()
+        stats['spool_stats'] = self.spool.get_stats() if self.spool is not None else {}
+        return stats
+
     def _process_event_data(self, event_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         处理和转换事件数据为ClickHouse格式
@@ -218,6 +345,8 @@ class K8SEventProcessor:
 
 # 全局事件处理器实例
 _event_processor: Optional[K8SEventProcessor] = None
+# 单进程模式下的事件处理线程，单线程保证事件顺序且统计信息无并发修改
+_event_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='k8s-event')
 
 
 def get_event_processor() -> K8SEventProcessor:
@@ -228,10 +357,37 @@ def get_event_processor() -> K8SEventProcessor:
     return _event_processor
 
 
+def start_event_workers() -> None:
+    """按EVENT_WORKERS配置启动多进程分片处理，为0时使用单进程模式"""
+    if EVENT_WORKERS > 0:
+        overflow_spool = None
+        if EVENT_SPOOL_DIR:
+            overflow_spool = EventSpool(
+                os.path.join(EVENT_SPOOL_DIR, 'overflow'), max_bytes=EVENT_SPOOL_MAX_MB * 1024 * 1024
+            )
+        start_worker_pool(EVENT_WORKERS, EVENT_QUEUE_SIZE, overflow_spool)
+    else:
+        logger.info("K8S事件使用单进程模式处理")
+
+
+def stop_event_workers() -> None:
+    """停止事件处理并保存告警去重状态"""
+    if get_worker_pool() is not None:
+        stop_worker_pool()
+    elif _event_processor is not None:
+        _event_processor.alert_processor.flush_alert_marks(force=True)
+        _event_processor.alert_processor.flush_dedup_cache()
+
+
 def reload_alert_rules() -> None:
     """重新加载告警规则"""
-    processor = get_event_processor()
-    processor.alert_processor.reload_rules()
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.reload_rules()
+    else:
+        processor = get_event_processor()
+        processor.alert_processor.reload_rules()
+    reload_agent_filter()
     logger.info("告警规则已重新加载")
 
 
@@ -239,34 +395,65 @@ def get_alert_stats() -> Dict[str, Any]:
     """获取告警统计信息
 
     Returns:
-        Dict: 告警统计信息
+        Dict: 告警统计信息，多进程模式下为各分片合并后的结果
     """
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.get_stats()
     processor = get_event_processor()
-    return processor.alert_processor.get_stats()
+    return processor.get_stats()
 
 
 async def process_k8s_event_async(message_data: Dict[str, Any]) -> bool:
     """
     处理K8S事件消息的便捷函数（异步版本）
 
-    使用asyncio.to_thread将同步操作转为异步，避免阻塞事件循环
+    多进程模式下按K8S集群投递到对应分片后立即返回；
+    单进程模式下在专用线程中串行处理，避免阻塞事件循环
 
     Args:
         message_data: 事件消息数据
 
     Returns:
-        bool: 处理是否成功
+        bool: 多进程模式下表示是否成功投递，单进程模式下表示处理是否成功
     """
-    import asyncio
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.submit(message_data)
 
     def _sync_process():
         processor = get_event_processor()
         return processor.process_event_message(message_data)
 
     try:
-        # 使用线程池执行同步操作，避免阻塞事件循环
-        result = await asyncio.to_thread(_sync_process)
-        return result
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_event_executor, _sync_process)
     except Exception as e:
         logger.error(f"异步处理K8S事件失败: {e}")
         return False
+
+
+async def process_k8s_event_batch_async(message_data: Dict[str, Any]) -> int:
+    """
+    处理K8S事件批量消息的便捷函数（异步版本）
+
+    Args:
+        message_data: 批量消息数据，data为事件数据列表
+
+    Returns:
+        int: 多进程模式下为成功投递的事件数，单进程模式下为成功处理的事件数
+    """
+    pool = get_worker_pool()
+    if pool is not None:
+        return len(message_data.get('data') or []) if pool.submit(message_data) else 0
+
+    def _sync_process():
+        processor = get_event_processor()
+        return processor.process_event_batch(message_data)
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_event_executor, _sync_process)
+    except Exception as e:
+        logger.error(f"异步处理K8S事件批量消息失败: {e}")
+        return 0
@@ -5,11 +5,20 @@ K8S事件查询API模块
 提供K8S事件的高级查询接口
 """
 
+import io
+import csv
+import json
+import time
+import base64
 import asyncio
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from aiohttp import web
 from loguru import logger
 from .clickhouse_client import get_clickhouse_client
+from .event_processor import get_alert_stats
+from .agent_filter import get_agent_filter_stats
 
 
 def serialize_datetime_objects(data):
@@ -26,6 +35,88 @@ def serialize_datetime_objects(data):
         return data
 
 
+# 菜单选项字段
+MENU_FIELDS = ['namespace', 'kind', 'name', 'reason', 'reportingComponent', 'reportingInstance']
+# 菜单选项缓存时间（秒）及最大缓存条数
+MENU_CACHE_TTL = 30
+MENU_CACHE_MAX_ENTRIES = 256
+# {(k8s, start_time, end_time, namespace): (expire_at, menu_options)}
+_menu_cache = OrderedDict()
+# 进行中的查询，相同参数的并发请求共享同一次查询
+_menu_inflight = {}
+
+
+def query_menu_options(k8s: str, start_time: str, end_time: str, namespace: str = None) -> dict:
+    """单次扫描查询所有菜单字段的唯一值
+
+    namespace过滤条件只作用于namespace以外的字段，与逐字段查询的结果一致
+
+    Returns:
+        dict: {字段名: 选项列表}，列表第一项为"[全部]"，空值显示为"[空值]"
+    """
+    select_params = []
+    namespace_condition = None
+    if namespace and namespace != "[全部]":
+        if namespace == "[空值]":
+            namespace_condition = "(namespace IS NULL OR namespace = '')"
+        else:
+            namespace_condition = "namespace = %s"
+
+    select_items = []
+    for field in MENU_FIELDS:
+        if namespace_condition and field != 'namespace':
+            select_items.append(f"groupUniqArrayIf(1000)({field}, {namespace_condition})")
+            if namespace_condition.endswith('%s'):
+                select_params.append(namespace)
+        else:
+            select_items.append(f"groupUniqArray(1000)({field})")
+
+    sql = f"""
+    SELECT {', '.join(select_items)}
+    FROM k8s_events
+    WHERE k8s = %s AND lastTimestamp >= %s AND lastTimestamp <= %s
+    """
+    params = select_params + [k8s, f'{start_time} 00:00:00', f'{end_time} 23:59:59']
+    result = get_clickhouse_client().pool.execute_query(sql, params)
+    row = result[0] if result else [[] for _ in MENU_FIELDS]
+
+    menu_options = {}
+    for field, values in zip(MENU_FIELDS, row):
+        # 在列表第一个位置添加"[全部]"选项，空值（None、空字符串等）显示为"[空值]"
+        field_values = ["[全部]"]
+        if any(not value for value in values):
+            field_values.append("[空值]")
+        field_values.extend(sorted(value for value in values if value))
+        menu_options[field] = field_values
+    return menu_options
+
+
+async def get_menu_options_cached(k8s: str, start_time: str, end_time: str, namespace: str = None) -> dict:
+    """带短时缓存和并发合并（singleflight）的菜单选项查询"""
+    key = (k8s, start_time, end_time, namespace)
+    now = time.monotonic()
+    cached = _menu_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    future = _menu_inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, query_menu_options, k8s, start_time, end_time, namespace)
+        _menu_inflight[key] = future
+        try:
+            menu_options = await future
+        finally:
+            _menu_inflight.pop(key, None)
+        _menu_cache.pop(key, None)
+        _menu_cache[key] = (time.monotonic() + MENU_CACHE_TTL, menu_options)
+        while len(_menu_cache) > MENU_CACHE_MAX_ENTRIES:
+            _menu_cache.popitem(last=False)
+        return menu_options
+
+    return await asyncio.shield(future)
+
+
 async def get_k8s_events_menu_options(request):
     """获取K8S事件查询的菜单选项"""
     try:
@@ -39,62 +130,7 @@ async def get_k8s_events_menu_options(request):
         if not all([k8s, start_time_str, end_time_str]):
             return web.json_response({"code": 400, "message": "缺少必填参数: k8s, start_time, end_time"})
 
-        # 获取ClickHouse客户端
-        clickhouse_client = get_clickhouse_client()
-
-        # 查询各字段的唯一值 - 并发执行
-        menu_fields = ['namespace', 'kind', 'name', 'reason', 'reportingComponent', 'reportingInstance']
-
-        async def query_field_options(field):
-            """异步查询单个字段的选项"""
-            try:
-                # 构建WHERE条件（移除IS NOT NULL条件以包含空值）
-                where_conditions = ["k8s = %s", "lastTimestamp >= %s", "lastTimestamp <= %s"]
-                params = [k8s, f'{start_time_str} 00:00:00', f'{end_time_str} 23:59:59']
-
-                # 如果传入了namespace参数，根据值添加相应的过滤条件
-                if namespace and field != 'namespace':
-                    if namespace == "[全部]":
-                        # [全部]表示不添加namespace过滤条件，查询所有namespace
-                        pass
-                    elif namespace == "[空值]":
-                        # [空值]表示查询namespace为空的记录
-                        where_conditions.append("(namespace IS NULL OR namespace = '')")
-                    else:
-                        # 具体的namespace值
-                        where_conditions.append("namespace = %s")
-                        params.append(namespace)
-
-                where_clause = " AND ".join(where_conditions)
-
-                sql = f"""
-                SELECT DISTINCT {field}
-                FROM k8s_events 
-                WHERE {where_clause}
-                ORDER BY {field}
-                LIMIT 1000
-                """
-                # 在线程池中执行同步的数据库查询
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, lambda: clickhouse_client.pool.execute_query(sql, params))
-                # 包含所有值，包括空值（None、空字符串等）
-                field_values = ["[全部]"]  # 在列表第一个位置添加"[全部]"选项
-                for row in result:
-                    value = row[0] if row[0] else "[空值]"
-                    if value not in field_values:  # 去重
-                        field_values.append(value)
-                return field, field_values
-
-            except Exception as e:
-                logger.error(f"查询{field}字段选项失败: {e}")
-                return field, []
-
-        # 并发执行所有字段查询
-        tasks = [query_field_options(field) for field in menu_fields]
-        results = await asyncio.gather(*tasks)
-
-        # 构建结果字典
-        menu_options = {field: options for field, options in results}
+        menu_options = await get_menu_options_cached(k8s, start_time_str, end_time_str, namespace)
 
         return web.json_response({"success": True, "data": menu_options})
 
@@ -103,11 +139,69 @@ async def get_k8s_events_menu_options(request):
         return web.json_response({"code": 500, "message": f"获取菜单选项失败: {str(e)}"})
 
 
+# 事件查询返回的列，与ClickHouseClient.build_events_query的SELECT顺序一致
+EVENT_QUERY_COLUMNS = [
+    'eventStatus',
+    'level',
+    'count',
+    'kind',
+    'k8s',
+    'namespace',
+    'name',
+    'reason',
+    'message',
+    'firstTimestamp',
+    'lastTimestamp',
+    'reportingComponent',
+    'reportingInstance',
+]
+# 流式导出时ClickHouse数据块的缓冲块数，控制内存占用
+STREAM_BUFFER_BLOCKS = 4
+
+
+def encode_cursor(last_timestamp, event_uid: str) -> str:
+    """将(lastTimestamp, eventUid)编码为分页游标"""
+    payload = json.dumps([serialize_datetime_objects(last_timestamp), event_uid])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str):
+    """解析分页游标，返回(lastTimestamp, eventUid)"""
+    last_timestamp, event_uid = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return str(last_timestamp), str(event_uid)
+
+
+def build_query_kwargs(data: dict) -> dict:
+    """从请求体构建query_events_advanced的查询参数"""
+    return dict(
+        k8s=data['k8s'],
+        start_time=data.get('start_time'),
+        end_time=data.get('end_time'),
+        namespace=data.get('namespace'),
+        count=data.get('count'),
+        level=data.get('level'),
+        kind=data.get('kind'),
+        name=data.get('name'),
+        reason=data.get('reason'),
+        reporting_component=data.get('reportingComponent'),
+        reporting_instance=data.get('reportingInstance'),
+        message=data.get('message'),
+    )
+
+
 async def query_k8s_events_handler(request):
-    """查询K8S事件接口"""
+    """查询K8S事件接口
+
+    请求体可选参数:
+    - cursor: 上一页返回的next_cursor，按(lastTimestamp, eventUid)键集分页
+    - format: json(默认) / ndjson / csv，后两者为流式导出，limit可省略
+    """
     try:
         # 获取请求体数据
         data = await request.json()
+        export_format = data.get('format', 'json')
+        if export_format in ('ndjson', 'csv'):
+            return await export_k8s_events(request, data, export_format)
 
         # 验证必填参数
         required_fields = ['k8s', 'start_time', 'end_time', 'limit']
@@ -115,31 +209,173 @@ async def query_k8s_events_handler(request):
             if field not in data:
                 return web.json_response({"code": 400, "message": f"缺少必填参数: {field}"})
 
+        try:
+            cursor = decode_cursor(data['cursor']) if data.get('cursor') else None
+        except (ValueError, TypeError):
+            return web.json_response({"code": 400, "message": "无效的分页游标: cursor"})
+
         # 获取ClickHouse客户端
         clickhouse_client = get_clickhouse_client()
+        limit = int(data['limit'])
 
-        # 执行查询
-        result = clickhouse_client.query_events_advanced(
-            k8s=data['k8s'],
-            start_time=data.get('start_time'),
-            end_time=data.get('end_time'),
-            limit=int(data['limit']),
-            namespace=data.get('namespace'),
-            count=data.get('count'),
-            level=data.get('level'),
-            kind=data.get('kind'),
-            name=data.get('name'),
-            reason=data.get('reason'),
-            reporting_component=data.get('reportingComponent'),
-            reporting_instance=data.get('reportingInstance'),
-            message=data.get('message'),
+        # 在线程池中执行同步的数据库查询
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: clickhouse_client.query_events_advanced(
+                limit=limit, cursor=cursor, with_uid=True, **build_query_kwargs(data)
+            ),
         )
 
-        # 序列化datetime对象
-        serialized_result = serialize_datetime_objects(result)
+        # 满页时根据最后一行生成下一页游标
+        next_cursor = None
+        if result and len(result) >= limit:
+            last_row = result[-1]
+            next_cursor = encode_cursor(last_row[EVENT_QUERY_COLUMNS.index('lastTimestamp')], last_row[-1])
 
-        return web.json_response({"success": True, "data": serialized_result, "total": len(serialized_result)})
+        # 去掉用于分页的eventUid列并序列化datetime对象
+        serialized_result = [serialize_datetime_objects(tuple(row[:-1])) for row in result]
+
+        return web.json_response(
+            {"success": True, "data": serialized_result, "total": len(serialized_result), "next_cursor": next_cursor}
+        )
 
     except Exception as e:
         logger.error(f"查询K8S事件失败: {e}")
         return web.json_response({"code": 500, "message": f"查询失败: {str(e)}"})
+
+
+async def export_k8s_events(request, data: dict, export_format: str):
+    """流式导出K8S事件（NDJSON/CSV）
+
+    ClickHouse数据块在线程中读取并放入有界队列，逐块写入HTTP响应，内存占用与结果集大小无关
+    """
+    for field in ['k8s', 'start_time', 'end_time']:
+        if field not in data:
+            return web.json_response({"code": 400, "message": f"缺少必填参数: {field}"})
+
+    limit = int(data['limit']) if data.get('limit') else None
+    query_kwargs = build_query_kwargs(data)
+    clickhouse_client = get_clickhouse_client()
+    loop = asyncio.get_running_loop()
+    blocks: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_BLOCKS)
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        """在线程中读取ClickHouse数据块，队列满时阻塞以形成背压"""
+        item = done
+        try:
+            for block in clickhouse_client.stream_events_advanced(limit=limit, **query_kwargs):
+                if cancelled.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(blocks.put(block), loop).result()
+        except Exception as e:
+            item = e
+        asyncio.run_coroutine_threadsafe(blocks.put(item), loop).result()
+
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = web.StreamResponse(
+        headers={
+            'Content-Type': f'{content_type}; charset=utf-8',
+            'Content-Disposition': f'attachment; filename="k8s_events.{export_format}"',
+        }
+    )
+    await response.prepare(request)
+
+    if export_format == 'csv':
+        await response.write(('\ufeff' + ','.join(EVENT_QUERY_COLUMNS) + '\r\n').encode('utf-8'))
+
+    producer = loop.run_in_executor(None, produce)
+    rows_written = 0
+    failed = False
+    try:
+        while True:
+            block = await blocks.get()
+            if block is done:
+                break
+            if isinstance(block, Exception):
+                logger.error(f"流式导出K8S事件失败: 已写入 {rows_written} 行, {block}")
+                failed = True
+                break
+            buffer = io.StringIO()
+            if export_format == 'csv':
+                writer = csv.writer(buffer)
+                writer.writerows(serialize_datetime_objects(list(row)) for row in block)
+            else:
+                for row in block:
+                    record = dict(zip(EVENT_QUERY_COLUMNS, serialize_datetime_objects(row)))
+                    buffer.write(json.dumps(record, ensure_ascii=False))
+                    buffer.write('\n')
+            await response.write(buffer.getvalue().encode('utf-8'))
+            rows_written += len(block)
+    except ConnectionResetError:
+        logger.warning(f"客户端断开，流式导出K8S事件中止: 已写入 {rows_written} 行")
+        return response
+    finally:
+        # 客户端断开时通知读取线程停止，并清空队列避免线程阻塞
+        cancelled.set()
+        while not producer.done():
+            try:
+                blocks.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.01)
+        await producer
+
+    if failed:
+        # 响应头已发出，无法再返回错误码；直接断开连接且不发送结束块，客户端会收到不完整的分块响应而不是看似完整的文件
+        if request.transport is not None:
+            request.transport.abort()
+        return response
+
+    await response.write_eof()
+    logger.info(f"流式导出K8S事件完成: {rows_written} 行, 格式 {export_format}")
+    return response
+
+
+async def get_k8s_events_stats(request):
+    """获取K8S事件趋势和TopN（基于预聚合表）"""
+    try:
+        k8s = request.query.get('k8s')
+        start_time_str = request.query.get('start_time')
+        end_time_str = request.query.get('end_time')
+
+        # 验证必填参数
+        if not all([k8s, start_time_str, end_time_str]):
+            return web.json_response({"code": 400, "message": "缺少必填参数: k8s, start_time, end_time"})
+
+        clickhouse_client = get_clickhouse_client()
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(
+            None,
+            lambda: clickhouse_client.query_event_stats(
+                k8s=k8s,
+                start_time=start_time_str,
+                end_time=end_time_str,
+                group_by=request.query.get('group_by', 'reason'),
+                top=int(request.query.get('top', 10)),
+                namespace=request.query.get('namespace'),
+                kind=request.query.get('kind'),
+                reason=request.query.get('reason'),
+                level=request.query.get('level'),
+            ),
+        )
+
+        return web.json_response({"success": True, "data": serialize_datetime_objects(stats)})
+
+    except ValueError as e:
+        return web.json_response({"code": 400, "message": f"参数错误: {str(e)}"})
+    except Exception as e:
+        logger.error(f"获取事件统计失败: {e}")
+        return web.json_response({"code": 500, "message": f"获取事件统计失败: {str(e)}"})
+
+
+async def get_k8s_events_alert_stats(request):
+    """获取K8S事件处理统计信息（告警、分片队列、本地暂存大小及回放速率、agent预过滤丢弃数）"""
+    try:
+        stats = get_alert_stats()
+        stats['agent_filter_stats'] = get_agent_filter_stats()
+        return web.json_response({"success": True, "data": stats})
+    except Exception as e:
+        logger.error(f"获取事件处理统计失败: {e}")
+        return web.json_response({"code": 500, "message": f"获取事件处理统计失败: {str(e)}"})
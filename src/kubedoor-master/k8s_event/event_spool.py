@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件本地磁盘暂存（spool）
+ClickHouse不可用或内存队列已满时，将事件追加写入本地分段文件，恢复后按批次限速回放
+"""
+
+import os
+import json
+import time
+import zlib
+import threading
+from typing import Dict, List, Any, Callable, Optional
+from loguru import logger
+
+
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+
+
+class EventSpool:
+    """追加写入的分段暂存文件
+
+    特性:
+    - 每条记录一行: <crc32十六进制> <JSON>，回放时校验，损坏或写了一半的记录被跳过
+    - 写满segment_bytes后切换新分段，回放完成的分段直接删除
+    - 回放进度记录在cursor文件中，进程重启后从断点继续
+    - 总大小超过max_bytes后拒绝写入并计数
+    """
+
+    def __init__(self, spool_dir: str, max_bytes: int = 1024 * 1024 * 1024, segment_bytes: int = 64 * 1024 * 1024):
+        """初始化暂存目录
+
+        Args:
+            spool_dir: 暂存目录
+            max_bytes: 暂存总大小上限（字节）
+            segment_bytes: 单个分段文件大小（字节）
+        """
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_seq = None
+        self._writer_size = 0
+
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.last_replay_rate = 0.0
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        segments = self._list_segments()
+        self._next_seq = (segments[-1] + 1) if segments else 1
+        self.total_bytes = sum(os.path.getsize(self._segment_path(seq)) for seq in segments)
+        if segments:
+            logger.warning(f"发现未回放的K8S事件暂存: {self.spool_dir} {len(segments)} 个分段 {self.total_bytes} 字节")
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.spool_dir, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self) -> List[int]:
+        return sorted(int(f[: -len(SEGMENT_SUFFIX)]) for f in os.listdir(self.spool_dir) if f.endswith(SEGMENT_SUFFIX))
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """追加一条记录
+
+        Args:
+            record: 可JSON序列化的记录
+
+        Returns:
+            bool: 是否写入成功，超过大小上限或写入异常时返回False
+        """
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        line = b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+        with self._lock:
+            if self.total_bytes + len(line) > self.max_bytes:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.error(f"K8S事件暂存已达上限 {self.max_bytes} 字节，已丢弃 {self.dropped} 条事件")
+                return False
+            try:
+                if self._writer is None or self._writer_size >= self.segment_bytes:
+                    self._rotate()
+                self._writer.write(line)
+                self._writer.flush()
+            except OSError as e:
+                self.dropped += 1
+                logger.error(f"写入K8S事件暂存失败: {e}")
+                return False
+            self._writer_size += len(line)
+            self.total_bytes += len(line)
+            self.appended += 1
+            return True
+
+    def _rotate(self) -> None:
+        """关闭当前分段并打开新分段，调用方需持有锁"""
+        if self._writer is not None:
+            self._writer.close()
+        self._writer_seq = self._next_seq
+        self._next_seq += 1
+        self._writer = open(self._segment_path(self._writer_seq), 'ab')
+        self._writer_size = 0
+
+    def _seal(self) -> None:
+        """封存当前写入中的分段，使其可以被回放，调用方需持有锁"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._writer_seq = None
+            self._writer_size = 0
+
+    def has_pending(self) -> bool:
+        """是否有待回放的记录"""
+        return self.total_bytes > 0
+
+    def _load_cursor(self) -> tuple:
+        try:
+            with open(os.path.join(self.spool_dir, CURSOR_FILE), 'r', encoding='utf-8') as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self, seq: int, offset: int) -> None:
+        cursor_path = os.path.join(self.spool_dir, CURSOR_FILE)
+        with open(f"{cursor_path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(f"{seq} {offset}")
+        os.replace(f"{cursor_path}.tmp", cursor_path)
+
+    def replay(self, sink: Callable[[List[Dict[str, Any]]], None], batch_size: int, max_rate: float) -> int:
+        """按批次回放所有已封存的分段
+
+        Args:
+            sink: 批量写入函数，抛出异常表示下游仍不可用，回放中止并保留进度；
+                  返回整数时表示只接收了批次中的前若干条，进度只前进这么多并中止回放
+            batch_size: 每批记录数
+            max_rate: 回放速率上限（条/秒），<=0表示不限速
+
+        Returns:
+            int: 本次回放的记录数
+        """
+        with self._lock:
+            self._seal()
+            segments = self._list_segments()
+
+        cursor_seq, cursor_offset = self._load_cursor()
+        started = time.monotonic()
+        replayed = 0
+
+        def emit(batch: List[Dict[str, Any]], offsets: List[int], seq: int) -> None:
+            """写入一批记录，部分接收时把进度保存到最后一条已接收的记录之后并中止回放"""
+            nonlocal replayed
+            accepted = sink(batch)
+            accepted = len(batch) if accepted is None else accepted
+            replayed += accepted
+            with self._lock:
+                self.replayed += accepted
+            if accepted < len(batch):
+                if accepted:
+                    self._save_cursor(seq, offsets[accepted - 1])
+                raise RuntimeError(f"下游只接收了 {accepted}/{len(batch)} 条记录")
+
+        for seq in segments:
+            path = self._segment_path(seq)
+            offset = cursor_offset if seq == cursor_seq else 0
+            batch: List[Dict[str, Any]] = []
+            # 每条记录结束位置的偏移，部分接收时用于保存进度
+            offsets: List[int] = []
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    record = self._decode(line)
+                    offset += len(line)
+                    if record is not None:
+                        batch.append(record)
+                        offsets.append(offset)
+                    if len(batch) >= batch_size:
+                        emit(batch, offsets, seq)
+                        self._save_cursor(seq, offset)
+                        batch, offsets = [], []
+                        self._throttle(started, replayed, max_rate)
+            if batch:
+                emit(batch, offsets, seq)
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._save_cursor(0, 0)
+            with self._lock:
+                self.total_bytes = max(0, self.total_bytes - size)
+
+        elapsed = time.monotonic() - started
+        if replayed:
+            self.last_replay_rate = replayed / max(elapsed, 0.001)
+            logger.info(f"K8S事件暂存回放完成: {replayed} 条, {self.last_replay_rate:.0f} 条/秒")
+        return replayed
+
+    def _decode(self, line: bytes) -> Optional[Dict[str, Any]]:
+        """校验并解析一行记录，损坏时返回None"""
+        try:
+            checksum, payload = line.rstrip(b'\n').split(b' ', 1)
+            if not line.endswith(b'\n') or int(checksum, 16) != zlib.crc32(payload):
+                raise ValueError('checksum mismatch')
+            return json.loads(payload)
+        except ValueError:
+            self.corrupted += 1
+            logger.warning(f"跳过损坏的K8S事件暂存记录: {line[:100]}")
+            return None
+
+    @staticmethod
+    def _throttle(started: float, replayed: int, max_rate: float) -> None:
+        """按速率上限休眠"""
+        if max_rate <= 0:
+            return
+        ahead = replayed / max_rate - (time.monotonic() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取暂存统计信息"""
+        with self._lock:
+            return {
+                'spool_bytes': self.total_bytes,
+                'spool_max_bytes': self.max_bytes,
+                'appended': self.appended,
+                'replayed': self.replayed,
+                'dropped': self.dropped,
+                'corrupted': self.corrupted,
+                'last_replay_rate': round(self.last_replay_rate, 1),
+            }
+
+
+class SpoolReplayer:
+    """后台回放线程：下游恢复后将暂存记录按批次限速写回"""
+
+    def __init__(
+        self,
+        spool: EventSpool,
+        sink: Callable[[List[Dict[str, Any]]], None],
+        batch_size: int,
+        max_rate: float,
+        interval: float = 5.0,
+    ):
+        self.spool = spool
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='k8s-event-spool-replayer', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            wait = self.interval
+            if self.spool.has_pending():
+                try:
+                    self.spool.replay(self.sink, self.batch_size, self.max_rate)
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    wait = min(self.interval * (2 ** failures), 60)
+                    logger.warning(f"K8S事件暂存回放失败，{wait}秒后重试: {e}")
+            self._stop.wait(wait)
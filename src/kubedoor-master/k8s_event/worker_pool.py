@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K8S事件多进程分片处理池
+按K8S集群名称将事件分片到固定的工作进程，每个分片内按接收顺序串行处理，
+规则匹配、JSON处理和ClickHouse写入不再与master的aiohttp事件循环争抢GIL
+"""
+
+import time
+import zlib
+import queue
+import signal
+import multiprocessing
+from typing import Dict, List, Any, Optional
+from loguru import logger
+from .event_spool import EventSpool, SpoolReplayer
+
+
+def shard_for(k8s: str, num_shards: int) -> int:
+    """计算K8S集群对应的分片编号（跨进程稳定的哈希）
+
+    Args:
+        k8s: K8S集群名称
+        num_shards: 分片数量
+
+    Returns:
+        int: 分片编号
+    """
+    return zlib.crc32((k8s or '').encode('utf-8')) % num_shards
+
+
+def message_k8s(message_data: Dict[str, Any]) -> str:
+    """获取事件消息所属的K8S集群名称，批量消息取第一条事件（同一agent发送的批次属于同一集群）"""
+    data = message_data.get('data') or {}
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    return data.get('k8s', '')
+
+
+def message_event_count(message_data: Dict[str, Any]) -> int:
+    """获取消息中包含的事件数，批量消息为批内事件数"""
+    data = message_data.get('data')
+    return len(data) if isinstance(data, list) else 1
+
+
+def _worker_main(shard_id: int, task_queue, result_queue, stats_interval: float) -> None:
+    """工作进程入口：串行处理本分片的事件，并定期上报统计信息
+
+    Args:
+        shard_id: 分片编号
+        task_queue: 本分片的任务队列
+        result_queue: 所有分片共享的统计上报队列
+        stats_interval: 统计上报间隔（秒）
+    """
+    # 由主进程负责退出流程，忽略Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from .event_processor import K8SEventProcessor
+
+    processor = K8SEventProcessor(shard_id=shard_id)
+    logger.info(f"K8S事件工作进程已启动: shard={shard_id}")
+    last_report = 0.0
+    # 批量模式下一条消息包含多条事件，消息数与事件数分别统计
+    processed_messages = 0
+    processed = 0
+
+    while True:
+        try:
+            task_type, payload = task_queue.get(timeout=stats_interval)
+        except queue.Empty:
+            task_type, payload = None, None
+
+        if task_type == 'event':
+            processed_messages += 1
+            if payload.get('type') == 'k8s_event_batch':
+                processed += processor.process_event_batch(payload)
+            else:
+                processor.process_event_message(payload)
+                processed += 1
+        elif task_type == 'reload':
+            processor.alert_processor.reload_rules()
+            last_report = 0.0
+        elif task_type == 'stop':
+            processor.alert_processor.flush_alert_marks(force=True)
+            processor.alert_processor.flush_dedup_cache()
+            result_queue.put(('stats', shard_id, processed_messages, processed, processor.get_stats()))
+            logger.info(f"K8S事件工作进程已退出: shard={shard_id}")
+            return
+
+        now = time.monotonic()
+        if now - last_report >= stats_interval:
+            result_queue.put(('stats', shard_id, processed_messages, processed, processor.get_stats()))
+            processor.alert_processor.flush_alert_marks()
+            processor.alert_processor.flush_dedup_cache()
+            last_report = now
+
+
+class EventWorkerPool:
+    """K8S事件工作进程池
+
+    特性:
+    - 按K8S集群分片，同一集群的事件始终由同一进程按顺序处理
+    - 每个分片独占一个有界队列，队列满时写入本地溢出暂存（未配置时丢弃），不阻塞WebSocket消息循环，
+      暂存的事件在队列空闲后重新投递，溢出期间的写入顺序由ReplacingMergeTree的版本列保证最终一致
+    - 工作进程异常退出时自动拉起
+    - 各分片统计信息定期上报，由主进程合并
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        queue_size: int = 10000,
+        stats_interval: float = 5.0,
+        overflow_spool: EventSpool = None,
+    ):
+        """初始化工作进程池
+
+        Args:
+            num_workers: 工作进程数量
+            queue_size: 每个分片的队列容量
+            stats_interval: 统计上报间隔（秒）
+            overflow_spool: 队列满时使用的本地暂存
+        """
+        self.overflow_spool = overflow_spool
+        self._overflow_replayer = None
+        self.num_workers = max(1, num_workers)
+        self.queue_size = queue_size
+        self.stats_interval = stats_interval
+        # 使用spawn避免fork继承事件循环和线程锁
+        self._ctx = multiprocessing.get_context('spawn')
+        self._task_queues: List[Any] = []
+        self._processes: List[Any] = []
+        self._result_queue = None
+        # {shard_id: {'processed_messages': int, 'processed': int, 'stats': dict}}
+        self._shard_stats: Dict[int, Dict[str, Any]] = {}
+        self._dropped = [0] * self.num_workers
+        # submitted/processed 按事件计数，*_messages 按websocket消息计数
+        self._submitted = [0] * self.num_workers
+        self._submitted_messages = [0] * self.num_workers
+
+    def start(self) -> None:
+        """启动所有工作进程"""
+        self._result_queue = self._ctx.Queue()
+        for shard_id in range(self.num_workers):
+            self._task_queues.append(self._ctx.Queue(maxsize=self.queue_size))
+            self._processes.append(None)
+            self._start_worker(shard_id)
+        if self.overflow_spool is not None:
+            self._overflow_replayer = SpoolReplayer(self.overflow_spool, self._resubmit, 1000, 0)
+            self._overflow_replayer.start()
+        logger.info(f"K8S事件工作进程池已启动: {self.num_workers} 个分片, 队列容量 {self.queue_size}")
+
+    def _start_worker(self, shard_id: int) -> None:
+        """启动（或重启）指定分片的工作进程"""
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(shard_id, self._task_queues[shard_id], self._result_queue, self.stats_interval),
+            name=f"k8s-event-shard-{shard_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[shard_id] = process
+
+    def submit(self, message_data: Dict[str, Any]) -> bool:
+        """提交事件到对应分片（非阻塞）
+
+        Args:
+            message_data: 事件消息数据
+
+        Returns:
+            bool: 是否成功进入分片队列
+        """
+        k8s = message_k8s(message_data)
+        shard_id = shard_for(k8s, self.num_workers)
+
+        process = self._processes[shard_id]
+        if process is not None and not process.is_alive():
+            logger.error(f"K8S事件工作进程异常退出(exitcode={process.exitcode})，重新启动: shard={shard_id}")
+            self._start_worker(shard_id)
+
+        try:
+            self._task_queues[shard_id].put_nowait(('event', message_data))
+            self._submitted_messages[shard_id] += 1
+            self._submitted[shard_id] += message_event_count(message_data)
+            return True
+        except queue.Full:
+            if self.overflow_spool is not None and self.overflow_spool.append(message_data):
+                return True
+            self._dropped[shard_id] += message_event_count(message_data)
+            logger.warning(f"K8S事件分片队列已满，丢弃事件: shard={shard_id} k8s={k8s}")
+            return False
+
+    def _resubmit(self, records: List[Dict[str, Any]]) -> int:
+        """将溢出暂存中的事件重新投递到分片队列
+
+        Returns:
+            int: 已投递的事件数，队列仍满时小于len(records)，回放进度只前进这么多，剩余的下次再投递
+        """
+        for index, message_data in enumerate(records):
+            shard_id = shard_for(message_k8s(message_data), self.num_workers)
+            try:
+                self._task_queues[shard_id].put(('event', message_data), timeout=5)
+            except queue.Full:
+                return index
+            self._submitted_messages[shard_id] += 1
+            self._submitted[shard_id] += message_event_count(message_data)
+        return len(records)
+
+    def reload_rules(self) -> None:
+        """通知所有分片重新加载告警规则"""
+        for task_queue in self._task_queues:
+            task_queue.put(('reload', None))
+
+    def _drain_results(self) -> None:
+        """读取各分片上报的最新统计信息"""
+        if self._result_queue is None:
+            return
+        while True:
+            try:
+                _, shard_id, processed_messages, processed, stats = self._result_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._shard_stats[shard_id] = {
+                'processed_messages': processed_messages,
+                'processed': processed,
+                'stats': stats,
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """合并各分片的告警统计信息
+
+        Returns:
+            Dict: 与EventAlertProcessor.get_stats结构一致的统计信息，附带分片详情
+        """
+        self._drain_results()
+
+        processor_stats: Dict[str, int] = {}
+        spool_stats: Dict[str, Any] = {}
+        notify_stats: Dict[str, int] = {}
+        aggregate_groups = 0
+        rule_stats = {}
+        for shard in self._shard_stats.values():
+            stats = shard['stats']
+            for key, value in stats.get('processor_stats', {}).items():
+                processor_stats[key] = processor_stats.get(key, 0) + value
+            aggregate_groups += stats.get('aggregate_stats', {}).get('active_groups', 0)
+            for key, value in stats.get('spool_stats', {}).items():
+                spool_stats[key] = spool_stats.get(key, 0) + value
+            for key, value in stats.get('notify_stats', {}).items():
+                notify_stats[key] = notify_stats.get(key, 0) + value
+            rule_stats = stats.get('rule_stats', rule_stats)
+
+        shards = {}
+        for shard_id in range(self.num_workers):
+            process = self._processes[shard_id] if shard_id < len(self._processes) else None
+            try:
+                queue_size = self._task_queues[shard_id].qsize()
+            except (NotImplementedError, IndexError):
+                queue_size = -1
+            shards[shard_id] = {
+                'alive': bool(process and process.is_alive()),
+                'queue_size': queue_size,
+                'submitted_messages': self._submitted_messages[shard_id],
+                'processed_messages': self._shard_stats.get(shard_id, {}).get('processed_messages', 0),
+                'submitted': self._submitted[shard_id],
+                'processed': self._shard_stats.get(shard_id, {}).get('processed', 0),
+                'dropped': self._dropped[shard_id],
+            }
+
+        return {
+            'processor_stats': processor_stats,
+            'rule_stats': rule_stats,
+            'aggregate_stats': {'active_groups': aggregate_groups},
+            'spool_stats': spool_stats,
+            'notify_stats': notify_stats,
+            'overflow_spool_stats': self.overflow_spool.get_stats() if self.overflow_spool is not None else {},
+            'alert_rate': processor_stats.get('matched_events', 0) / max(processor_stats.get('total_events', 0), 1) * 100,
+            'shards': shards,
+        }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """停止所有工作进程，等待队列中的事件处理完成"""
+        if self._overflow_replayer is not None:
+            self._overflow_replayer.stop()
+        for task_queue in self._task_queues:
+            try:
+                task_queue.put(('stop', None), timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"K8S事件工作进程未按时退出，强制终止: {process.name}")
+                process.terminate()
+        self._drain_results()
+        logger.info("K8S事件工作进程池已停止")
+
+
+# 全局工作进程池实例
+_worker_pool: Optional[EventWorkerPool] = None
+
+
+def get_worker_pool() -> Optional[EventWorkerPool]:
+    """获取全局工作进程池实例，未启用多进程时返回None"""
+    return _worker_pool
+
+
+def start_worker_pool(num_workers: int, queue_size: int, overflow_spool: EventSpool = None) -> EventWorkerPool:
+    """创建并启动全局工作进程池"""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = EventWorkerPool(num_workers, queue_size, overflow_spool=overflow_spool)
+        _worker_pool.start()
+    return _worker_pool
+
+
+def stop_worker_pool() -> None:
+    """停止全局工作进程池"""
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.stop()
+        _worker_pool = None
@@ -1,8 +1,10 @@
 import asyncio
+import copy
 import json
 import sys
 import time
 import base64
+import zlib
 import aiohttp
 from datetime import datetime, timedelta
 from aiohttp import web, WSMsgType
@@ -11,8 +13,21 @@ import utils, prom_real_time_data
 from multidict import MultiDict
 from istio_route import istio_route
 import image_tags_fetcher
-from k8s_event import process_k8s_event_async, init_clickhouse_tables
-from k8s_event.event_query_api import query_k8s_events_handler, get_k8s_events_menu_options
+from k8s_event import (
+    process_k8s_event_async,
+    process_k8s_event_batch_async,
+    init_clickhouse_tables,
+    start_event_workers,
+    stop_event_workers,
+    get_agent_filter,
+    record_agent_filter_stats,
+)
+from k8s_event.event_query_api import (
+    query_k8s_events_handler,
+    get_k8s_events_menu_options,
+    get_k8s_events_alert_stats,
+    get_k8s_events_stats,
+)
 
 logger.remove()
 
@@ -93,6 +108,21 @@ clients = {}
 pod_logs_connections = {}
 
 
+async def handle_k8s_event_batch(env, data):
+    """处理agent发送的K8S事件批量消息"""
+    events = data.get("data") or []
+    if data.get("replay"):
+        logger.info(f"💯[K8S事件回放]客户端 env={env}: {len(events)} 条，agent累计丢弃 {data.get('dropped', 0)} 条")
+    else:
+        logger.info(f"💯[K8S事件批量]客户端 env={env}: {len(events)} 条，合并 {data.get('coalesced', 0)} 条")
+    try:
+        handled = await process_k8s_event_batch_async(data)
+        if handled < len(events):
+            logger.warning(f"K8S事件批量消息部分处理失败: {handled}/{len(events)}")
+    except Exception as e:
+        logger.error(f"处理K8S事件批量消息时发生错误: {e}")
+
+
 async def websocket_handler(request):
     env = request.query.get("env")
     ver = request.query.get("ver", "unknown")
@@ -116,6 +146,12 @@ async def websocket_handler(request):
         clients[env]["last_heartbeat"] = time.time()
         clients[env]["online"] = True
 
+    # 下发K8S事件预过滤配置，agent在源头丢弃命中忽略规则的事件
+    try:
+        await ws.send_json({"type": "event_filter", "filter": get_agent_filter()})
+    except Exception as e:
+        logger.error(f"下发K8S事件预过滤配置失败，env={env}：{e}")
+
     try:
         async for msg in ws:
             if msg.type == WSMsgType.TEXT:
@@ -128,6 +164,15 @@ async def websocket_handler(request):
                         clients[env]["last_heartbeat"] = time.time()
                         clients[env]["online"] = True
                         # logger.info(f"[心跳]客户端 env={env} ver={ver}")
+                        if "event_buffer_stats" in data:
+                            clients[env]["event_buffer"] = data["event_buffer_stats"]
+                        filter_stats = data.get("event_filter_stats")
+                        if filter_stats is not None:
+                            record_agent_filter_stats(env, filter_stats)
+                            # 规则重新加载后版本变化，重新下发预过滤配置
+                            agent_filter = get_agent_filter()
+                            if filter_stats.get("version") != agent_filter["version"]:
+                                await ws.send_json({"type": "event_filter", "filter": agent_filter})
                     elif data.get("type") == "admis":
                         request_id = data["request_id"]
                         namespace = data["namespace"]
@@ -164,11 +209,14 @@ async def websocket_handler(request):
                         try:
                             success = await process_k8s_event_async(data)
                             if success:
-                                logger.debug(f"K8S事件已成功存储到ClickHouse: {data.get('data', {}).get('eventUid')}")
+                                logger.debug(f"K8S事件已提交处理: {data.get('data', {}).get('eventUid')}")
                             else:
-                                logger.warning(f"K8S事件存储失败: {data.get('data', {}).get('eventUid')}")
+                                logger.warning(f"K8S事件处理失败: {data.get('data', {}).get('eventUid')}")
                         except Exception as e:
                             logger.error(f"处理K8S事件时发生错误: {e}")
+                    elif data.get("type") == "k8s_event_batch":
+                        # 处理agent合并窗口内发送的K8S事件批量消息（同一eventUid只保留最后一次状态）
+                        await handle_k8s_event_batch(env, data)
                     else:
                         logger.info(f"收到客户端消息：{msg.data}")
 
@@ -188,6 +236,15 @@ async def websocket_handler(request):
                                     if connection_id in pod_logs_connections:
                                         del pod_logs_connections[connection_id]
 
+            elif msg.type == WSMsgType.BINARY:
+                # agent重新连接后回放离线缓冲的事件，批量消息经zlib压缩
+                try:
+                    data = json.loads(zlib.decompress(msg.data))
+                except (zlib.error, ValueError) as e:
+                    logger.error(f"无法解析客户端二进制消息，env={env}：{e}")
+                    continue
+                if data.get("type") == "k8s_event_batch":
+                    await handle_k8s_event_batch(env, data)
             elif msg.type == WSMsgType.ERROR:
                 logger.error(f"客户端连接出错，env={env}")
     except Exception as e:
@@ -404,41 +461,112 @@ async def http_handler(request):
         top_deployments = utils.get_deployment_from_control_data(deployment_list, num, type, env)
         body['top_deployments'] = top_deployments
 
-    # 向目标客户端发送消息
-    request_id = str(time.time())  # 使用时间戳作为唯一请求 ID
+    response = await send_agent_request(env, method, path, query_params, body)
+    if response is None:
+        return web.json_response({"error": "客户端未响应"}, status=504)
+
+    # 特殊处理：如果是 /api/agent/istio/vs 接口，需要对响应进行额外处理
+    if path == "/api/agent/istio/vs":
+        vs_list = response.get('data', [])
+        processed_response = await istio_route.sync_vs_from_k8s(env, vs_list)
+        return web.json_response(processed_response)
+
+    return web.json_response({"success": True, **response})
+
+
+async def send_agent_request(env, method, path, query, body, timeout=120):
+    """通过websocket向agent发送请求并等待响应
+
+    Args:
+        env: K8S集群名称
+        method: HTTP方法
+        path: agent接口路径
+        query: 查询参数
+        body: 请求体
+        timeout: 等待响应的超时时间（秒）
+
+    Returns:
+        dict: agent的响应，超时或出错时返回None
+    """
+    # 时间戳加集群名作为唯一请求 ID，多个集群并发请求时也不会重复
+    request_id = f"{time.time()}-{env}"
     message = {
         "type": "request",
         "request_id": request_id,
         "method": method,
         "path": path,
-        "query": query_params,
+        "query": query,
         "body": body,
     }
-    await clients[env]["ws"].send_json(message)  # 使用 send_json 发送 JSON 数据
-    logger.info(f"[请求]客户端 env={env}: {message}")
-
-    # 等待客户端响应
-    if "response_queue" not in clients[env]:
-        clients[env]["response_queue"] = {}
-
+    # 先创建响应队列再发送，避免响应先于队列到达被丢弃
+    response_queue = clients[env].setdefault("response_queue", {})
     try:
-        for _ in range(120 * 10):  # 等待 120 秒，检查响应队列
-            if request_id in clients[env]["response_queue"]:
-                response = clients[env]["response_queue"].pop(request_id)
-
-                # 特殊处理：如果是 /api/agent/istio/vs 接口，需要对响应进行额外处理
-                if path == "/api/agent/istio/vs":
-                    # 在这里添加你的额外处理逻辑
-                    vs_list = response.get('data', [])
-                    processed_response = await istio_route.sync_vs_from_k8s(env, vs_list)
-                    return web.json_response(processed_response)
-
-                return web.json_response({"success": True, **response})
+        await clients[env]["ws"].send_json(message)  # 使用 send_json 发送 JSON 数据
+        logger.info(f"[请求]客户端 env={env}: {message}")
+
+        # 等待客户端响应
+        for _ in range(int(timeout * 10)):
+            if request_id in response_queue:
+                return response_queue.pop(request_id)
             await asyncio.sleep(0.1)
     except Exception as e:
         logger.error(f"等待客户端响应时发生错误，env={env}, 错误：{e}")
+    return None
+
 
-    return web.json_response({"error": "客户端未响应"}, status=504)
+async def apply_vs_to_cluster(env, vs_config, force):
+    """把VirtualService应用到单个集群，返回该集群的结果和耗时"""
+    start = time.monotonic()
+    result = {"env": env}
+    if env not in clients or not clients[env]["online"]:
+        result.update(success=False, error="目标客户端不在线")
+    else:
+        query = {"env": env, "force": "true"} if force else {"env": env}
+        response = await send_agent_request(env, "POST", "/api/agent/istio/vs/apply", query, vs_config)
+        if response is None:
+            result.update(success=False, error="客户端未响应")
+        elif response.get("error"):
+            result.update(success=False, error=response["error"])
+        else:
+            result.update(success=True, operation=response.get("operation"), message=response.get("message"))
+    result["elapsed_ms"] = round((time.monotonic() - start) * 1000)
+    return result
+
+
+async def istio_vs_apply_all_handler(request):
+    """把VirtualService并发应用到所有关联的K8S集群，agent端配置未变化时跳过更新
+
+    query: vs_id，force=true时不比较实际配置直接应用
+    """
+    vs_id = request.query.get("vs_id")
+    if not vs_id or not vs_id.isdigit():
+        return web.json_response({"error": "vs_id必须是有效的整数"}, status=400)
+    vs_id = int(vs_id)
+    force = request.query.get("force") == "true"
+
+    start = time.monotonic()
+    vs_config = await istio_route.get_virtualservice_json(vs_id)
+    if not vs_config:
+        return web.json_response({"error": "VirtualService not found"}, status=404)
+    k8s_clusters = await istio_route.run_db(istio_route.get_k8s_clusters_by_vs, vs_id)
+    envs = [cluster["k8s_name"] for cluster in k8s_clusters]
+    if not envs:
+        return web.json_response({"error": "VirtualService未关联K8S集群"}, status=400)
+
+    # 每个集群一份配置，避免并发发送时共享同一个对象
+    results = await asyncio.gather(
+        *(apply_vs_to_cluster(env, copy.deepcopy(vs_config), force) for env in envs)
+    )
+    failed = [result["env"] for result in results if not result["success"]]
+    logger.info(f"VirtualService并发应用完成，vs_id: {vs_id}, 集群: {envs}, 失败: {failed}")
+    return web.json_response(
+        {
+            "success": not failed,
+            "message": f"应用到 {len(envs)} 个集群，失败 {len(failed)} 个",
+            "elapsed_ms": round((time.monotonic() - start) * 1000),
+            "data": list(results),
+        }
+    )
 
 
 async def status_handler(request):
@@ -448,6 +576,7 @@ async def status_handler(request):
             "online": data["online"],
             "last_heartbeat": datetime.fromtimestamp(data["last_heartbeat"]).strftime("%Y-%m-%d %H:%M:%S"),
             "ver": data["ver"],
+            "event_buffer": data.get("event_buffer", {}),
         }
         for env, data in clients.items()
     }
@@ -595,13 +724,23 @@ async def start_background_tasks(app):
         logger.info("ClickHouse表结构初始化成功")
     except Exception as e:
         logger.error(f"ClickHouse表结构初始化失败: {e}")
+    # 补充Istio Route旧版本数据库缺少的字段和索引，升级后无需手动执行init_database.py
+    try:
+        await istio_route.run_db(istio_route.ensure_schema)
+    except Exception as e:
+        logger.error(f"Istio Route 数据库表结构检查失败: {e}")
+    start_event_workers()
     app["heartbeat_task"] = asyncio.create_task(heartbeat_check())
 
 
 async def cleanup_background_tasks(app):
     """清理后台任务"""
+    # 停止事件处理进程并保存告警去重状态，避免重启后重复告警
+    stop_event_workers()
     app["heartbeat_task"].cancel()
     await app["heartbeat_task"]
+    # 等待进行中的数据库操作结束后关闭Istio Route连接池
+    await asyncio.get_running_loop().run_in_executor(None, istio_route.close_db_pool)
 
 
 app = web.Application()
@@ -617,6 +756,8 @@ app.router.add_post("/api/image/tags", image_tags_fetcher.get_image_tags_handler
 # 查询K8S事件相关接口
 app.router.add_post("/api/events/query", query_k8s_events_handler)  # 查询K8S事件
 app.router.add_get("/api/events/menu", get_k8s_events_menu_options)  # 获取K8S事件查询菜单选项
+app.router.add_get("/api/events/alert_stats", get_k8s_events_alert_stats)  # 获取K8S事件处理统计
+app.router.add_get("/api/events/stats", get_k8s_events_stats)  # 获取K8S事件趋势和TopN
 
 # ==========需要rw权限==========
 app.router.add_get("/api/agent_status", status_handler)  # 获取agent状态
@@ -640,10 +781,13 @@ app.router.add_delete("/api/istio/httproute", istio_route.delete_route_handler)
 
 # 路由管理辅助接口
 app.router.add_post("/api/istio/httproute/reorder", istio_route.reorder_routes_handler)
+app.router.add_post("/api/istio/httproute/move", istio_route.move_route_handler)
+app.router.add_post("/api/istio/httproute/simulate", istio_route.simulate_routes_handler)
 app.router.add_get("/api/istio/health", istio_route.health_check_handler)
 
 # K8S集群关联管理接口
 app.router.add_post("/api/istio/vs/k8s", istio_route.update_k8s_vs_handler)  # 7
+app.router.add_post("/api/istio/vs/apply_all", istio_vs_apply_all_handler)  # 并发应用到所有关联集群
 
 
 # ==================== 其它接口转发到各个agent ====================
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步IM通知服务
+send_msg只负责入队，后台线程在独立的事件循环中用共享的aiohttp连接池发送，
+同一token在合并窗口内的多条消息合并为一条，按IM的单条消息大小上限拆分，失败后退避重试
+"""
+
+import os
+import atexit
+import asyncio
+import threading
+from collections import deque
+import aiohttp
+from loguru import logger
+
+# 单条消息内容的字节上限（预留@信息的长度）
+MAX_BYTES = {'wecom': 4000, 'dingding': 18000, 'feishu': 18000, 'slack': 36000}
+SEPARATOR = '\n\n---\n\n'
+
+
+async def wecom(session, webhook, content, at=""):
+    webhook = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=' + webhook
+    params = {'msgtype': 'markdown', 'markdown': {'content': f"{content}<@{at}>"}}
+    async with session.post(webhook, json=params) as response:
+        result = await response.json(content_type=None)
+    return result, result.get('errcode', 0) == 0
+
+
+async def dingding(session, webhook, content, at=""):
+    webhook = 'https://oapi.dingtalk.com/robot/send?access_token=' + webhook
+    params = {"msgtype": "markdown", "markdown": {"title": "告警", "text": content}, "at": {"atMobiles": [at]}}
+    async with session.post(webhook, json=params) as response:
+        result = await response.json(content_type=None)
+    return result, result.get('errcode', 0) == 0
+
+
+async def feishu(session, webhook, content, at=""):
+    title = "告警通知"
+    webhook = f'https://open.feishu.cn/open-apis/bot/v2/hook/{webhook}'
+    params = {
+        "msg_type": "interactive",
+        "card": {
+            "header": {"title": {"tag": "plain_text", "content": title}, "template": "red"},
+            "elements": [
+                {
+                    "tag": "markdown",
+                    "content": f"{content}\n<at id={at}></at>",
+                }
+            ],
+        },
+    }
+    async with session.post(webhook, json=params) as response:
+        result = await response.json(content_type=None)
+    return result, result.get('code', result.get('StatusCode', 0)) == 0
+
+
+async def slack(session, webhook, content, at=""):
+    """发送Slack告警通知"""
+    # 构建完整的Slack Webhook URL
+    webhook_url = f'https://hooks.slack.com/services/{webhook}'
+
+    # 构建消息内容，如果有@用户则添加
+    message_text = content
+    if at:
+        message_text += f" <@{at}>"
+
+    async with session.post(webhook_url, json={"text": message_text}) as response:
+        # Slack成功时返回纯文本ok
+        result = await response.text()
+    return result, response.status == 200
+
+
+SENDERS = {'wecom': wecom, 'dingding': dingding, 'feishu': feishu, 'slack': slack}
+
+
+def merge_messages(messages, max_bytes):
+    """将多条消息合并，超过大小上限时拆分为多条，单条超长的消息截断
+
+    Args:
+        messages: 消息内容列表
+        max_bytes: 单条消息的字节上限
+
+    Returns:
+        list: 合并后的消息列表
+    """
+    merged = []
+    current, current_bytes = [], 0
+    sep_bytes = len(SEPARATOR.encode('utf-8'))
+    for content in messages:
+        size = len(content.encode('utf-8'))
+        if size > max_bytes:
+            content = content.encode('utf-8')[: max_bytes - 16].decode('utf-8', errors='ignore') + '...(已截断)'
+            size = len(content.encode('utf-8'))
+        if current and current_bytes + sep_bytes + size > max_bytes:
+            merged.append(SEPARATOR.join(current))
+            current, current_bytes = [], 0
+        current_bytes += size + (sep_bytes if current else 0)
+        current.append(content)
+    if current:
+        merged.append(SEPARATOR.join(current))
+    return merged
+
+
+class Notifier:
+    """后台通知发送器，可在同步和异步代码中调用enqueue，不会阻塞调用方"""
+
+    def __init__(self, msg_type, queue_size=1000, coalesce_window=2.0, retry=3, retry_backoff=2.0):
+        """初始化通知发送器并启动后台线程
+
+        Args:
+            msg_type: IM类型 wecom/dingding/feishu/slack
+            queue_size: 队列容量（消息条数），满时丢弃最早的消息
+            coalesce_window: 合并窗口（秒），窗口内同一token的消息合并发送
+            retry: 失败重试次数
+            retry_backoff: 重试退避基数（秒）
+        """
+        self.msg_type = msg_type
+        self.queue_size = queue_size
+        self.coalesce_window = coalesce_window
+        self.retry = retry
+        self.retry_backoff = retry_backoff
+        self.pid = os.getpid()
+        self.stats = {'queued': 0, 'sent': 0, 'merged': 0, 'failed': 0, 'dropped': 0}
+        self._pending = deque()
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def enqueue(self, token, content):
+        """将消息加入发送队列，线程安全
+
+        Returns:
+            bool: 是否入队成功（后台线程已退出时返回False）
+        """
+        if self._loop.is_closed():
+            return False
+        try:
+            self._loop.call_soon_threadsafe(self._put, token, content)
+        except RuntimeError:
+            return False
+        return True
+
+    def _put(self, token, content):
+        """在后台事件循环中执行的入队操作"""
+        if len(self._pending) >= self.queue_size:
+            self._pending.popleft()
+            self.stats['dropped'] += 1
+            if self.stats['dropped'] % 100 == 1:
+                logger.error(f"通知队列已满，已丢弃 {self.stats['dropped']} 条消息")
+        self._pending.append((token, content))
+        if content is not None:
+            self.stats['queued'] += 1
+        self._wakeup.set()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._sender())
+        finally:
+            self._loop.close()
+
+    async def _sender(self):
+        """等待第一条消息后再等待一个合并窗口，按token合并后依次发送"""
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                await self._wakeup.wait()
+                if self.coalesce_window > 0:
+                    await asyncio.sleep(self.coalesce_window)
+                self._wakeup.clear()
+                grouped = {}
+                while self._pending:
+                    token, content = self._pending.popleft()
+                    if content is None:
+                        for token, messages in grouped.items():
+                            await self._send_group(session, token, messages)
+                        return
+                    grouped.setdefault(token, []).append(content)
+                for token, messages in grouped.items():
+                    await self._send_group(session, token, messages)
+
+    async def _send_group(self, session, token, messages):
+        merged = merge_messages(messages, MAX_BYTES.get(self.msg_type, 4000))
+        self.stats['merged'] += len(messages) - len(merged)
+        for content in merged:
+            await self._send(session, token, content)
+
+    async def _send(self, session, token, content):
+        """发送一条消息，失败后指数退避重试"""
+        sender = SENDERS.get(self.msg_type)
+        if sender is None:
+            logger.warning(f"不支持的消息类型：{self.msg_type}")
+            return
+        for attempt in range(self.retry + 1):
+            try:
+                result, ok = await sender(session, token, content)
+                logger.info(f'【{self.msg_type}】{result}')
+                if ok:
+                    self.stats['sent'] += 1
+                    return
+            except Exception as e:
+                logger.error(f"【{self.msg_type}】发送通知失败(第{attempt + 1}次): {e}")
+            if attempt < self.retry:
+                await asyncio.sleep(self.retry_backoff * 2**attempt)
+        self.stats['failed'] += 1
+        logger.error(f"【{self.msg_type}】通知重试{self.retry}次后仍失败，放弃发送")
+
+    def close(self, timeout=10):
+        """发送队列中剩余的消息后停止后台线程"""
+        if self.enqueue(None, None):
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        return dict(self.stats, pending=len(self._pending))
+
+
+_notifier = None
+_lock = threading.Lock()
+
+
+def get_notifier(msg_type, **kwargs):
+    """获取当前进程的通知发送器，fork出的子进程会重新创建
+
+    Args:
+        msg_type: IM类型
+        **kwargs: Notifier的其他初始化参数
+
+    Returns:
+        Notifier: 通知发送器
+    """
+    global _notifier
+    with _lock:
+        if _notifier is None or _notifier.pid != os.getpid():
+            _notifier = Notifier(msg_type, **kwargs)
+            atexit.register(_notifier.close)
+        return _notifier
+
+
+def get_stats():
+    """获取当前进程通知发送器的统计信息，尚未创建时返回空字典"""
+    with _lock:
+        if _notifier is None or _notifier.pid != os.getpid():
+            return {}
+        return _notifier.get_stats()
+
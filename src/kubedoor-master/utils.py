@@ -8,6 +8,7 @@ from clickhouse_driver import Client
 from clickhouse_driver.errors import ServerException
 from functools import wraps
 from loguru import logger
+import notifier
 from promql import query_dict, node_rank_query
 
 
@@ -27,9 +28,25 @@ CK_PORT = os.environ.get('CK_PORT')
 CK_USER = os.environ.get('CK_USER')
 MSG_TOKEN = os.environ.get('MSG_TOKEN')
 MSG_TYPE = os.environ.get('MSG_TYPE')
+# IM通知队列容量（条）、合并窗口（秒）及失败重试次数
+NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', '1000'))
+NOTIFY_COALESCE_WINDOW = float(os.environ.get('NOTIFY_COALESCE_WINDOW', '2'))
+NOTIFY_RETRY = int(os.environ.get('NOTIFY_RETRY', '3'))
 PROM_K8S_TAG_KEY = os.environ.get('PROM_K8S_TAG_KEY')
 # 告警去重时间窗口（秒），默认300秒
 ALERT_DEDUP_WINDOW = int(os.environ.get('ALERT_DEDUP_WINDOW', '300'))
+# 告警去重缓存最大条数、去重键模式（eventUid/rule_object）、持久化文件（为空则不持久化）
+ALERT_DEDUP_MAX_ENTRIES = int(os.environ.get('ALERT_DEDUP_MAX_ENTRIES', '10000'))
+ALERT_DEDUP_KEY = os.environ.get('ALERT_DEDUP_KEY', 'eventUid')
+ALERT_DEDUP_PERSIST_FILE = os.environ.get('ALERT_DEDUP_PERSIST_FILE', '')
+# K8S事件处理进程数（按集群分片，0表示在master进程内处理）及每个分片的队列容量
+EVENT_WORKERS = int(os.environ.get('EVENT_WORKERS', '2'))
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '10000'))
+# ClickHouse不可用或队列满时的K8S事件本地暂存目录（为空则不暂存）、大小上限(MB)、回放批次大小及速率上限(条/秒)
+EVENT_SPOOL_DIR = os.environ.get('EVENT_SPOOL_DIR', '/tmp/kubedoor/event-spool')
+EVENT_SPOOL_MAX_MB = int(os.environ.get('EVENT_SPOOL_MAX_MB', '1024'))
+EVENT_SPOOL_BATCH_SIZE = int(os.environ.get('EVENT_SPOOL_BATCH_SIZE', '5000'))
+EVENT_SPOOL_REPLAY_RATE = int(os.environ.get('EVENT_SPOOL_REPLAY_RATE', '2000'))
 PROM_TYPE = os.environ.get('PROM_TYPE')
 PROM_URL = os.environ.get('PROM_URL')
 UPDATE_IMAGE = os.environ.get('UPDATE_IMAGE')
@@ -40,6 +57,12 @@ DB_PORT = int(os.environ.get('DB_PORT', '3306'))
 DB_USER = os.environ.get('DB_USER', 'root')
 DB_PASSWORD = os.environ.get('DB_PASSWORD', '123456')
 DB_NAME = os.environ.get('DB_NAME', 'istio_route')
+# Istio Route 数据库连接池：最小/最大连接数、连接最长使用时间（秒）
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '3600'))
+# 渲染后的VirtualService JSON缓存有效期（秒），CRUD操作会主动失效
+VS_JSON_CACHE_TTL = int(os.environ.get('VS_JSON_CACHE_TTL', '600'))
 
 
 ckclient = Client(
@@ -411,82 +434,23 @@ def get_deploy_admis(env, namespace, deployment):
 
 
 def send_msg(content, msgToken=None):
-    response = ""
-    token = msgToken if msgToken is not None else MSG_TOKEN
-    if MSG_TYPE == "wecom":
-        response = wecom(token, content)
-    elif MSG_TYPE == "dingding":
-        response = dingding(token, content)
-    elif MSG_TYPE == "feishu":
-        response = feishu(token, content)
-    elif MSG_TYPE == "slack":
-        response = slack(token, content)
-    return f'【{MSG_TYPE}】{response}'
-
-
-def wecom(webhook, content, at=""):
-    webhook = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {'msgtype': 'markdown', 'markdown': {'content': f"{content}<@{at}>"}}
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    logger.info(f'【wecom】{response.json()}')
-    return response.json()
-
-
-def dingding(webhook, content, at=""):
-    webhook = 'https://oapi.dingtalk.com/robot/send?access_token=' + webhook
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "msgtype": "markdown",
-        "markdown": {"title": "告警", "text": content},
-        "at": {"atMobiles": [at]},
-    }
-    data = bytes(json.dumps(params), 'utf-8')
-    response = requests.post(webhook, headers=headers, data=data)
-    logger.info(f'【dingding】{response.json()}')
-    return response.json()
-
-
-def feishu(webhook, content, at=""):
-    title = "告警通知"
-    webhook = f'https://open.feishu.cn/open-apis/bot/v2/hook/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-    params = {
-        "msg_type": "interactive",
-        "card": {
-            "header": {"title": {"tag": "plain_text", "content": title}, "template": "red"},
-            "elements": [
-                {
-                    "tag": "markdown",
-                    "content": f"{content}\n<at id={at}></at>",
-                }
-            ],
-        },
-    }
-    data = json.dumps(params)
-    response = requests.post(webhook, headers=headers, data=data)
-    logger.info(f'【feishu】{response.json()}')
-    return response.json()
-
-
-def slack(webhook, content, at=""):
-    """发送Slack告警通知"""
-    # 构建完整的Slack Webhook URL
-    webhook_url = f'https://hooks.slack.com/services/{webhook}'
-    headers = {'Content-Type': 'application/json'}
-
-    # 构建消息内容，如果有@用户则添加
-    message_text = content
-    if at:
-        message_text += f" <@{at}>"
-
-    params = {"text": message_text}
-
-    data = json.dumps(params)
-    response = requests.post(webhook_url, headers=headers, data=data)
-    logger.info(f'【slack】{response.json()}')
-    return response.json()
+    """将消息加入异步通知队列，由后台线程合并后发送，调用方不再等待IM接口"""
+    if MSG_TYPE not in notifier.SENDERS:
+        logger.warning(f"不支持的消息类型：{MSG_TYPE}")
+        return f"不支持的消息类型：{MSG_TYPE}"
+    if not get_notifier().enqueue(msgToken if msgToken is not None else MSG_TOKEN, content):
+        return f'【{MSG_TYPE}】通知服务已停止'
+    return f'【{MSG_TYPE}】已加入发送队列'
+
+
+def get_notifier():
+    """获取当前进程的通知发送器"""
+    return notifier.get_notifier(
+        MSG_TYPE,
+        queue_size=NOTIFY_QUEUE_SIZE,
+        coalesce_window=NOTIFY_COALESCE_WINDOW,
+        retry=NOTIFY_RETRY,
+    )
 
 
 def get_list_from_resources(env_value):
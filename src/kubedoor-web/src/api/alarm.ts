@@ -64,6 +64,8 @@ export const getAlarmTotal = (env?: string, startTime?: string) => {
     conditions.push(`env = '${env}'`);
   }
   if (startTime) {
+    // day为状态表的排序键，条件可下推，避免聚合全部历史
+    conditions.push(`day >= toDate('${startTime}')`);
     conditions.push(`start_time >= '${startTime}'`);
   }
 
@@ -120,6 +122,8 @@ export const getAlarmDetail = ({
     conditions.push(`severity IN ('${severity.join("','")}')`);
   }
   if (startTime) {
+    // day为状态表的排序键，条件可下推，避免聚合全部历史
+    conditions.push(`day >= toDate('${startTime}')`);
     conditions.push(`start_time >= '${startTime}'`);
   }
 
@@ -172,6 +176,8 @@ export const getAlarmDetailTotal = ({
     conditions.push(`severity IN ('${severity.join("','")}')`);
   }
   if (startTime) {
+    // day为状态表的排序键，条件可下推，避免聚合全部历史
+    conditions.push(`day >= toDate('${startTime}')`);
     conditions.push(`start_time >= '${startTime}'`);
   }
 
@@ -257,17 +263,15 @@ interface UpdateOperateParams {
   start_time: string;
 }
 
-// 修改operate状态
+// 修改operate状态（追加一行处理状态变更，由物化视图聚合）
 export const updateOperate = (params: UpdateOperateParams) => {
   return http.request<ResultTable>("post", "/api/sql", {
     params: {
       add_http_cors_header: 1,
       default_format: "JSONCompact"
     },
-    data: `ALTER TABLE __KUBEDOORDB__.k8s_pod_alert_days 
-           UPDATE operate = '${params.operate}'
-           WHERE start_time = '${params.start_time}'
-           AND fingerprint = '${params.fingerprint}'`,
+    data: `INSERT INTO __KUBEDOORDB__.k8s_pod_alert_events (fingerprint, start_time, operate)
+           VALUES ('${params.fingerprint}', '${params.start_time}', '${params.operate}')`,
     headers: {
       "Content-Type": "text/plain;charset=UTF-8"
     }